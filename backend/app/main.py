@@ -1,12 +1,56 @@
-from fastapi import FastAPI
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+
+from app.routers import admin, ingest, documents, search, ask, metrics
+from app.services.document_service import document_service
+from app.utils.process_pool import shutdown_process_pool
+from app.utils.query_executor import shutdown_query_executor
+
+# Segundos que un request espera a que termine la carga del índice antes de responder 503.
+INDEX_READY_TIMEOUT = float(os.getenv("INDEX_READY_TIMEOUT", "30"))
+# Cada cuánto se revisa, mientras tanto, si la carga terminó.
+INDEX_READY_POLL = 0.05
 
-from app.routers import ingest, search, ask
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El índice se carga en un hilo: el proceso ya acepta conexiones y
+    # responde ``/health`` mientras tanto; ``/ready`` avisa cuándo terminó.
+    document_service.load_in_background()
+    yield
+    shutdown_process_pool()
+    shutdown_query_executor()
+
+async def require_index_ready():
+    """
+    Espera, sin bloquear el event loop ni ocupar un hilo, a que el índice
+    esté cargado. Si la aplicación arrancó sin lifespan (por ejemplo, en
+    tests) la carga empieza acá, una sola vez: los requests que llegan
+    mientras tanto esperan la misma carga.
+    """
+    if document_service.ready.is_set():
+        return
+    document_service.load_in_background()
+    deadline = time.monotonic() + INDEX_READY_TIMEOUT
+    while not document_service.ready.is_set():
+        if time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=503,
+                detail="El índice todavía se está cargando. Intente nuevamente en unos segundos",
+                headers={"Retry-After": "5"}
+            )
+        await asyncio.sleep(INDEX_READY_POLL)
 
 app = FastAPI(
     title="Mini Asistente Q&A",
     description="Sistema de búsqueda y respuesta sobre documentos",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -17,9 +61,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(ingest.router, prefix="/api", tags=["Ingest"])
-app.include_router(search.router, prefix="/api", tags=["Search"])
-app.include_router(ask.router, prefix="/api", tags=["Ask"])
+index_ready = [Depends(require_index_ready)]
+app.include_router(ingest.router, prefix="/api", tags=["Ingest"], dependencies=index_ready)
+app.include_router(documents.router, prefix="/api", tags=["Documents"], dependencies=index_ready)
+app.include_router(search.router, prefix="/api", tags=["Search"], dependencies=index_ready)
+app.include_router(ask.router, prefix="/api", tags=["Ask"], dependencies=index_ready)
+app.include_router(admin.router, prefix="/api", tags=["Admin"])
+app.include_router(metrics.router, tags=["Metrics"])
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    # Se etiqueta con la plantilla de la ruta (``/api/documents/{filename}``)
+    # y no con la URL, para no crear una serie por cada valor.
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get('route')
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - start, request.method, route.path if route else "unmatched", str(status)
+        )
 
 @app.get("/")
 async def root():
@@ -27,11 +91,23 @@ async def root():
         "message": "Bienvenido al Mini Asistente Q&A",
         "endpoints": {
             "ingest": "/api/ingest",
+            "documents": "/api/documents",
             "search": "/api/search?q=consulta",
-            "ask": "/api/ask"
+            "ask": "/api/ask",
+            "metrics": "/metrics",
+            "health": "/health",
+            "ready": "/ready"
         }
     }
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    """Liveness: el proceso responde, aunque el índice todavía se esté cargando."""
+    return {"status": "healthy"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 cuando el índice está cargado y se pueden atender consultas; 503 mientras tanto."""
+    if not document_service.ready.is_set():
+        return JSONResponse(status_code=503, content={"status": "loading"})
+    return {"status": "ready", "load_seconds": round(document_service.load_seconds, 3)}
@@ -1,5 +1,11 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Annotated, Dict, List, Literal, Optional
+
+MAX_BATCH_SIZE = 500
+MAX_QUERY_TIMEOUT = 60.0
+
+TIMEOUT_DESCRIPTION = "Tiempo máximo en segundos; por defecto el del servidor"
+FUZZY_DESCRIPTION = "Busca los términos que no están en el índice como los parecidos que sí están (sin tildes o a una letra)"
 
 class FileUploadResponse(BaseModel):
     message: str
@@ -10,24 +16,77 @@ class SearchResult(BaseModel):
     text: str = Field(description="Fragmento de texto encontrado")
     document_name: str = Field(description="Nombre del documento")
     relevance_score: float = Field(description="Puntaje de relevancia")
+    other_documents: List[str] = Field(default_factory=list, description="Otros documentos con el mismo fragmento")
 
 class SearchResponse(BaseModel):
     query: str
     results: List[SearchResult]
     total_results: int
+    timed_out: bool = Field(default=False, description="La búsqueda se cortó por timeout y no tiene resultados")
+
+class SearchBatchRequest(BaseModel):
+    queries: List[Annotated[str, Field(min_length=1, max_length=200)]] = Field(
+        min_length=1, max_length=MAX_BATCH_SIZE, description="Consultas a buscar"
+    )
+    top_k: int = Field(default=5, ge=1, le=50, description="Cantidad máxima de fragmentos por consulta")
+    min_score: float = Field(default=0.25, ge=0, description="Puntaje mínimo de relevancia")
+    timeout: Optional[float] = Field(default=None, gt=0, le=MAX_QUERY_TIMEOUT, description=TIMEOUT_DESCRIPTION)
+    fuzzy: bool = Field(default=True, description=FUZZY_DESCRIPTION)
+
+class SearchBatchResponse(BaseModel):
+    results: List[SearchResponse]
 
 class AskRequest(BaseModel):
     question: str = Field(min_length=1, max_length=500)
+    top_k: int = Field(default=5, ge=1, le=50, description="Cantidad de fragmentos a considerar")
+    min_score: float = Field(default=0.15, ge=0, description="Puntaje mínimo de relevancia")
+    timeout: Optional[float] = Field(default=None, gt=0, le=MAX_QUERY_TIMEOUT, description=TIMEOUT_DESCRIPTION)
+    fuzzy: bool = Field(default=True, description=FUZZY_DESCRIPTION)
+
+class AskBatchRequest(BaseModel):
+    questions: List[Annotated[str, Field(min_length=1, max_length=500)]] = Field(
+        min_length=1, max_length=MAX_BATCH_SIZE, description="Preguntas a responder"
+    )
+    top_k: int = Field(default=5, ge=1, le=50, description="Cantidad de fragmentos a considerar")
+    min_score: float = Field(default=0.15, ge=0, description="Puntaje mínimo de relevancia")
+    timeout: Optional[float] = Field(default=None, gt=0, le=MAX_QUERY_TIMEOUT, description=TIMEOUT_DESCRIPTION)
+    fuzzy: bool = Field(default=True, description=FUZZY_DESCRIPTION)
 
 class Citation(BaseModel):
     text: str
     document_name: str
+    other_documents: List[str] = Field(default_factory=list, description="Otros documentos con el mismo fragmento")
 
 class AskResponse(BaseModel):
     question: str
     answer: str
     citations: List[Citation]
+    timed_out: bool = Field(default=False, description="La pregunta se cortó por timeout y no tiene respuesta")
+
+class AskBatchResponse(BaseModel):
+    answers: List[AskResponse]
 
 class ErrorResponse(BaseModel):
     error: str
-    detail: Optional[str] = None
\ No newline at end of file
+    detail: Optional[str] = None
+
+class DocumentOperationResponse(BaseModel):
+    message: str
+    document_name: str
+    documents_count: int
+
+class SlowQuerySettingsRequest(BaseModel):
+    threshold_seconds: Optional[float] = Field(
+        default=None, ge=0, description="Umbral de consulta lenta en segundos; null desactiva el registro"
+    )
+    profile: Optional[Literal['off', 'cprofile', 'sampling']] = Field(
+        default=None, description="Perfil que se guarda de cada consulta lenta"
+    )
+    max_profiles: Optional[int] = Field(default=None, ge=0, description="Perfiles que se conservan en disco")
+
+class SlowQueryStatusResponse(BaseModel):
+    threshold_seconds: Optional[float]
+    profile: str
+    max_profiles: int
+    profiles: List[str] = Field(description="Perfiles guardados, del más viejo al más nuevo")
+    recent: List[Dict] = Field(description="Últimas consultas lentas de este worker")
@@ -0,0 +1,69 @@
+import os
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from app.models.schemas import SlowQuerySettingsRequest, SlowQueryStatusResponse
+from app.services.document_service import document_service
+
+router = APIRouter()
+
+def require_admin_token(x_admin_token: Optional[str] = Header(default=None)):
+    # Sin ``ADMIN_TOKEN`` configurado los endpoints de administración quedan
+    # cerrados: activar perfiles en producción no puede estar abierto a todos.
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(
+            status_code=403,
+            detail="Administración deshabilitada. Configure ADMIN_TOKEN para habilitarla"
+        )
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=401, detail="Token de administración inválido")
+
+def build_status() -> SlowQueryStatusResponse:
+    log = document_service.slow_query_log
+    settings = log.current_settings()
+    return SlowQueryStatusResponse(
+        threshold_seconds=settings.threshold,
+        profile=settings.profile,
+        max_profiles=settings.max_profiles,
+        profiles=log.profiles(),
+        recent=list(log.recent)
+    )
+
+@router.get("/admin/slow-queries", response_model=SlowQueryStatusResponse,
+            dependencies=[Depends(require_admin_token)])
+async def get_slow_queries():
+    """
+    Configuración del registro de consultas lentas, perfiles guardados y
+    últimas consultas lentas registradas por este worker.
+    """
+    return build_status()
+
+@router.put("/admin/slow-queries", response_model=SlowQueryStatusResponse,
+            dependencies=[Depends(require_admin_token)])
+async def update_slow_queries(request: SlowQuerySettingsRequest):
+    """
+    Cambia en caliente el umbral de consulta lenta y el perfil que se guarda
+    de cada una. Solo se modifican los campos enviados; ``threshold_seconds``
+    en null desactiva el registro. El cambio llega a todos los workers.
+    """
+    changes = {
+        key: value for key, value in request.model_dump(exclude_unset=True).items()
+        if value is not None or key == 'threshold_seconds'
+    }
+    if 'threshold_seconds' in changes:
+        changes['threshold'] = changes.pop('threshold_seconds')
+    try:
+        document_service.slow_query_log.update(**changes)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"No se pudo cambiar la configuración: {e}")
+    return build_status()
+
+@router.delete("/admin/slow-queries", response_model=SlowQueryStatusResponse,
+               dependencies=[Depends(require_admin_token)])
+async def reset_slow_queries():
+    """Vuelve a la configuración de las variables de entorno en todos los workers."""
+    document_service.slow_query_log.reset()
+    return build_status()
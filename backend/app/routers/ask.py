@@ -1,33 +1,39 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
 from fastapi import APIRouter, HTTPException
 
-from app.models.schemas import AskRequest, AskResponse, Citation, ErrorResponse
+from app.models.schemas import AskBatchRequest, AskBatchResponse, AskRequest, AskResponse, Citation, ErrorResponse
 from app.services.document_service import document_service
 
 router = APIRouter()
 
-@router.post("/ask", response_model=AskResponse)
-async def ask_question(request: AskRequest):
-    """
-    Responde una pregunta basándose en los documentos indexados.
-    
-    Busca información relevante en los documentos y genera una respuesta
-    de 3-4 líneas con citas de respaldo. Si no encuentra información
-    relevante, lo indica claramente.
-    """
-    if document_service.get_document_count() == 0:
+async def ensure_documents_indexed():
+    # Contar los documentos puede recargar el índice si otro worker publicó
+    # una generación nueva: se hace fuera del event loop.
+    if await asyncio.to_thread(document_service.get_document_count) == 0:
         raise HTTPException(
             status_code=404,
             detail="No hay documentos indexados. Por favor, use /ingest primero para cargar documentos"
         )
-    
-    answer, citations_data = document_service.answer_question(request.question)
-    
+
+def build_ask_response(question: str, result: Optional[Tuple[str, List[Dict]]]) -> AskResponse:
+    if result is None:
+        return AskResponse(
+            question=question,
+            answer="La pregunta tardó demasiado en procesarse. Por favor, intenta nuevamente o con una pregunta más específica.",
+            citations=[],
+            timed_out=True
+        )
+
+    answer, citations_data = result
     citations = []
     for citation in citations_data:
         citations.append(
             Citation(
                 text=citation['text'],
-                document_name=citation['document_name']
+                document_name=citation['document_name'],
+                other_documents=citation['other_documents']
             )
         )
     
@@ -35,7 +41,44 @@ async def ask_question(request: AskRequest):
         answer = "No encuentro esa información en los documentos cargados. Por favor, verifica que los documentos contengan información sobre tu pregunta."
     
     return AskResponse(
-        question=request.question,
+        question=question,
         answer=answer,
         citations=citations
-    )
\ No newline at end of file
+    )
+
+@router.post("/ask", response_model=AskResponse)
+async def ask_question(request: AskRequest):
+    """
+    Responde una pregunta basándose en los documentos indexados.
+    
+    Busca información relevante en los documentos y genera una respuesta
+    de 3-4 líneas con citas de respaldo. Si no encuentra información
+    relevante, lo indica claramente. Los términos que no están en el
+    índice se buscan como los parecidos que sí están, salvo con ``fuzzy`` en falso.
+    """
+    await ensure_documents_indexed()
+    
+    result = await document_service.answer_question_async(
+        request.question, top_k=request.top_k, min_score=request.min_score, timeout=request.timeout,
+        fuzzy=request.fuzzy
+    )
+    return build_ask_response(request.question, result)
+
+@router.post("/ask/batch", response_model=AskBatchResponse)
+async def ask_questions_batch(request: AskBatchRequest):
+    """
+    Responde varias preguntas en una sola llamada.
+    
+    Las preguntas se puntúan juntas en una sola pasada sobre el índice; las
+    respuestas se devuelven en el mismo orden que las preguntas. Si vence
+    el timeout se devuelven las ya resueltas y el resto queda marcado con
+    ``timed_out``.
+    """
+    await ensure_documents_indexed()
+    
+    answers = await document_service.answer_batch_async(
+        request.questions, request.top_k, request.min_score, request.timeout, request.fuzzy
+    )
+    return AskBatchResponse(
+        answers=[build_ask_response(question, result) for question, result in zip(request.questions, answers)]
+    )
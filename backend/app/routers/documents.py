@@ -0,0 +1,115 @@
+import asyncio
+import os
+from fastapi import APIRouter, UploadFile, File, HTTPException
+
+from app.models.schemas import DocumentOperationResponse
+from app.services.document_service import document_service
+from app.utils.file_utils import FileTooLargeError, extract_text_from_path, spool_upload_with_digest, validate_file
+from app.utils.metrics import collect_spans, record_spans
+from app.utils.process_pool import run_in_process_pool
+from app.utils.text_utils import PreparedDocument, prepare_document
+
+router = APIRouter()
+
+async def read_document(file: UploadFile) -> PreparedDocument:
+    """
+    Copia, extrae y procesa el archivo subido. Si ya se procesó un archivo
+    con el mismo contenido, el documento sale de la caché sin extraerlo.
+    """
+    if not validate_file(file):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Archivo con formato no válido: {file.filename}. Solo se aceptan .txt y .pdf"
+        )
+
+    try:
+        path, digest = await spool_upload_with_digest(file)
+    except FileTooLargeError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Archivo muy grande (máx. 10MB): {file.filename}"
+        )
+    try:
+        prepared = await asyncio.to_thread(document_service.cached_document, digest, file.filename)
+        if prepared is not None:
+            return prepared
+        text = await extract_text_from_path(path, file.filename)
+    finally:
+        os.remove(path)
+    if not text or len(text.strip()) < 10:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{file.filename}: Archivo vacío o muy corto (menos de 10 caracteres)"
+        )
+    prepared = await prepare_in_pool(text)
+    await asyncio.to_thread(document_service.cache_document, digest, file.filename, prepared)
+    return prepared
+
+async def prepare_in_pool(text: str) -> PreparedDocument:
+    prepared, spans = await run_in_process_pool(collect_spans, prepare_document, text, tokenizer=document_service.tokenizer)
+    record_spans(spans)
+    return prepared
+
+@router.post("/documents", response_model=DocumentOperationResponse, status_code=201)
+async def add_document(
+    file: UploadFile = File(description="Archivo .txt o .pdf para agregar al índice")
+):
+    """
+    Agrega un documento al índice existente sin reconstruirlo.
+    
+    Solo se indexa el archivo recibido; los documentos ya cargados se
+    mantienen. Si ya existe un documento con el mismo nombre, use PUT
+    para reemplazarlo.
+    """
+    prepared = await read_document(file)
+    
+    try:
+        await asyncio.to_thread(document_service.insert_document, file.filename, prepared.text, prepared)
+    except ValueError:
+        raise HTTPException(
+            status_code=409,
+            detail=f"El documento {file.filename} ya está indexado. Use PUT /api/documents para reemplazarlo"
+        )
+    
+    return DocumentOperationResponse(
+        message=f"Documento {file.filename} agregado",
+        document_name=file.filename,
+        documents_count=await asyncio.to_thread(document_service.get_document_count)
+    )
+
+@router.put("/documents", response_model=DocumentOperationResponse)
+async def replace_document(
+    file: UploadFile = File(description="Archivo .txt o .pdf que reemplaza al documento del mismo nombre")
+):
+    """
+    Reemplaza el documento con el mismo nombre de archivo, o lo agrega si
+    todavía no estaba indexado.
+    """
+    prepared = await read_document(file)
+    replaced = await asyncio.to_thread(document_service.replace_document, file.filename, prepared.text, prepared)
+    
+    return DocumentOperationResponse(
+        message=f"Documento {file.filename} {'reemplazado' if replaced else 'agregado'}",
+        document_name=file.filename,
+        documents_count=await asyncio.to_thread(document_service.get_document_count)
+    )
+
+@router.delete("/documents/{filename}", response_model=DocumentOperationResponse)
+async def delete_document(filename: str):
+    """
+    Quita un documento del índice. Sus chunks dejan de aparecer en las
+    búsquedas de inmediato y el espacio se recupera en la próxima compactación.
+    """
+    try:
+        await asyncio.to_thread(document_service.delete_document, filename)
+    except KeyError:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No existe el documento {filename} en el índice"
+        )
+    
+    return DocumentOperationResponse(
+        message=f"Documento {filename} eliminado",
+        document_name=filename,
+        documents_count=await asyncio.to_thread(document_service.get_document_count)
+    )
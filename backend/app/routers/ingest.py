@@ -1,9 +1,14 @@
+import asyncio
+import os
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
+from typing import List, Tuple
 
 from app.models.schemas import FileUploadResponse, ErrorResponse
 from app.services.document_service import document_service
-from app.utils.file_utils import extract_text_from_file, validate_file
+from app.utils.file_utils import FileTooLargeError, extract_text_from_path, spool_upload_with_digest, validate_file
+from app.utils.metrics import collect_spans, record_spans
+from app.utils.process_pool import run_in_process_pool
+from app.utils.text_utils import prepare_document
 
 router = APIRouter()
 
@@ -42,33 +47,88 @@ async def ingest_documents(
         status_code=400,
         detail=f"Archivos con formato no válido: {', '.join(invalid_files)}. Solo se aceptan .txt y .pdf")
 
-    if oversized_files:
-        raise HTTPException(
-        status_code=400,
-        detail=f"Archivos muy grandes (máx. 10MB): {', '.join(oversized_files)}")
+    # Cada archivo se copia a disco por bloques: el límite de tamaño se aplica
+    # mientras llega el contenido y nunca se tiene el archivo entero en memoria.
+    spooled_files = []
+    try:
+        for file in files:
+            try:
+                spooled_files.append((file.filename, *await spool_upload_with_digest(file)))
+            except FileTooLargeError:
+                oversized_files.append(file.filename)
 
-    if content_errors:
-        raise HTTPException(
-        status_code=400,
-        detail=f"Archivos con contenido inválido o corruptos: {', '.join(content_errors)}")
-    
-    document_service.clear_index()
+        if oversized_files:
+            raise HTTPException(
+            status_code=400,
+            detail=f"Archivos muy grandes (máx. 10MB): {', '.join(oversized_files)}")
+
+        if content_errors:
+            raise HTTPException(
+            status_code=400,
+            detail=f"Archivos con contenido inválido o corruptos: {', '.join(content_errors)}")
+
+        return await index_spooled_files(spooled_files, len(files))
+    finally:
+        for _, path, _ in spooled_files:
+            os.remove(path)
+
+async def index_spooled_files(spooled_files: List[Tuple[str, str, str]], total_files: int) -> FileUploadResponse:
     processed_files = []
     errors = []
     
-    for file in files:
-        try:
-            text = await extract_text_from_file(file)
-            
-            if not text or len(text.strip()) < 10:
-                errors.append(f"{file.filename}: Archivo vacío o muy corto (menos de 10 caracteres)")
-                continue
-            
-            document_service.add_document(file.filename, text)
-            processed_files.append(file.filename)
-            
-        except Exception as e:
-            errors.append(f"{file.filename}: Error al procesar - {str(e)}")
+    # Un archivo con el mismo contenido que otro ya procesado (por su
+    # SHA-256) sale de la caché de documentos sin extraerlo ni tokenizarlo.
+    cached_documents = await asyncio.gather(*(
+        asyncio.to_thread(document_service.cached_document, digest, filename)
+        for filename, _, digest in spooled_files
+    ))
+    missing_files = [
+        spooled for spooled, cached in zip(spooled_files, cached_documents) if cached is None
+    ]
+    
+    # La extracción, limpieza, división y tokenización corren en el pool de
+    # procesos para todos los archivos a la vez; gather devuelve los
+    # resultados en el orden de entrada, así el índice queda determinista.
+    texts = await asyncio.gather(
+        *(extract_text_from_path(path, filename) for filename, path, _ in missing_files),
+        return_exceptions=True
+    )
+    
+    valid_files = []
+    for (filename, _, digest), text in zip(missing_files, texts):
+        if isinstance(text, Exception):
+            errors.append(f"{filename}: Error al procesar - {str(text)}")
+        elif not text or len(text.strip()) < 10:
+            errors.append(f"{filename}: Archivo vacío o muy corto (menos de 10 caracteres)")
+        else:
+            valid_files.append((filename, digest, text))
+    
+    # Las etapas medidas dentro del pool vuelven con cada resultado y se
+    # registran aquí, en el proceso que expone ``/metrics``.
+    prepared_documents = await asyncio.gather(
+        *(
+            run_in_process_pool(collect_spans, prepare_document, text, tokenizer=document_service.tokenizer)
+            for _, _, text in valid_files
+        ),
+        return_exceptions=True
+    )
+    
+    prepared_by_name = {}
+    for (filename, digest, _), prepared in zip(valid_files, prepared_documents):
+        if isinstance(prepared, Exception):
+            errors.append(f"{filename}: Error al procesar - {str(prepared)}")
+            continue
+        prepared, spans = prepared
+        record_spans(spans)
+        await asyncio.to_thread(document_service.cache_document, digest, filename, prepared)
+        prepared_by_name[filename] = prepared
+    
+    documents = {}
+    for (filename, _, _), cached in zip(spooled_files, cached_documents):
+        prepared = cached if cached is not None else prepared_by_name.get(filename)
+        if prepared is not None:
+            documents[filename] = prepared
+            processed_files.append(filename)
     
     if len(processed_files) < 3:
         raise HTTPException(
@@ -76,9 +136,15 @@ async def ingest_documents(
             detail=f"Se necesitan al menos 3 archivos válidos. Solo se procesaron {len(processed_files)}. Errores: {', '.join(errors)}"
         )
     
-    document_service.build_index()
+    # El índice nuevo se arma fuera del event loop y reemplaza al anterior de
+    # una sola vez; hasta entonces las búsquedas usan el índice anterior. Si
+    # ya tiene exactamente estos documentos no se reconstruye.
+    if await asyncio.to_thread(document_service.is_indexed, documents):
+        print("Los documentos recibidos ya están indexados; no se reconstruye el índice")
+    else:
+        await asyncio.to_thread(document_service.reset_index, documents)
     
-    message = f" Se procesaron {len(processed_files)} de {len(files)} archivos exitosamente"
+    message = f" Se procesaron {len(processed_files)} de {total_files} archivos exitosamente"
     if errors:
         message += f".  Hubo errores en {len(errors)} archivo(s)"
     
@@ -86,4 +152,4 @@ async def ingest_documents(
         message=message,
         files_processed=len(processed_files),
         files_list=processed_files
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,85 @@
+import asyncio
+import os
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.services.document_service import EMPTY_SNAPSHOT, document_service
+from app.utils.metrics import CONTENT_TYPE, Counter, Gauge, Histogram, registry
+
+router = APIRouter()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    "qa_http_request_duration_seconds", "Latencia de cada request HTTP por ruta.", ("method", "route", "status")
+))
+
+
+def index_stats():
+    # Mientras el índice se carga, ``/metrics`` responde con el índice vacío
+    # en lugar de esperar la carga. Si otro worker publicó una generación
+    # nueva se recarga; ``get_metrics`` arma el texto fuera del event loop.
+    ready = document_service.ready.is_set()
+    index, locations, generation = document_service.snapshot if ready else EMPTY_SNAPSHOT
+    return {
+        'documents': len(locations),
+        'chunks': index.corpus_size if index else 0,
+        'segments': len(index.segments) if index else 0,
+        'generation': generation,
+        'pending_documents': len(document_service.pending_documents)
+    }
+
+
+def index_disk_bytes() -> int:
+    total = 0
+    for root, _, names in os.walk(document_service.index_dir):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                # Un segmento borrado por una compactación entre el listado y el stat.
+                pass
+    return total
+
+
+def _gauge(name: str, documentation: str, key: str) -> Gauge:
+    return registry.register(Gauge(name, documentation, callback=lambda: [((), index_stats()[key])]))
+
+
+_gauge("qa_index_documents", "Documentos vivos en el índice.", 'documents')
+_gauge("qa_index_chunks", "Chunks vivos en el índice.", 'chunks')
+_gauge("qa_index_segments", "Segmentos del índice.", 'segments')
+_gauge("qa_index_generation", "Generación del índice publicada en este proceso.", 'generation')
+_gauge("qa_pending_documents", "Documentos agregados que todavía no se indexaron.", 'pending_documents')
+registry.register(Gauge(
+    "qa_index_ready", "1 si el índice terminó de cargarse, 0 mientras se carga.",
+    callback=lambda: [((), int(document_service.ready.is_set()))]
+))
+registry.register(Gauge(
+    "qa_index_load_seconds", "Duración de la carga del índice al arrancar.",
+    callback=lambda: [((), document_service.load_seconds)] if document_service.load_seconds is not None else []
+))
+registry.register(Gauge(
+    "qa_index_disk_bytes", "Tamaño del índice en disco.", callback=lambda: [((), index_disk_bytes())]
+))
+registry.register(Counter(
+    "qa_query_cache_requests_total", "Búsquedas en la caché de consultas por resultado.", ("result",),
+    callback=lambda: [(("hit",), document_service.query_cache.hits), (("miss",), document_service.query_cache.misses)]
+))
+registry.register(Gauge(
+    "qa_query_cache_hit_ratio", "Proporción de aciertos de la caché de consultas.",
+    callback=lambda: [((), document_service.query_cache.stats()['hit_ratio'])]
+))
+registry.register(Gauge(
+    "qa_query_cache_entries", "Entradas en la caché de consultas.",
+    callback=lambda: [((), document_service.query_cache.stats()['size'])]
+))
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Métricas en formato de texto de Prometheus: latencia por ruta, duración
+    de cada etapa de la ingesta y de las consultas, tamaño del índice y
+    aciertos de la caché. Con varios workers cada proceso expone las suyas.
+    """
+    return PlainTextResponse(await asyncio.to_thread(registry.render), media_type=CONTENT_TYPE)
@@ -1,58 +1,95 @@
+import asyncio
+from typing import Dict, List, Optional
+
 from fastapi import APIRouter, Query, HTTPException
 
-from app.models.schemas import SearchResponse, SearchResult, ErrorResponse
+from app.models.schemas import FUZZY_DESCRIPTION, MAX_QUERY_TIMEOUT, TIMEOUT_DESCRIPTION, SearchBatchRequest, SearchBatchResponse, SearchResponse, SearchResult, ErrorResponse
 from app.services.document_service import document_service
 
 router = APIRouter()
 
-@router.get("/search", response_model=SearchResponse)
-async def search_documents(
-    q: str = Query(
-        ...,
-        min_length=1,
-        max_length=200,
-        description="Texto a buscar en los documentos indexados"
-    )
-):
-    """
-    Busca contenido relevante en los documentos indexados.
-    
-    Utiliza el algoritmo BM25 para encontrar los pasajes más relevantes
-    que coincidan con la consulta. Devuelve hasta 5 fragmentos ordenados
-    por relevancia.
-    
-    """
-    if document_service.get_document_count() == 0:
+async def ensure_documents_indexed():
+    # Contar los documentos puede recargar el índice si otro worker publicó
+    # una generación nueva: se hace fuera del event loop.
+    if await asyncio.to_thread(document_service.get_document_count) == 0:
         raise HTTPException(
             status_code=404,
             detail="No hay documentos indexados. Por favor, use /ingest primero para cargar documentos"
         )
-    
-    results = document_service.search(q, top_k=5)
-    
-    if not results:
-        return SearchResponse(
-            query=q,
-            results=[],
-            total_results=0
-        )
-    
+
+def build_search_response(query: str, results: Optional[List[Dict]]) -> SearchResponse:
+    if results is None:
+        return SearchResponse(query=query, results=[], total_results=0, timed_out=True)
+
     search_results = []
     for result in results:
         search_results.append(
             SearchResult(
                 text=result['text'],
                 document_name=result['document_name'],
-                relevance_score=round(result['relevance_score'], 3)
+                relevance_score=round(result['relevance_score'], 3),
+                other_documents=result['other_documents']
             )
         )
     
     return SearchResponse(
-        query=q,
+        query=query,
         results=search_results,
         total_results=len(search_results)
     )
 
+@router.get("/search", response_model=SearchResponse)
+async def search_documents(
+    q: str = Query(
+        ...,
+        min_length=1,
+        max_length=200,
+        description="Texto a buscar en los documentos indexados; las frases entre comillas deben aparecer seguidas"
+    ),
+    top_k: int = Query(5, ge=1, le=50, description="Cantidad máxima de fragmentos a devolver"),
+    min_score: float = Query(0.25, ge=0, description="Puntaje mínimo de relevancia"),
+    timeout: Optional[float] = Query(None, gt=0, le=MAX_QUERY_TIMEOUT, description=TIMEOUT_DESCRIPTION),
+    fuzzy: bool = Query(True, description=FUZZY_DESCRIPTION)
+):
+    """
+    Busca contenido relevante en los documentos indexados.
+    
+    Utiliza el algoritmo BM25 para encontrar los pasajes más relevantes
+    que coincidan con la consulta. Devuelve hasta ``top_k`` fragmentos
+    (5 por defecto) ordenados por relevancia, que suma un aporte cuando los
+    términos aparecen cerca. Una frase entre comillas (``"ciencia de datos"``)
+    solo encuentra fragmentos con esos términos seguidos. Los términos que no
+    están en el índice (``informacion``, ``pyton``) se buscan como los
+    parecidos que sí están, salvo con ``fuzzy=false``. La puntuación corre
+    en el pool de consultas; si vence el timeout la respuesta indica ``timed_out``.
+    
+    """
+    await ensure_documents_indexed()
+    
+    results = await document_service.search_async(
+        q, top_k=top_k, min_score=min_score, timeout=timeout, fuzzy=fuzzy
+    )
+    return build_search_response(q, results)
+
+@router.post("/search/batch", response_model=SearchBatchResponse)
+async def search_documents_batch(request: SearchBatchRequest):
+    """
+    Busca varias consultas en una sola llamada.
+    
+    Todas las consultas se puntúan juntas en una sola pasada sobre el
+    índice; los resultados se devuelven en el mismo orden que las consultas.
+    Si vence el timeout se devuelven las consultas ya resueltas y el resto
+    queda marcado con ``timed_out``.
+    """
+    await ensure_documents_indexed()
+    
+    batch_results = await document_service.search_batch_async(
+        request.queries, request.top_k, request.min_score, request.timeout, request.fuzzy
+    )
+    return SearchBatchResponse(
+        results=[build_search_response(query, results) for query, results in zip(request.queries, batch_results)]
+    )
+
 @router.get("/index/info")
 async def get_index_info():
-    return document_service.get_index_info()
\ No newline at end of file
+    return await asyncio.to_thread(document_service.get_index_info)
@@ -0,0 +1,1075 @@
+import heapq
+import itertools
+import time
+from collections import Counter
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.fuzzy_index import FuzzyIndex, edit_distance, fold_accents
+from app.services.postings import CompressedPostings, TermPositions, _ranges
+from app.services.sentence_index import SentenceIndex, _concatenate
+from app.services.string_table import StringTable, TermDictionary
+
+
+def compute_idf(doc_freqs: np.ndarray, corpus_size: int, epsilon: float) -> Tuple[np.ndarray, float]:
+    n = np.asarray(doc_freqs, dtype=np.float64)
+    idf = np.log(corpus_size - n + 0.5) - np.log(n + 0.5)
+    # Ordenado, el promedio no depende del orden de los términos: varios
+    # segmentos dan exactamente el mismo valor que uno solo con todo el corpus.
+    average_idf = float(np.sort(idf).mean()) if len(idf) else 0.0
+    idf[idf < 0] = epsilon * average_idf
+    return idf, average_idf
+
+
+def compute_length_norm(doc_len: np.ndarray, avgdl: float, k1: float, b: float) -> np.ndarray:
+    return k1 * (1 - b + b * doc_len / (avgdl or 1.0))
+
+
+def compute_max_weights(offsets: np.ndarray, postings: np.ndarray, frequencies: np.ndarray,
+                        length_norm: np.ndarray, k1: float) -> np.ndarray:
+    """Mayor factor de frecuencia (el aporte BM25 sin el IDF) de cada término entre sus postings."""
+    if len(offsets) < 2:
+        return np.zeros(0, dtype=np.float64)
+    weights = frequencies * (k1 + 1) / (frequencies + length_norm[postings])
+    return np.maximum.reduceat(weights, offsets[:-1])
+
+
+# Holgura relativa de las cotas de MaxScore: los puntajes se suman en otro
+# orden que las cotas y pueden diferir en el último bit.
+BOUND_SLACK = 1e-9
+# Con menos postings entre todos sus términos, puntuar la consulta completa
+# con numpy es más rápido que podar (ver benchmarks/pruning_benchmark.py).
+MAX_SCORE_MIN_POSTINGS = 20000
+# Largo mínimo (sin tildes) de un término de consulta para buscarle
+# parecidos a una edición de distancia.
+FUZZY_MIN_LENGTH = 5
+
+
+def balanced_ranges(sizes: Sequence[int], parts: int) -> List[range]:
+    """Corta ``sizes`` en hasta ``parts`` tramos contiguos, no vacíos y de suma parecida."""
+    total = int(np.sum(sizes)) if len(sizes) else 0
+    if parts <= 1 or len(sizes) <= 1 or total == 0:
+        return [range(len(sizes))] if len(sizes) else []
+    cuts = np.searchsorted(np.cumsum(sizes), total * np.arange(1, parts) / parts, side='left') + 1
+    bounds = sorted({0, len(sizes), *np.minimum(cuts, len(sizes)).tolist()})
+    return [range(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def _postings_from_keys(keys: np.ndarray, frequencies: np.ndarray, stride: int, terms_count: int):
+    offsets = np.zeros(terms_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // stride, minlength=terms_count), out=offsets[1:])
+    return offsets, (keys % stride).astype(np.int32), frequencies.astype(np.int32)
+
+
+class Segment:
+    """
+    Bloque inmutable del índice: un grupo de documentos con sus chunks y los
+    postings de esos chunks (término -> ids locales de chunk y frecuencias).
+
+    El texto de cada documento se guarda una sola vez, como bloque UTF-8; un
+    chunk es la terna (``chunk_documents``, ``chunk_starts``, ``chunk_ends``)
+    con offsets de bytes relativos a su documento, y su texto solo se
+    decodifica cuando se devuelve como resultado. Los postings se guardan
+    comprimidos (``CompressedPostings``) y se decodifican por término, junto
+    con la posición de cada aparición (``TermPositions``) para las frases y
+    la cercanía entre términos. ``fuzzy`` (``FuzzyIndex``) encuentra los
+    términos del vocabulario parecidos a uno que no está.
+
+    Cada segmento guarda además el IDF y la normalización por longitud
+    calculados como si fuera el corpus completo, que se reutilizan tal cual
+    cuando el índice tiene un único segmento sin borrados, y el mayor factor
+    de frecuencia de cada término (``max_weights``), que da las cotas para
+    descartar chunks sin puntuarlos.
+    """
+
+    def __init__(self, document_names: Sequence[str], document_texts: StringTable, chunk_documents: np.ndarray,
+                 chunk_starts: np.ndarray, chunk_ends: np.ndarray, vocab: TermDictionary,
+                 postings, doc_len: np.ndarray, idf: np.ndarray,
+                 length_norm: np.ndarray, avgdl: float, average_idf: float, max_weights: np.ndarray,
+                 sentences: Optional[SentenceIndex] = None, positions: Optional[TermPositions] = None,
+                 fuzzy: Optional[FuzzyIndex] = None):
+        self.document_names = document_names
+        self.document_texts = document_texts
+        self.chunk_documents = chunk_documents
+        self.chunk_starts = chunk_starts
+        self.chunk_ends = chunk_ends
+        self.vocab = vocab
+        # ``CompressedPostings`` o, en segmentos anteriores a la versión 7, ``PostingLists``.
+        self.postings = postings
+        self.offsets = postings.offsets
+        self.doc_len = doc_len
+        self.idf = idf
+        self.length_norm = length_norm
+        self.avgdl = avgdl
+        self.average_idf = average_idf
+        self.max_weights = max_weights
+        self.sentences = sentences if sentences is not None else SentenceIndex.empty(len(doc_len))
+        # ``None`` en segmentos anteriores a la versión 8.
+        self.positions = positions
+        self._fuzzy = fuzzy
+        self._max_chunk_length = None
+
+    @classmethod
+    def build(cls, document_names: List[str], document_texts: List[str], chunk_documents: List[int],
+              chunk_spans: List[Tuple[int, int]], tokenized_chunks: List[List[str]],
+              k1: float = 1.2, b: float = 0.75, epsilon: float = 0.25,
+              sentences: Optional[Tuple[List[int], List[Tuple[int, int]], List[List[str]]]] = None):
+        """
+        ``chunk_spans`` son offsets de bytes sobre el texto UTF-8 del documento
+        de cada chunk; ``sentences`` es (documento, offsets, términos) de cada
+        oración, en el orden de los documentos.
+        """
+        corpus_size = len(tokenized_chunks)
+        terms = sorted({token for tokens in tokenized_chunks for token in tokens})
+        term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        doc_len = np.fromiter((len(tokens) for tokens in tokenized_chunks), dtype=np.int64, count=corpus_size)
+
+        token_ids = np.fromiter(
+            (term_ids[token] for tokens in tokenized_chunks for token in tokens),
+            dtype=np.int64,
+            count=int(doc_len.sum())
+        )
+        chunk_ids = np.repeat(np.arange(corpus_size, dtype=np.int64), doc_len)
+        token_positions = np.arange(len(token_ids), dtype=np.int64) - np.repeat(np.cumsum(doc_len) - doc_len, doc_len)
+
+        # Cada par (término, chunk) se codifica en una sola clave. Un orden
+        # estable por clave agrupa los tokens por término y chunk y deja las
+        # posiciones de cada grupo crecientes; cada grupo es un posting.
+        stride = max(corpus_size, 1)
+        token_keys = token_ids * stride + chunk_ids
+        order = np.argsort(token_keys, kind='stable')
+        token_keys, positions = token_keys[order], token_positions[order]
+        starts = np.flatnonzero(np.diff(token_keys, prepend=-1))
+        keys, frequencies = token_keys[starts], np.diff(np.append(starts, len(token_keys)))
+        offsets, postings, frequencies = _postings_from_keys(keys, frequencies, stride, len(terms))
+
+        spans = np.asarray(chunk_spans, dtype=np.int32).reshape(-1, 2)
+        chunk_documents = np.asarray(chunk_documents, dtype=np.int32)
+        chunk_starts, chunk_ends = spans[:, 0].copy(), spans[:, 1].copy()
+        sentence_index = None
+        if sentences is not None:
+            sentence_index = SentenceIndex.build(*sentences, term_ids, chunk_documents, chunk_starts, chunk_ends)
+        return cls._with_statistics(
+            document_names, StringTable.from_strings(document_texts, deduplicate=True), chunk_documents, chunk_starts, chunk_ends,
+            TermDictionary.from_strings(terms), offsets, postings, frequencies, doc_len, k1, b, epsilon,
+            sentence_index, positions
+        )
+
+    @classmethod
+    def merge(cls, segments: List['Segment'], deleted_documents: List[Optional[np.ndarray]],
+              k1: float = 1.2, b: float = 0.75, epsilon: float = 0.25):
+        """Une varios segmentos en uno solo descartando los documentos borrados."""
+        terms = sorted(set().union(*(seg.vocab for seg in segments)))
+        term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        live_chunks = [seg.live_chunks(deleted) for seg, deleted in zip(segments, deleted_documents)]
+        stride = max(sum(int(live.sum()) for live in live_chunks), 1)
+
+        document_names, document_texts = [], []
+        chunk_documents, chunk_starts, chunk_ends, doc_len, keys, frequencies = [], [], [], [], [], []
+        chunks_count = 0
+        sentence_parts = []
+        # Posiciones de todos los segmentos concatenadas, y dónde empiezan
+        # las de cada posting conservado; se reordenan junto con los postings.
+        with_positions = all(seg.positions is not None for seg in segments)
+        position_values, position_starts = [], []
+        positions_count = 0
+        for seg, deleted, live in zip(segments, deleted_documents, live_chunks):
+            live_documents = np.ones(len(seg.document_names), dtype=bool) if deleted is None else ~deleted
+            document_map = np.cumsum(live_documents) - 1 + len(document_names)
+            chunk_map = np.cumsum(live) - 1 + chunks_count
+            chunks_count += int(live.sum())
+
+            for doc_id in np.flatnonzero(live_documents):
+                document_names.append(seg.document_names[doc_id])
+                document_texts.append(seg.document_texts.raw(doc_id))
+            # Los offsets son relativos al documento, así que se copian sin ajustar.
+            chunk_documents.append(document_map[seg.chunk_documents[live]])
+            chunk_starts.append(seg.chunk_starts[live])
+            chunk_ends.append(seg.chunk_ends[live])
+            doc_len.append(seg.doc_len[live])
+
+            term_map = np.fromiter((term_ids[term] for term in seg.vocab), dtype=np.int64, count=len(seg.vocab))
+            posting_terms = np.repeat(term_map, np.diff(seg.offsets))
+            docs, tf = seg.postings.arrays()
+            keep = live[docs]
+            keys.append(posting_terms[keep] * stride + chunk_map[docs[keep]])
+            frequencies.append(tf[keep])
+            if with_positions:
+                starts = np.cumsum(tf, dtype=np.int64) - tf
+                position_starts.append(starts[keep] + positions_count)
+                position_values.append(seg.positions.values)
+                positions_count += len(seg.positions.values)
+            sentence_parts.append((seg.sentences, live_documents, live, document_map, term_map))
+
+        keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+        frequencies = np.concatenate(frequencies) if frequencies else np.empty(0, dtype=np.int32)
+        order = np.argsort(keys, kind='stable')
+        keys, frequencies = keys[order], frequencies[order]
+        positions = None
+        if with_positions:
+            values = np.concatenate(position_values) if position_values else np.empty(0, dtype=np.uint8)
+            positions = values[_ranges(_concatenate(position_starts, np.int64)[order], frequencies.astype(np.int64))]
+
+        # Los términos que solo aparecían en documentos borrados salen del vocabulario.
+        used_terms = np.unique(keys // stride)
+        keys = np.searchsorted(used_terms, keys // stride) * stride + keys % stride
+        offsets, postings, frequencies = _postings_from_keys(keys, frequencies, stride, len(used_terms))
+        # Los términos de oraciones vivas siempre están en algún chunk vivo.
+        sentences = SentenceIndex.merge([
+            (part, live_documents, live, document_map, np.searchsorted(used_terms, term_map))
+            for part, live_documents, live, document_map, term_map in sentence_parts
+        ])
+
+        return cls._with_statistics(
+            document_names, StringTable.from_bytes(document_texts, deduplicate=True),
+            _concatenate(chunk_documents, np.int32), _concatenate(chunk_starts, np.int32),
+            _concatenate(chunk_ends, np.int32),
+            TermDictionary.from_strings([terms[i] for i in used_terms]), offsets, postings, frequencies,
+            _concatenate(doc_len, np.int64), k1, b, epsilon, sentences, positions
+        )
+
+    @classmethod
+    def _with_statistics(cls, document_names, document_texts, chunk_documents, chunk_starts, chunk_ends, vocab,
+                         offsets, postings, frequencies, doc_len, k1, b, epsilon, sentences=None, positions=None):
+        corpus_size = len(doc_len)
+        avgdl = int(doc_len.sum()) / corpus_size if corpus_size else 0.0
+        idf, average_idf = compute_idf(np.diff(offsets), corpus_size, epsilon)
+        length_norm = compute_length_norm(doc_len, avgdl, k1, b)
+        return cls(
+            document_names, document_texts, chunk_documents, chunk_starts, chunk_ends, vocab,
+            CompressedPostings.encode(offsets, postings, frequencies), doc_len, idf, length_norm, avgdl, average_idf,
+            compute_max_weights(offsets, postings, frequencies, length_norm, k1), sentences,
+            None if positions is None else TermPositions.build(offsets, frequencies, positions),
+            FuzzyIndex.build(vocab)
+        )
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self.doc_len)
+
+    def chunk_text(self, chunk_id: int) -> str:
+        return self.document_texts.substring(
+            int(self.chunk_documents[chunk_id]), int(self.chunk_starts[chunk_id]), int(self.chunk_ends[chunk_id])
+        )
+
+    def sentence_text(self, sentence_id: int) -> str:
+        return self.document_texts.substring(
+            int(self.sentences.documents[sentence_id]), int(self.sentences.starts[sentence_id]),
+            int(self.sentences.ends[sentence_id])
+        )
+
+    def term_ids(self, terms) -> np.ndarray:
+        ids = (self.vocab.get(term) for term in terms)
+        return np.array([term_id for term_id in ids if term_id is not None], dtype=np.int32)
+
+    def live_chunks(self, deleted_documents: Optional[np.ndarray]) -> np.ndarray:
+        if deleted_documents is None:
+            return np.ones(self.chunk_count, dtype=bool)
+        return ~deleted_documents[self.chunk_documents]
+
+    def term_postings(self, term: str) -> Optional[Tuple[int, np.ndarray, np.ndarray]]:
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            return None
+        return (term_id, *self.postings.term(term_id))
+
+    @property
+    def max_chunk_length(self) -> int:
+        # Se calcula con la primera frase y no al abrir el segmento, que no recorre ``doc_len``.
+        if self._max_chunk_length is None:
+            self._max_chunk_length = int(self.doc_len.max()) if self.chunk_count else 0
+        return self._max_chunk_length
+
+    @property
+    def fuzzy(self) -> FuzzyIndex:
+        # Los segmentos anteriores a la versión 9 no lo guardan: se arma del
+        # vocabulario con la primera consulta que lo necesita.
+        if self._fuzzy is None:
+            self._fuzzy = FuzzyIndex.build(self.vocab)
+        return self._fuzzy
+
+    def phrase_chunks(self, phrase: List[str]) -> np.ndarray:
+        """
+        Ids locales, ordenados, de los chunks que tienen los términos de
+        ``phrase`` en posiciones consecutivas. Se recorren los términos del
+        más raro al más común: de cada uno solo se toman los postings de los
+        chunks que siguen siendo candidatos y se intersectan los pares
+        (chunk, posición - lugar del término en la frase). No se lee el texto
+        de ningún chunk, así que el costo no depende de su largo. Sin
+        posiciones (segmentos anteriores a la versión 8) alcanza con que el
+        chunk tenga todos los términos.
+        """
+        term_ids = [self.vocab.get(term) for term in phrase]
+        if not phrase or None in term_ids:
+            return np.empty(0, dtype=np.int64)
+        doc_freqs = np.diff(self.offsets)
+        stride = self.max_chunk_length + len(phrase)
+        chunks = keys = None
+        for j in sorted(range(len(phrase)), key=lambda j: doc_freqs[term_ids[j]]):
+            docs, tf = self.postings.term(term_ids[j])
+            selected = np.arange(len(docs)) if chunks is None else np.flatnonzero(np.isin(docs, chunks))
+            chunks = docs[selected].astype(np.int64)
+            if self.positions is not None:
+                rows, positions = self.positions.select(term_ids[j], tf, selected)
+                term_keys = chunks[rows] * stride + positions + (len(phrase) - j)
+                keys = term_keys if keys is None else np.intersect1d(keys, term_keys, assume_unique=True)
+                chunks = np.unique(keys // stride)
+            if not len(chunks):
+                break
+        return chunks
+
+    def dead_doc_freqs(self, live: np.ndarray) -> np.ndarray:
+        """Cuántos chunks borrados contiene cada término del segmento."""
+        posting_terms = np.repeat(np.arange(len(self.vocab)), np.diff(self.offsets))
+        docs, _ = self.postings.arrays()
+        return np.bincount(posting_terms[~live[docs]], minlength=len(self.vocab))
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 (variante Okapi) formado por uno o más segmentos.
+
+    Una consulta solo recorre los postings de sus términos en cada segmento;
+    el IDF y la longitud promedio se calculan sobre todos los chunks vivos,
+    de modo que los puntajes coinciden con los de ``rank_bm25.BM25Okapi``
+    construido sobre el corpus completo. Los ids de chunk son globales: el
+    segmento ``i`` ocupa el rango ``chunk_offsets[i]:chunk_offsets[i + 1]``.
+
+    Con ``shard_count > 1`` los segmentos (y con ellos sus documentos) se
+    reparten en shards de tamaño parecido. Las estadísticas siguen siendo
+    globales y los ids de chunk no cambian, así que cada shard puede elegir
+    su propio top k por separado y la unión es idéntica al resultado del
+    índice completo.
+    """
+
+    def __init__(self, segments: List[Segment], deleted_documents: Optional[List[Optional[np.ndarray]]] = None,
+                 k1: float = 1.2, b: float = 0.75, epsilon: float = 0.25, shard_count: int = 1):
+        self.segments = segments
+        self.deleted_documents = deleted_documents or [None] * len(segments)
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.shard_count = shard_count
+        # Ids de los segmentos de cada shard: el segmento más grande que falta
+        # va al shard con menos chunks, así la carga queda pareja.
+        shards = [[] for _ in range(min(shard_count, len(segments)))]
+        loads = [0] * len(shards)
+        for i in sorted(range(len(segments)), key=lambda i: -segments[i].chunk_count):
+            target = loads.index(min(loads))
+            shards[target].append(i)
+            loads[target] += segments[i].chunk_count
+        self.shards = [sorted(shard) for shard in shards if shard]
+
+        self.chunk_offsets = np.zeros(len(segments) + 1, dtype=np.int64)
+        np.cumsum([seg.chunk_count for seg in segments], out=self.chunk_offsets[1:])
+        self.live = [
+            None if deleted is None else seg.live_chunks(deleted)
+            for seg, deleted in zip(segments, self.deleted_documents)
+        ]
+        self.corpus_size = sum(
+            seg.chunk_count if live is None else int(live.sum()) for seg, live in zip(segments, self.live)
+        )
+
+        # Caso habitual tras compactar: las estadísticas del único segmento son
+        # las del corpus y se usan directamente desde el memmap, sin recorrerlo.
+        self.single_segment = len(segments) == 1 and self.live[0] is None
+        if self.single_segment:
+            self.avgdl = segments[0].avgdl
+            self.average_idf = segments[0].average_idf
+            self.length_norms = [segments[0].length_norm]
+        else:
+            total_len = sum(
+                int(seg.doc_len.sum() if live is None else seg.doc_len[live].sum())
+                for seg, live in zip(segments, self.live)
+            )
+            self.avgdl = total_len / self.corpus_size if self.corpus_size else 0.0
+            self.length_norms = [compute_length_norm(seg.doc_len, self.avgdl, k1, b) for seg in segments]
+            self._merge_doc_freqs()
+
+    def _merge_doc_freqs(self):
+        # El segmento más grande hace de base. Los vocabularios se cruzan por
+        # largo en bytes con ``np.unique`` sobre los bytes de los términos, sin
+        # recorrerlos uno por uno: cada término suma sus frecuencias de todos
+        # los segmentos. Los que la base no tiene quedan aparte, por largo.
+        self._base = max(range(len(self.segments)), key=lambda i: self.segments[i].chunk_count, default=None)
+        self._base_df = np.zeros(0, dtype=np.int64)
+        self._extra_df: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        if self._base is None:
+            self.average_idf = 0.0
+            return
+
+        doc_freqs = [np.diff(seg.offsets) for seg in self.segments]
+        for i, (seg, live) in enumerate(zip(self.segments, self.live)):
+            if live is not None:
+                doc_freqs[i] = doc_freqs[i] - seg.dead_doc_freqs(live)
+        self._base_df = doc_freqs[self._base].astype(np.int64)
+
+        groups = [seg.vocab.length_groups() for seg in self.segments]
+        for width in set().union(*groups):
+            keys, freqs = [], []
+            for i, group in enumerate(groups):
+                if width not in group:
+                    continue
+                term_ids, term_keys = group[width]
+                freq = doc_freqs[i][term_ids]
+                if i != self._base:
+                    term_keys, freq = term_keys[freq > 0], freq[freq > 0]
+                keys.append(term_keys)
+                freqs.append(freq)
+            unique, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+            totals = np.bincount(inverse, weights=np.concatenate(freqs), minlength=len(unique)).astype(np.int64)
+            extra = totals > 0
+            if width in groups[self._base]:
+                term_ids, term_keys = groups[self._base][width]
+                positions = np.searchsorted(unique, term_keys)
+                self._base_df[term_ids] = totals[positions]
+                extra[positions] = False
+            if extra.any():
+                self._extra_df[width] = (unique[extra], totals[extra])
+
+        all_doc_freqs = np.concatenate(
+            [self._base_df[self._base_df > 0]] + [freqs for _, freqs in self._extra_df.values()]
+        )
+        _, self.average_idf = compute_idf(all_doc_freqs, self.corpus_size, self.epsilon)
+
+    def doc_freq(self, term: str) -> int:
+        if self.single_segment:
+            term_id = self.segments[0].vocab.get(term)
+            return 0 if term_id is None else int(self.segments[0].offsets[term_id + 1] - self.segments[0].offsets[term_id])
+        if self._base is not None:
+            term_id = self.segments[self._base].vocab.get(term)
+            if term_id is not None:
+                return int(self._base_df[term_id])
+        key = term.encode('utf-8')
+        if len(key) not in self._extra_df:
+            return 0
+        keys, freqs = self._extra_df[len(key)]
+        position = int(np.searchsorted(keys, key))
+        return int(freqs[position]) if position < len(keys) and keys[position] == key else 0
+
+    def idf(self, term: str) -> float:
+        n = self.doc_freq(term)
+        if n == 0:
+            return 0.0
+        idf = np.log(self.corpus_size - n + 0.5) - np.log(n + 0.5)
+        return self.epsilon * self.average_idf if idf < 0 else float(idf)
+
+    def get_scores(self, query_tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Devuelve los chunks candidatos (los que contienen algún término) y sus puntajes."""
+        candidates, scores, _ = self.score_candidates(query_tokens)
+        return candidates, scores
+
+    def score_candidates(self, query_tokens: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Como ``get_scores``, y además cuántos tokens de la consulta contiene
+        cada candidato (un token repetido en la consulta cuenta cada vez),
+        contado sobre los mismos postings.
+        """
+        return self.score_batch([query_tokens])[0]
+
+    def term_postings(self, token: str, segment_ids: Optional[Sequence[int]] = None):
+        """
+        IDF global de un término y sus postings en cada segmento que lo
+        contiene, como (segmento, id del término, chunks locales, tf). Solo
+        decodifica los postings de ese término, sin descartar los borrados.
+        """
+        postings = []
+        idf = None
+        for i in range(len(self.segments)) if segment_ids is None else segment_ids:
+            seg = self.segments[i]
+            term_postings = seg.term_postings(token)
+            if term_postings is None:
+                continue
+            if idf is None:
+                idf = seg.idf[term_postings[0]] if self.single_segment else self.idf(token)
+            postings.append((i, *term_postings))
+        return idf, postings
+
+    def _weights(self, idf, segment_id: int, docs: np.ndarray, tf: np.ndarray) -> np.ndarray:
+        return idf * (tf * (self.k1 + 1) / (tf + self.length_norms[segment_id][docs]))
+
+    def term_contributions(self, token: str,
+                           segment_ids: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Columna de un término en la matriz término × chunk: ids globales de
+        chunk y aporte BM25, opcionalmente solo en los segmentos indicados.
+        """
+        return self._contributions(*self.term_postings(token, segment_ids))
+
+    def _contributions(self, idf, term_postings) -> Tuple[np.ndarray, np.ndarray]:
+        postings = []
+        contributions = []
+        for i, _, docs, tf in term_postings:
+            if self.live[i] is not None:
+                alive = self.live[i][docs]
+                docs, tf = docs[alive], tf[alive]
+            postings.append(docs + self.chunk_offsets[i])
+            contributions.append(self._weights(idf, i, docs, tf))
+        if not postings:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        return np.concatenate(postings), np.concatenate(contributions)
+
+    def upper_bound(self, idf, term_postings) -> float:
+        """
+        Cota superior del aporte de un término a cualquier chunk, a partir de
+        los ``max_weights`` de cada segmento. Si el avgdl global es mayor que
+        el del segmento la normalización por longitud baja a lo sumo en ese
+        cociente, así que la cota guardada se escala por él.
+        """
+        if not term_postings or idf <= 0:
+            # Un IDF negativo solo resta: cero sigue siendo cota.
+            return 0.0
+        bound = 0.0
+        for i, term_id, _, _ in term_postings:
+            seg = self.segments[i]
+            scale = 1.0 if self.single_segment else max(1.0, (self.avgdl or 1.0) / (seg.avgdl or 1.0))
+            bound = max(bound, float(seg.max_weights[term_id]) * scale)
+        return float(idf) * bound
+
+    def score_batch(self, queries: List[List[str]], deadline: Optional[float] = None,
+                    segment_ids: Optional[Sequence[int]] = None,
+                    terms: Optional[Dict[str, Tuple]] = None,
+                    groups: Optional[List[Optional[List[int]]]] = None
+                    ) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Puntúa varias consultas a la vez: el producto disperso de la matriz
+        consulta × término por la matriz término × chunk. Los postings de cada
+        término distinto se leen una sola vez y todos los pares (consulta,
+        chunk) se acumulan con un único ``np.unique`` + ``np.bincount``.
+
+        Cada token de una consulta aporta en el mismo orden que en una consulta
+        individual, así que los puntajes son idénticos a los de ``get_scores``.
+
+        Si se pasa ``deadline`` (en segundos de ``time.monotonic``) se corta
+        antes de leer los postings de otro término y se lanza ``TimeoutError``:
+        nunca se devuelven puntajes calculados con parte de la consulta.
+        ``segment_ids`` limita la puntuación a esos segmentos (un shard) y
+        ``terms`` trae los ``term_postings`` ya buscados de algunos tokens.
+
+        ``groups`` da, para cada consulta, el grupo de cada token: los tokens
+        de un mismo grupo (los reemplazos de un término mal escrito) cuentan
+        como una sola coincidencia. Sin grupo cada token cuenta aparte.
+        """
+        columns = {}
+        keys, contributions, labels = [], [], []
+        stride = max(int(self.chunk_offsets[-1]), 1)
+        for query_id, query_tokens in enumerate(queries):
+            query_groups = groups[query_id] if groups and groups[query_id] is not None else range(len(query_tokens))
+            for token, group in zip(query_tokens, query_groups):
+                if token not in columns:
+                    check_deadline(deadline)
+                    term = terms.get(token) if terms else None
+                    columns[token] = self._contributions(*(term or self.term_postings(token, segment_ids)))
+                chunks, weights = columns[token]
+                if len(chunks):
+                    keys.append(chunks + query_id * stride)
+                    contributions.append(weights)
+                    if groups:
+                        labels.append(np.full(len(chunks), group, dtype=np.int64))
+
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64))
+        if not keys:
+            return [empty] * len(queries)
+        check_deadline(deadline)
+
+        pairs, positions = np.unique(np.concatenate(keys), return_inverse=True)
+        scores = np.bincount(positions, weights=np.concatenate(contributions), minlength=len(pairs))
+        if groups:
+            # Grupos distintos de cada par (consulta, chunk).
+            labels = np.concatenate(labels)
+            width = int(labels.max()) + 1
+            distinct = np.unique(positions * width + labels)
+            matches = np.bincount(distinct // width, minlength=len(pairs))
+        else:
+            matches = np.bincount(positions, minlength=len(pairs))
+        # Los pares quedan ordenados por consulta: cada consulta es un tramo contiguo.
+        bounds = np.searchsorted(pairs, np.arange(len(queries) + 1) * stride)
+        return [
+            (pairs[start:end] - query_id * stride, scores[start:end], matches[start:end])
+            for query_id, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]))
+        ]
+
+    def top_k(self, query_tokens: List[str], k: int, min_matches: int = 0,
+              min_score: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Selecciona los k mejores chunks con una selección parcial en lugar de
+        un ordenamiento completo. Los candidatos con menos de ``min_matches``
+        tokens de la consulta o con puntaje menor a ``min_score`` se descartan
+        antes de seleccionar, así que no ocupan lugares del top k.
+        """
+        return self.top_k_batch([query_tokens], k, [min_matches], min_score)[0]
+
+    def top_k_batch(self, queries: List[List[str]], k: int, min_matches: Optional[List[int]] = None,
+                    min_score: Optional[float] = None, deadline: Optional[float] = None,
+                    executor: Optional[Executor] = None, pruning: bool = True,
+                    groups: Optional[List[Optional[List[int]]]] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Top k de varias consultas. Con ``executor`` y más de un shard, cada
+        shard elige su top k en paralelo (scatter) y los resultados se unen
+        con un heap (gather); como el orden es (puntaje, id de chunk) en todos
+        los casos, el resultado es idéntico al de puntuar el índice completo.
+
+        Las consultas de más de un término con al menos
+        ``MAX_SCORE_MIN_POSTINGS`` postings usan MaxScore (``top_k_max_score``),
+        salvo con ``pruning=False``, que puntúa todos los postings. ``groups``
+        cuenta como una coincidencia los tokens de un grupo (``score_batch``).
+        """
+        if executor is None or len(self.shards) < 2:
+            return self._top_k_batch(queries, k, min_matches, min_score, deadline, None, pruning, groups)
+
+        futures = [
+            executor.submit(self._top_k_batch, queries, k, min_matches, min_score, deadline, shard, pruning, groups)
+            for shard in self.shards
+        ]
+        shard_results = [future.result() for future in futures]
+        return [
+            merge_top_k([results[query_id] for results in shard_results], k)
+            for query_id in range(len(queries))
+        ]
+
+    def _top_k_batch(self, queries, k, min_matches, min_score, deadline, segment_ids=None, pruning=True, groups=None):
+        # Los postings de cada término se buscan una vez para todo el lote.
+        terms = {}
+        results = [None] * len(queries)
+        exhaustive = []
+        for i, query_tokens in enumerate(queries):
+            for token in query_tokens:
+                if token not in terms:
+                    check_deadline(deadline)
+                    terms[token] = self.term_postings(token, segment_ids)
+            query_terms = {token: terms[token] for token in query_tokens}
+            postings_count = sum(
+                len(docs) for _, term_postings in query_terms.values() for _, _, docs, _ in term_postings
+            )
+            if pruning and k > 0 and len(query_terms) > 1 and postings_count >= MAX_SCORE_MIN_POSTINGS:
+                results[i] = self.top_k_max_score(
+                    query_tokens, k, min_matches[i] if min_matches else 0, min_score, deadline, segment_ids,
+                    query_terms, groups[i] if groups else None
+                )
+            else:
+                exhaustive.append(i)
+
+        # El resto no tiene nada que podar o es más rápido sin podar: se puntúan juntas.
+        if exhaustive:
+            exhaustive_results = self._top_k_exhaustive(
+                [queries[i] for i in exhaustive], k, [min_matches[i] if min_matches else 0 for i in exhaustive],
+                min_score, deadline, segment_ids, terms, [groups[i] for i in exhaustive] if groups else None
+            )
+            for i, result in zip(exhaustive, exhaustive_results):
+                results[i] = result
+        return results
+
+    def _top_k_exhaustive(self, queries, k, min_matches, min_score, deadline, segment_ids, terms=None, groups=None):
+        results = []
+        batch = self.score_batch(queries, deadline, segment_ids, terms, groups)
+        for i, (candidates, scores, matches) in enumerate(batch):
+            keep = _keep(scores, matches, min_matches[i], min_score)
+            if not keep.all():
+                candidates, scores = candidates[keep], scores[keep]
+            results.append(select_top_k(candidates, scores, k))
+        return results
+
+    def top_k_max_score(self, query_tokens: List[str], k: int, min_matches: int = 0,
+                        min_score: Optional[float] = None, deadline: Optional[float] = None,
+                        segment_ids: Optional[Sequence[int]] = None,
+                        terms: Optional[Dict[str, Tuple]] = None,
+                        groups: Optional[List[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top k con poda dinámica MaxScore, idéntico a puntuar todos los postings.
+
+        Los términos se ordenan de mayor a menor cota (``upper_bound``). Los
+        chunks de los primeros, los más raros, se puntúan completos y el
+        k-ésimo mejor puntaje pasa a ser el umbral. Los términos cuyas cotas,
+        sumadas a las de todos los que siguen, no alcanzan el umbral son no
+        esenciales: ningún chunk que aparezca solo en ellos puede entrar al
+        top k. Sus postings, los de los términos más comunes, no se recorren:
+        solo se buscan en ellos los candidatos de los términos esenciales.
+
+        Además, al buscar cada término no esencial se descartan los
+        candidatos cuyo puntaje parcial más las cotas que faltan ya no
+        alcanza el umbral.
+
+        Los aportes se suman en el orden de los tokens de la consulta, igual
+        que en ``score_batch``, así que los puntajes son exactamente los mismos.
+        """
+        terms = dict(terms or {})
+        for token in query_tokens:
+            if token not in terms:
+                check_deadline(deadline)
+                terms[token] = self.term_postings(token, segment_ids)
+        multiplicity = Counter(query_tokens)
+        bounds = {
+            token: multiplicity[token] * self.upper_bound(*term) * (1 + BOUND_SLACK) for token, term in terms.items()
+        }
+        order = sorted(terms, key=lambda token: -bounds[token])
+        # remaining[j]: cota del puntaje de un chunk que solo tiene términos de order[j:].
+        remaining = np.cumsum([bounds[token] for token in reversed(order)])[::-1]
+        lengths = [sum(len(docs) for _, _, docs, _ in terms[token][1]) for token in order]
+
+        # Umbral inicial con los términos más raros. Buscar sus chunks en todos
+        # los términos es caro, así que se limitan a una fracción de los
+        # postings de la consulta (medida con benchmarks/pruning_benchmark.py).
+        budget = sum(lengths) // (8 * len(order))
+        seed_terms = 1
+        while seed_terms < len(order) and sum(lengths[:seed_terms + 1]) <= budget:
+            seed_terms += 1
+        check_deadline(deadline)
+        candidates = self._live_postings([terms[token] for token in order[:seed_terms]])
+        scores, matches = self._score_chunks(candidates, query_tokens, terms, groups)
+
+        threshold = -np.inf if min_score is None else min_score
+        eligible = scores[_keep(scores, matches, min_matches, min_score)]
+        if len(eligible) >= k:
+            threshold = max(threshold, float(np.partition(eligible, len(eligible) - k)[len(eligible) - k]))
+        cutoff = threshold - BOUND_SLACK * abs(threshold)
+
+        # Los postings de los términos esenciales se unen con un solo
+        # np.unique, como en score_batch, y su inversa ubica cada posting.
+        check_deadline(deadline)
+        essential_terms = max(seed_terms, int(np.count_nonzero(remaining >= cutoff)))
+        essential = []
+        for token in order[:essential_terms]:
+            idf, term_postings = terms[token]
+            for i, _, docs, tf in term_postings:
+                if self.live[i] is not None:
+                    alive = self.live[i][docs]
+                    docs, tf = docs[alive], tf[alive]
+                essential.append((token, i, docs, tf))
+        keys = [docs + self.chunk_offsets[i] for _, i, docs, _ in essential]
+        candidates, inverse = np.unique(
+            np.concatenate(keys) if keys else np.empty(0, dtype=np.int64), return_inverse=True
+        )
+
+        columns = {token: [] for token in terms}
+        partial = np.zeros(len(candidates), dtype=np.float64)
+        position = 0
+        for token, i, docs, tf in essential:
+            rows = inverse[position:position + len(docs)]
+            position += len(docs)
+            weights = self._weights(terms[token][0], i, docs, tf)
+            columns[token].append((rows, weights))
+            partial[rows] += multiplicity[token] * weights
+
+        # Términos no esenciales, de mayor a menor cota: solo se buscan los
+        # candidatos que todavía pueden alcanzar el umbral.
+        survivors = np.arange(len(candidates))
+        for position, token in enumerate(order[essential_terms:], start=essential_terms):
+            survivors = survivors[partial[survivors] + remaining[position] >= cutoff]
+            if not len(survivors):
+                break
+            check_deadline(deadline)
+            for rows, weights in self._lookup(candidates[survivors], *terms[token]):
+                rows = survivors[rows]
+                columns[token].append((rows, weights))
+                partial[rows] += multiplicity[token] * weights
+
+        # Puntajes exactos de los sobrevivientes, sumados en el orden de la consulta.
+        scores = np.zeros(len(candidates), dtype=np.float64)
+        for token in query_tokens:
+            for rows, weights in columns[token]:
+                scores[rows] += weights
+        matches = _group_matches(query_tokens, groups, columns, len(candidates))
+        candidates, scores, matches = candidates[survivors], scores[survivors], matches[survivors]
+        keep = _keep(scores, matches, min_matches, min_score)
+        return select_top_k(candidates[keep], scores[keep], k)
+
+    def phrase_chunks(self, phrases: List[List[str]]) -> np.ndarray:
+        """Ids globales, ordenados, de los chunks vivos que contienen todas las ``phrases``."""
+        chunks = []
+        for i, seg in enumerate(self.segments):
+            local = None
+            for phrase in phrases:
+                found = seg.phrase_chunks(phrase)
+                local = found if local is None else np.intersect1d(local, found, assume_unique=True)
+            if local is None or not len(local):
+                continue
+            if self.live[i] is not None:
+                local = local[self.live[i][local]]
+            chunks.append(local + self.chunk_offsets[i])
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+
+    def top_k_phrases(self, query_tokens: List[str], phrases: List[List[str]], k: int, min_matches: int = 0,
+                      min_score: Optional[float] = None, deadline: Optional[float] = None,
+                      groups: Optional[List[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top k entre los chunks que contienen todas las ``phrases`` (tokens que
+        deben aparecer seguidos). Solo se puntúan esos chunks, con los mismos
+        puntajes que daría ``score_batch`` para ``query_tokens``.
+        """
+        check_deadline(deadline)
+        chunks = self.phrase_chunks(phrases)
+        check_deadline(deadline)
+        terms = {token: self.term_postings(token) for token in query_tokens}
+        scores, matches = self._score_chunks(chunks, query_tokens, terms, groups)
+        keep = _keep(scores, matches, min_matches, min_score)
+        return select_top_k(chunks[keep], scores[keep], k)
+
+    def proximity_boost(self, query_tokens: List[str], chunks: np.ndarray, window: int) -> np.ndarray:
+        """
+        Aporte por cercanía de cada uno de ``chunks`` (ids globales ordenados).
+        Por cada par de términos distintos que están seguidos en la consulta y
+        aparecen en el chunk a distancia ``d <= window`` (la menor entre sus
+        posiciones) se suma ``min(idf) / d²``: dos términos pegados suman el
+        IDF del más común de los dos y, al separarse, el aporte cae rápido.
+        """
+        boost = np.zeros(len(chunks), dtype=np.float64)
+        pairs = sorted({tuple(sorted(pair)) for pair in zip(query_tokens, query_tokens[1:]) if pair[0] != pair[1]})
+        occurrences = {}
+        for pair in pairs:
+            for token in pair:
+                if token not in occurrences:
+                    occurrences[token] = self._occurrences(token, chunks)
+            (idf_a, *a), (idf_b, *b) = occurrences[pair[0]], occurrences[pair[1]]
+            if idf_a is None or idf_b is None:
+                continue
+            distances = _nearest_distances(*a, *b, len(chunks))
+            close = distances <= window
+            boost[close] += min(float(idf_a), float(idf_b)) / distances[close] ** 2
+        return boost
+
+    def rerank_by_proximity(self, query_tokens: List[str], candidates: np.ndarray, scores: np.ndarray, k: int,
+                            weight: float, window: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Suma ``weight`` veces ``proximity_boost`` a los puntajes de los candidatos y elige los k mejores."""
+        if weight <= 0 or len(set(query_tokens)) < 2 or not len(candidates):
+            return select_top_k(candidates, scores, k)
+        order = np.argsort(candidates)
+        candidates, scores = candidates[order], scores[order]
+        return select_top_k(candidates, scores + weight * self.proximity_boost(query_tokens, candidates, window), k)
+
+    def _occurrences(self, token: str, chunks: np.ndarray):
+        """IDF de un término y sus apariciones en ``chunks`` como (fila de ``chunks``, posición), ordenadas."""
+        idf, term_postings = self.term_postings(token)
+        rows, positions = [], []
+        bounds = np.searchsorted(chunks, self.chunk_offsets)
+        for i, term_id, docs, tf in term_postings:
+            seg = self.segments[i]
+            start, end = int(bounds[i]), int(bounds[i + 1])
+            if start == end or seg.positions is None:
+                continue
+            # Los chunks son pocos: se buscan en los postings y no al revés.
+            local = (chunks[start:end] - self.chunk_offsets[i]).astype(docs.dtype)
+            found = np.searchsorted(docs, local)
+            hit = found < len(docs)
+            hit[hit] = docs[found[hit]] == local[hit]
+            posting_rows, term_positions = seg.positions.select(term_id, tf, found[hit])
+            rows.append(np.flatnonzero(hit)[posting_rows] + start)
+            positions.append(term_positions)
+        return idf, _concatenate(rows, np.int64), _concatenate(positions, np.int64)
+
+    def similar_terms(self, token: str, limit: int) -> List[str]:
+        """
+        Hasta ``limit`` términos del índice más parecidos a ``token``, que no
+        está en él: primero los que solo difieren en las tildes y, si no hay,
+        los que están a una edición. Con la misma distancia van primero los
+        que aparecen en más chunks. Los tokens de menos de
+        ``FUZZY_MIN_LENGTH`` letras solo se corrigen en las tildes: a una
+        edición de distancia tienen demasiados vecinos.
+        """
+        folded = fold_accents(token)
+        max_distance = 1 if len(folded) >= FUZZY_MIN_LENGTH else 0
+        distances = {}
+        for seg in self.segments:
+            for term_id in seg.fuzzy.candidates(folded).tolist():
+                term = seg.vocab[term_id]
+                if term not in distances:
+                    distances[term] = edit_distance(folded, fold_accents(term))
+        # Los términos que solo quedan en documentos borrados no cuentan.
+        found = sorted(
+            (distance, -doc_freq, term) for term, distance in distances.items()
+            if distance is not None and distance <= max_distance
+            for doc_freq in [self.doc_freq(term)] if doc_freq > 0
+        )
+        return [term for distance, _, term in found if distance == found[0][0]][:limit]
+
+    def candidate_count(self, query_tokens: List[str]) -> int:
+        """Chunks vivos que contienen algún término de la consulta."""
+        return len(self._live_postings([self.term_postings(token) for token in set(query_tokens)]))
+
+    def _live_postings(self, terms) -> np.ndarray:
+        """Ids globales, ordenados y sin repetir, de los chunks vivos que contienen alguno de los términos."""
+        chunks = []
+        for _, term_postings in terms:
+            for i, _, docs, _ in term_postings:
+                if self.live[i] is not None:
+                    docs = docs[self.live[i][docs]]
+                chunks.append(docs + self.chunk_offsets[i])
+        return np.unique(np.concatenate(chunks)) if chunks else np.empty(0, dtype=np.int64)
+
+    def _lookup(self, chunks: np.ndarray, idf, term_postings):
+        """
+        Aporte de un término a cada uno de ``chunks`` (ids globales ordenados)
+        que lo contiene, como (filas de ``chunks``, aportes) por segmento. Se
+        recorre lo más corto: los postings, ubicados entre los chunks, o los
+        chunks, buscados en los postings.
+        """
+        bounds = np.searchsorted(chunks, self.chunk_offsets)
+        for i, _, docs, tf in term_postings:
+            start, end = int(bounds[i]), int(bounds[i + 1])
+            if start == end:
+                continue
+            local = chunks[start:end] - self.chunk_offsets[i]
+            if len(docs) <= len(local):
+                positions = np.searchsorted(local, docs)
+                hit = positions < len(local)
+                hit[hit] = local[positions[hit]] == docs[hit]
+                rows, docs, tf = positions[hit], docs[hit], tf[hit]
+            else:
+                # Mismo tipo que los postings: si no, searchsorted copia el memmap entero.
+                local = local.astype(docs.dtype)
+                positions = np.searchsorted(docs, local)
+                hit = positions < len(docs)
+                hit[hit] = docs[positions[hit]] == local[hit]
+                rows, docs, tf = np.flatnonzero(hit), local[hit], tf[positions[hit]]
+            yield rows + start, self._weights(idf, i, docs, tf)
+
+    def _score_chunks(self, chunks: np.ndarray, query_tokens: List[str], terms,
+                      groups: Optional[List[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Puntaje y cantidad de tokens de la consulta de cada uno de ``chunks`` (ids globales ordenados)."""
+        columns = {token: list(self._lookup(chunks, *term)) for token, term in terms.items()}
+        scores = np.zeros(len(chunks), dtype=np.float64)
+        for token in query_tokens:
+            for rows, weights in columns[token]:
+                # Mismo orden de suma que el bincount de score_batch.
+                scores[rows] += weights
+        return scores, _group_matches(query_tokens, groups, columns, len(chunks))
+
+    def locate(self, chunk_id: int) -> Tuple[Segment, int]:
+        segment = int(np.searchsorted(self.chunk_offsets, chunk_id, side='right')) - 1
+        return self.segments[segment], int(chunk_id - self.chunk_offsets[segment])
+
+    def chunk(self, chunk_id: int) -> Tuple[str, str]:
+        """Texto del chunk y nombre de su documento."""
+        seg, local_id = self.locate(chunk_id)
+        return seg.chunk_text(local_id), seg.document_names[seg.chunk_documents[local_id]]
+
+    def live_documents(self):
+        """Recorre (segmento, id local, nombre) de cada documento no borrado."""
+        for i, (seg, deleted) in enumerate(zip(self.segments, self.deleted_documents)):
+            for doc_id, name in enumerate(seg.document_names):
+                if deleted is None or not deleted[doc_id]:
+                    yield i, doc_id, name
+
+    def without_documents(self, names: Sequence[str]) -> 'BM25Index':
+        """Nueva vista del índice con los documentos indicados marcados como borrados."""
+        names = set(names)
+        deleted_documents = list(self.deleted_documents)
+        for i, doc_id, name in self.live_documents():
+            if name in names:
+                if deleted_documents[i] is None:
+                    deleted_documents[i] = np.zeros(len(self.segments[i].document_names), dtype=bool)
+                elif deleted_documents[i] is self.deleted_documents[i]:
+                    deleted_documents[i] = deleted_documents[i].copy()
+                deleted_documents[i][doc_id] = True
+        return BM25Index(self.segments, deleted_documents, self.k1, self.b, self.epsilon, self.shard_count)
+
+    def with_segment(self, segment: Segment) -> 'BM25Index':
+        return BM25Index(self.segments + [segment], self.deleted_documents + [None], self.k1, self.b, self.epsilon,
+                         self.shard_count)
+
+    @property
+    def is_compact(self) -> bool:
+        """Un solo segmento por shard y sin documentos borrados: compactar no cambiaría nada."""
+        return all(len(shard) == 1 for shard in self.shards) and all(d is None for d in self.deleted_documents)
+
+    def compacted(self) -> 'BM25Index':
+        """
+        Une todos los segmentos descartando los borrados. Con shards, el
+        resultado son ``shard_count`` segmentos de documentos contiguos y
+        tamaño parecido, con los mismos ids de chunk que si fuera uno solo.
+        """
+        if self.shard_count == 1:
+            segment = Segment.merge(self.segments, self.deleted_documents, self.k1, self.b, self.epsilon)
+            return BM25Index([segment], None, self.k1, self.b, self.epsilon)
+
+        live_documents = [(i, doc_id) for i, doc_id, _ in self.live_documents()]
+        chunks_per_document = [
+            np.bincount(seg.chunk_documents, minlength=len(seg.document_names)) for seg in self.segments
+        ]
+        sizes = [int(chunks_per_document[i][doc_id]) for i, doc_id in live_documents]
+        segments = []
+        for part in balanced_ranges(sizes, self.shard_count):
+            # Los documentos fuera del tramo se tratan como borrados en la unión.
+            excluded = {}
+            for i, doc_id in live_documents[part.start:part.stop]:
+                if i not in excluded:
+                    excluded[i] = np.ones(len(self.segments[i].document_names), dtype=bool)
+                excluded[i][doc_id] = False
+            segments.append(Segment.merge(
+                [self.segments[i] for i in excluded], list(excluded.values()), self.k1, self.b, self.epsilon
+            ))
+        return BM25Index(segments, None, self.k1, self.b, self.epsilon, self.shard_count)
+
+
+def _group_matches(query_tokens: List[str], groups: Optional[List[int]], columns, size: int) -> np.ndarray:
+    # Como en ``score_batch``: grupos distintos de la consulta en cada fila;
+    # sin ``groups`` cada token es su propio grupo.
+    groups = range(len(query_tokens)) if groups is None else groups
+    present = np.zeros((max(groups, default=-1) + 1, size), dtype=bool)
+    for token, group in zip(query_tokens, groups):
+        for rows, _ in columns[token]:
+            present[group, rows] = True
+    return present.sum(axis=0)
+
+
+def _keep(scores: np.ndarray, matches: np.ndarray, min_matches: int, min_score: Optional[float]) -> np.ndarray:
+    keep = matches >= min_matches
+    if min_score is not None:
+        keep &= scores >= min_score
+    return keep
+
+
+def _nearest_distances(rows_a: np.ndarray, positions_a: np.ndarray, rows_b: np.ndarray, positions_b: np.ndarray,
+                       count: int) -> np.ndarray:
+    """
+    Menor distancia entre una aparición de ``a`` y una de ``b`` en cada una
+    de ``count`` filas (infinito si falta alguno). Las apariciones vienen
+    ordenadas por fila y posición: la más cercana de ``b`` a cada una de
+    ``a`` es su vecina inmediata en ese orden.
+    """
+    distances = np.full(count, np.inf)
+    if not len(rows_a) or not len(rows_b):
+        return distances
+    stride = int(max(positions_a.max(), positions_b.max())) + 1
+    keys_b = rows_b * stride + positions_b
+    following = np.searchsorted(keys_b, rows_a * stride + positions_a)
+    for neighbor in (following - 1, following):
+        valid = (neighbor >= 0) & (neighbor < len(keys_b))
+        valid[valid] = rows_b[neighbor[valid]] == rows_a[valid]
+        np.minimum.at(distances, rows_a[valid], np.abs(positions_b[neighbor[valid]] - positions_a[valid]))
+    return distances
+
+
+def check_deadline(deadline: Optional[float]):
+    if deadline is not None and time.monotonic() >= deadline:
+        raise TimeoutError("Se excedió el tiempo máximo de la consulta")
+
+
+def merge_top_k(results: List[Tuple[np.ndarray, np.ndarray]], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Une tops k ya ordenados (de shards disjuntos) con un heap, con el mismo orden que ``select_top_k``."""
+    merged = list(itertools.islice(heapq.merge(
+        *(zip((-scores).tolist(), candidates.tolist()) for candidates, scores in results)
+    ), k))
+    return (
+        np.array([chunk_id for _, chunk_id in merged], dtype=np.int64),
+        np.array([-score for score, _ in merged], dtype=np.float64)
+    )
+
+
+def select_top_k(candidates: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    if k <= 0 or len(candidates) == 0:
+        return candidates[:0], scores[:0]
+
+    if len(candidates) > k:
+        # La selección parcial deja los k mayores en cualquier orden; los empates
+        # en el límite se resuelven a favor del chunk con menor id.
+        threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        above = np.flatnonzero(scores > threshold)
+        tied = np.flatnonzero(scores == threshold)
+        selected = np.concatenate([above, tied[np.argsort(candidates[tied], kind='stable')][:k - len(above)]])
+        candidates, scores = candidates[selected], scores[selected]
+
+    # Orden determinista: mayor puntaje primero y, a igual puntaje, el chunk más antiguo.
+    order = np.lexsort((candidates, -scores))
+    return candidates[order], scores[order]
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.string_table import StringTable
+from app.utils.metrics import Counter, registry
+from app.utils.text_utils import PreparedDocument
+
+# Se incrementa cuando cambia la limpieza, la división en chunks o el
+# formato de las entradas: las anteriores dejan de coincidir y se desalojan.
+CACHE_VERSION = 1
+ENTRY_SUFFIX = ".npz"
+
+CACHE_REQUESTS = registry.register(Counter(
+    "qa_document_cache_requests_total", "Consultas a la caché de documentos procesados por resultado.", ("result",)
+))
+
+
+class DocumentCache:
+    """
+    Caché en disco de documentos ya procesados, direccionada por el hash del
+    contenido del archivo. Cada entrada guarda el texto limpio, los offsets
+    de chunks y oraciones y los términos como ids sobre un vocabulario
+    propio, en un ``.npz`` sin comprimir. Volver a subir un archivo idéntico
+    (con cualquier nombre) no lo extrae ni lo tokeniza de nuevo.
+
+    La clave incluye la configuración del tokenizador, así que cambiarla
+    invalida la caché. El tamaño total se limita a ``max_bytes``
+    desalojando las entradas usadas hace más tiempo (por fecha de
+    modificación, que se actualiza en cada acierto). Con varios workers
+    todos comparten el directorio: las entradas se escriben con
+    ``os.replace`` y nunca se ven a medio escribir.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, digest: str, filename: str, tokenizer: Dict) -> str:
+        """Clave de un archivo: su SHA-256, su extensión y la configuración con la que se procesa."""
+        extension = os.path.splitext(filename)[1].lower()
+        config = json.dumps([CACHE_VERSION, digest, extension, tokenizer], sort_keys=True)
+        return hashlib.sha256(config.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key: str) -> Optional[PreparedDocument]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                prepared = _decode(entry)
+            os.utime(path)
+        except FileNotFoundError:
+            CACHE_REQUESTS.inc("miss")
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Entrada de caché inválida {path}: {e}")
+            self._remove(path)
+            CACHE_REQUESTS.inc("miss")
+            return None
+        CACHE_REQUESTS.inc("hit")
+        return prepared
+
+    def put(self, key: str, prepared: PreparedDocument):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **_encode(prepared))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error guardando documento en caché: {e}")
+            self._remove(tmp_path)
+            return
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(ENTRY_SUFFIX):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(os.path.join(self.directory, name))
+                total -= size
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def size(self) -> Tuple[int, int]:
+        """Cantidad de entradas y bytes que ocupan."""
+        if not os.path.isdir(self.directory):
+            return 0, 0
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(ENTRY_SUFFIX)]
+        return len(entries), sum(entry.stat().st_size for entry in entries)
+
+
+def _encode(prepared: PreparedDocument) -> Dict[str, np.ndarray]:
+    terms = sorted({term for tokens in prepared.tokenized_chunks for term in tokens}
+                   | {term for tokens in prepared.sentence_terms for term in tokens})
+    term_ids = {term: term_id for term_id, term in enumerate(terms)}
+    vocab = StringTable.from_strings(terms)
+    chunk_offsets, chunk_tokens = _encode_lists(prepared.tokenized_chunks, term_ids)
+    sentence_offsets, sentence_terms = _encode_lists(prepared.sentence_terms, term_ids)
+    return {
+        'text': np.frombuffer(prepared.text.encode('utf-8'), dtype=np.uint8),
+        'chunk_spans': np.asarray(prepared.chunk_spans, dtype=np.int64).reshape(-1, 2),
+        'sentence_spans': np.asarray(prepared.sentence_spans, dtype=np.int64).reshape(-1, 2),
+        'terms_blob': vocab.blob,
+        'terms_offsets': vocab.offsets,
+        'chunk_offsets': chunk_offsets,
+        'chunk_tokens': chunk_tokens,
+        'sentence_offsets': sentence_offsets,
+        'sentence_terms': sentence_terms
+    }
+
+
+def _encode_lists(lists: List[List[str]], term_ids: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(tokens) for tokens in lists], out=offsets[1:])
+    ids = np.fromiter((term_ids[term] for tokens in lists for term in tokens), dtype=np.int32, count=int(offsets[-1]))
+    return offsets, ids
+
+
+def _decode(entry) -> PreparedDocument:
+    terms = list(StringTable(entry['terms_blob'], entry['terms_offsets']))
+    return PreparedDocument(
+        entry['text'].tobytes().decode('utf-8'),
+        [tuple(span) for span in entry['chunk_spans'].tolist()],
+        _decode_lists(entry['chunk_offsets'], entry['chunk_tokens'], terms),
+        [tuple(span) for span in entry['sentence_spans'].tolist()],
+        _decode_lists(entry['sentence_offsets'], entry['sentence_terms'], terms)
+    )
+
+
+def _decode_lists(offsets: np.ndarray, ids: np.ndarray, terms: List[str]) -> List[List[str]]:
+    tokens = [terms[i] for i in ids.tolist()]
+    offsets = offsets.tolist()
+    return [tokens[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+def cache_size_from_env() -> int:
+    """``DOCUMENT_CACHE_MB`` (512 por defecto; 0 desactiva la caché)."""
+    return int(float(os.getenv("DOCUMENT_CACHE_MB", "512")) * 1024 * 1024)
@@ -1,148 +1,822 @@
+import asyncio
 import json
 import os
-from typing import List, Dict, Tuple
-from rank_bm25 import BM25Okapi
+import shutil
+import threading
+import time
+from types import MappingProxyType
+from typing import List, Dict, Mapping, NamedTuple, Optional, Sequence, Tuple
+
 import numpy as np
-import re
 
-from app.utils.text_utils import clean_text, split_into_chunks, extract_sentences
+from app.services.bm25_index import BM25Index, Segment, balanced_ranges
+from app.services.document_cache import DocumentCache, cache_size_from_env
+from app.services.query_cache import QueryCache
+from app.services.slow_query_log import SlowQueryLog, settings_from_env
+from app.services.index_store import (
+    FORMAT_VERSION, MANIFEST_FILE, SUPPORTED_VERSIONS, append_log, bump_generation, create_index, index_lock,
+    load_index, load_segment, manifest_stamp, read_manifest, rewrite_log, save_segment, segment_number
+)
+from app.utils.text_utils import PreparedDocument, clean_text, extract_phrases, extract_sentences, prepare_document
+from app.utils.metrics import span
+from app.utils.query_executor import get_shard_executor, run_in_query_executor
+from app.utils.tokenizer import default_tokenizer
+
+class IndexSnapshot(NamedTuple):
+    """
+    Estado visible del índice en un instante. Nunca se modifica: cada cambio
+    publica una instantánea nueva reemplazando una sola referencia, así que
+    una consulta que la tomó al empezar ve un índice consistente hasta el final.
+    """
+    index: Optional[BM25Index]
+    # Nombre de cada documento vivo -> (segmento, id local).
+    document_locations: Mapping[str, Tuple[int, int]]
+    # Se incrementa con cada publicación; invalida la caché de consultas.
+    generation: int
+
+EMPTY_SNAPSHOT = IndexSnapshot(None, MappingProxyType({}), 0)
+
+class ParsedQuery(NamedTuple):
+    """Términos de una consulta, los de cada frase entre comillas y cuántos debe tener un chunk."""
+    tokens: List[str]
+    phrases: List[List[str]]
+    # Dos términos, o todos si la consulta tiene uno solo. Se fija antes de
+    # expandir los términos desconocidos: sus reemplazos cuentan como uno.
+    min_matches: int
+    # Para cada token, la posición del término escrito del que sale: los
+    # reemplazos de un término desconocido comparten la suya.
+    groups: List[int]
 
 class DocumentService:    
-    def __init__(self):
-        self.documents = {}  
-        self.chunks = []  
-        self.chunk_metadata = []  
-        self.tokenized_chunks = []  
-        self.bm25 = None  
-        self.index_file = "data/document_index.json"  
+    k1 = 1.2
+    b = 0.75
+    epsilon = 0.25
+    max_segments = 8
+    max_deleted_ratio = 0.3
+    tokenizer = default_tokenizer
+    query_cache_size = 1024
+    query_cache_ttl = 300.0
+    # Los puntajes BM25 se dividen por este factor antes de compararlos con min_score.
+    score_scale = 10.0
+    # Tiempo máximo por defecto (segundos) de las variantes async; None no limita.
+    query_timeout = 10.0
+    # Consultas de un lote que se puntúan juntas en cada tarea del pool de
+    # consultas; si vence el timeout se conservan los grupos ya terminados.
+    query_group_size = 16
+    # Cada commit y cada compactación reparten sus documentos en hasta
+    # ``shard_count`` segmentos; cada consulta puntúa los shards en paralelo.
+    shard_count = int(os.getenv("INDEX_SHARDS", "1"))
+    # Las consultas de varios términos eligen ``proximity_candidates`` veces
+    # top_k chunks por BM25 y los reordenan sumando ``proximity_weight`` veces
+    # el aporte por cercanía de sus términos (hasta ``proximity_window``
+    # tokens de distancia); con peso 0 el orden es el de BM25.
+    proximity_weight = 1.0
+    proximity_window = 5
+    proximity_candidates = 3
+    # Cada término de una consulta que no está en el índice se reemplaza por
+    # hasta ``fuzzy_max_expansions`` términos parecidos (sin tildes o a una
+    # edición, ver ``BM25Index.similar_terms``), salvo con ``fuzzy=False``.
+    fuzzy_max_expansions = 3
+
+    def __init__(self, index_dir: str = "data/index", load: bool = True):
+        self.pending_documents = {}
+        self.index_dir = index_dir
+        self.legacy_index_file = os.path.join(os.path.dirname(index_dir), "document_index.json")
+        self._next_segment = 1
+        # Las lecturas no toman locks: leen ``_snapshot`` una vez y trabajan
+        # con esa instantánea. ``_lock`` solo serializa a quienes publican;
+        # entre procesos, además, se toma ``index_lock`` sobre el directorio.
+        self._snapshot = EMPTY_SNAPSHOT
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        # ``manifest_stamp`` de la versión en disco que refleja ``_snapshot``.
+        self._stamp = None
+        self.query_cache = QueryCache(self.query_cache_size, self.query_cache_ttl)
+        self.slow_query_log = SlowQueryLog(os.path.join(os.path.dirname(index_dir), "slow_queries"), settings_from_env())
+        self.document_cache = DocumentCache(os.path.join(os.path.dirname(index_dir), "document_cache"), cache_size_from_env())
         
-        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
-        self._load_index()
+        # Con ``load=False`` el índice se carga en ``load()``: al arrancar la
+        # aplicación en segundo plano o, si nadie la llamó, en el primer uso.
+        self.ready = threading.Event()
+        self.load_seconds: Optional[float] = None
+        self._load_lock = threading.RLock()
+        self._loading = False
+        self._load_thread: Optional[threading.Thread] = None
+        self._load_thread_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.index_dir), exist_ok=True)
+        if load:
+            self.load()
+
+    def load(self):
+        """
+        Carga el índice desde disco (o lo migra o reconstruye) una sola vez.
+        Si otro hilo ya lo está cargando, espera a que termine.
+        """
+        with self._load_lock:
+            # ``_loading`` cubre la reentrada desde la propia carga: migrar o
+            # reconstruir el índice hace un commit, que también llama a ``load``.
+            if self.ready.is_set() or self._loading:
+                return
+            self._loading = True
+            start = time.perf_counter()
+            try:
+                self._load_index()
+            finally:
+                self._loading = False
+            self.load_seconds = time.perf_counter() - start
+            self.ready.set()
+            print(f"Índice listo en {self.load_seconds:.2f} s")
+
+    def load_in_background(self) -> threading.Thread:
+        """
+        Empieza ``load`` en un hilo aparte; ``ready`` se activa al terminar.
+        Si ya hay una carga en curso devuelve ese hilo en lugar de empezar otra.
+        """
+        with self._load_thread_lock:
+            if self._load_thread is None or not (self._load_thread.is_alive() or self.ready.is_set()):
+                self._load_thread = threading.Thread(target=self.load, name="index-load", daemon=True)
+                self._load_thread.start()
+            return self._load_thread
+
+    @property
+    def bm25(self) -> Optional[BM25Index]:
+        return self.snapshot.index
+
+    @property
+    def snapshot(self) -> IndexSnapshot:
+        """
+        Instantánea vigente. Con varios workers, otro proceso puede haber
+        publicado una generación nueva del índice: se detecta con un ``stat``
+        del manifest y en ese caso se vuelve a mapear el índice desde disco.
+        Si el índice todavía no se cargó, se carga (o se espera a la carga en curso).
+        """
+        if not self.ready.is_set():
+            self.load()
+        if manifest_stamp(self.index_dir) != self._stamp:
+            self._reload()
+        return self._snapshot
+
+    @property
+    def documents(self) -> Dict[str, str]:
+        snapshot = self.snapshot
+        documents = {}
+        for name, (i, doc_id) in snapshot.document_locations.items():
+            documents[name] = snapshot.index.segments[i].document_texts[doc_id]
+        for name, prepared in self.pending_documents.items():
+            documents[name] = prepared.text
+        return documents
+
+    @property
+    def chunks(self) -> List[str]:
+        index = self.snapshot.index
+        chunks = []
+        if index is not None:
+            for seg, live in zip(index.segments, index.live):
+                chunks.extend(seg.chunk_text(i) for i in range(seg.chunk_count) if live is None or live[i])
+        for prepared in self.pending_documents.values():
+            encoded = prepared.text.encode('utf-8')
+            chunks.extend(encoded[start:end].decode('utf-8') for start, end in prepared.chunk_spans)
+        return chunks
         
     def add_document(self, filename: str, text: str):
-        cleaned_text = clean_text(text)
-        self.documents[filename] = cleaned_text
-        doc_chunks = split_into_chunks(cleaned_text, chunk_size=300, overlap=100)
-        
-        for chunk in doc_chunks:
-            if len(chunk.strip()) > 20:  
-                self.chunks.append(chunk)
-                self.chunk_metadata.append({
-                    'document_name': filename,
-                    'text': chunk
-                })
+        self.pending_documents[filename] = self._prepare(text)
+
+    def add_prepared_document(self, filename: str, prepared: PreparedDocument):
+        """Agrega un documento ya limpiado, dividido y tokenizado (por ejemplo, en el pool de procesos)."""
+        self.pending_documents[filename] = prepared
     
+    def _prepare(self, text: str) -> PreparedDocument:
+        return prepare_document(text, tokenizer=self.tokenizer)
+
     def _tokenize(self, text: str) -> List[str]:
-        text_lower = text.lower()
-        tokens = text_lower.replace(',', ' ').replace('.', ' ').replace('!', ' ').replace('?', ' ').split()
-        return [token for token in tokens if len(token) > 2]
+        return self.tokenizer.tokenize(text)
+
+    def _parse_query(self, query: str) -> ParsedQuery:
+        """Tokens de la consulta y los de cada frase entre comillas (las que no tienen ninguno se ignoran)."""
+        tokens = self._tokenize(clean_text(query))
+        phrases = [self._tokenize(clean_text(phrase)) for phrase in extract_phrases(query)]
+        return ParsedQuery(
+            tokens, [phrase for phrase in phrases if phrase], min(2, len(tokens)), list(range(len(tokens)))
+        )
+
+    def _expand_query(self, index: Optional[BM25Index], parsed: ParsedQuery) -> ParsedQuery:
+        """
+        Reemplaza cada término que no está en ``index`` por sus parecidos
+        (``BM25Index.similar_terms``); si no tiene ninguno queda igual. Los
+        términos de las frases no se tocan: una frase pide esas palabras.
+        """
+        if index is None:
+            return parsed
+        in_phrases = {token for phrase in parsed.phrases for token in phrase}
+        tokens, groups = [], []
+        for token, group in zip(parsed.tokens, parsed.groups):
+            if token in in_phrases or index.doc_freq(token) > 0:
+                replacements = [token]
+            else:
+                replacements = index.similar_terms(token, self.fuzzy_max_expansions) or [token]
+            tokens.extend(replacements)
+            groups.extend([group] * len(replacements))
+        return parsed._replace(tokens=tokens, groups=groups)
+
+    def cached_document(self, digest: str, filename: str) -> Optional[PreparedDocument]:
+        """Documento ya procesado de un archivo con el mismo contenido (SHA-256), si está en la caché."""
+        return self.document_cache.get(self.document_cache.key(digest, filename, self.tokenizer.config()))
+
+    def cache_document(self, digest: str, filename: str, prepared: PreparedDocument):
+        self.document_cache.put(self.document_cache.key(digest, filename, self.tokenizer.config()), prepared)
     
     def build_index(self):
-        if not self.chunks:
+        if not self.pending_documents:
             return
-        
-        self.tokenized_chunks = [self._tokenize(chunk) for chunk in self.chunks]
-        self.bm25 = BM25Okapi(self.tokenized_chunks, k1=1.2, b=0.75)
-        self._save_index()
-    
-    def _save_index(self):
+
+        pending, self.pending_documents = self.pending_documents, {}
+        self._commit(pending, deleted_names=list(pending))
+
+    def insert_document(self, filename: str, text: str, prepared: Optional[PreparedDocument] = None):
+        if self.has_document(filename):
+            raise ValueError(f"El documento {filename} ya está indexado")
+        # ``_commit`` lo vuelve a comprobar con el lock tomado: otro request u
+        # otro worker pudo haberlo agregado mientras tanto.
+        self._commit({filename: prepared or self._prepare(text)}, deleted_names=[], new_names=[filename])
+
+    def replace_document(self, filename: str, text: str, prepared: Optional[PreparedDocument] = None) -> bool:
+        replaced = self.has_document(filename)
+        prepared = prepared or self._prepare(text)
+        if replaced and self._indexed_text(self.snapshot, filename) == prepared.text.encode('utf-8'):
+            # El mismo contenido ya está indexado: no se escribe un segmento ni se publica una generación.
+            print(f"Documento {filename} sin cambios")
+            return True
+        self._commit({filename: prepared}, deleted_names=[filename])
+        return replaced
+
+    def delete_document(self, filename: str):
+        if not self.has_document(filename):
+            raise KeyError(filename)
+        self._commit({}, deleted_names=[filename])
+
+    def has_document(self, filename: str) -> bool:
+        return filename in self.snapshot.document_locations
+
+    def is_indexed(self, documents: Dict[str, PreparedDocument]) -> bool:
+        """Si el índice tiene exactamente ``documents``, con los mismos nombres y textos."""
+        snapshot = self.snapshot
+        if self.pending_documents or snapshot.document_locations.keys() != documents.keys():
+            return False
+        return all(
+            self._indexed_text(snapshot, name) == prepared.text.encode('utf-8')
+            for name, prepared in documents.items()
+        )
+
+    def _indexed_text(self, snapshot: IndexSnapshot, filename: str) -> Optional[bytes]:
+        location = snapshot.document_locations.get(filename)
+        if location is None:
+            return None
+        i, doc_id = location
+        return snapshot.index.segments[i].document_texts.raw(doc_id)
+
+    def reset_index(self, documents: Dict[str, PreparedDocument]):
+        """
+        Reemplaza todo el índice por ``documents``. El índice nuevo se arma
+        sin tomar el lock y se publica de una sola vez: mientras tanto las
+        consultas siguen respondiendo con el índice anterior. Si no se puede
+        guardar, la excepción se propaga y se sigue sirviendo el anterior.
+        """
+        segments = self._build_segments(documents)
+        index = self._new_index(segments)
+        with self._lock, index_lock(self.index_dir):
+            # El log se reemplaza de una vez en lugar de borrar el directorio:
+            # los demás workers nunca ven un índice vacío a mitad del cambio.
+            try:
+                with span('persist'):
+                    create_index(self.index_dir, self.tokenizer.config())
+                    names = self._save_segments(segments)
+                    rewrite_log(self.index_dir, [{'op': 'add', 'segment': name} for name in names])
+                    self._publish()
+            except Exception as e:
+                print(f"Error guardando índice: {e}")
+                raise
+            self.pending_documents = {}
+            self._set_index(index)
+            self._remove_unused_segments(keep=names)
+            print(f"Índice guardado en {self.index_dir}")
+
+    def _new_index(self, segments: List[Segment]) -> BM25Index:
+        return BM25Index(segments, k1=self.k1, b=self.b, epsilon=self.epsilon, shard_count=self.shard_count)
+
+    def _build_segments(self, documents: Dict[str, PreparedDocument]) -> List[Segment]:
+        """
+        Divide los documentos en tramos contiguos de tamaño parecido, uno por
+        shard. Al mantener el orden, los ids de chunk son los mismos que con
+        un único segmento y los resultados no dependen de ``shard_count``.
+        """
+        names = list(documents)
+        sizes = [len(documents[name].chunk_spans) for name in names]
+        with span('bm25_build'):
+            return [
+                self._build_segment({name: documents[name] for name in names[part.start:part.stop]})
+                for part in balanced_ranges(sizes, self.shard_count)
+            ]
+
+    def _build_segment(self, documents: Dict[str, PreparedDocument]) -> Segment:
+        document_names = list(documents)
+        chunk_spans, chunk_documents, tokenized_chunks = [], [], []
+        sentence_spans, sentence_documents, sentence_terms = [], [], []
+        for doc_id, prepared in enumerate(documents.values()):
+            chunk_spans.extend(prepared.chunk_spans)
+            chunk_documents.extend([doc_id] * len(prepared.chunk_spans))
+            tokenized_chunks.extend(prepared.tokenized_chunks)
+            sentence_spans.extend(prepared.sentence_spans)
+            sentence_documents.extend([doc_id] * len(prepared.sentence_spans))
+            sentence_terms.extend(prepared.sentence_terms)
+        return Segment.build(
+            document_names,
+            [prepared.text for prepared in documents.values()],
+            chunk_documents,
+            chunk_spans,
+            tokenized_chunks,
+            k1=self.k1,
+            b=self.b,
+            epsilon=self.epsilon,
+            sentences=(sentence_documents, sentence_spans, sentence_terms)
+        )
+
+    def _commit(self, documents: Dict[str, PreparedDocument], deleted_names: List[str],
+                new_names: Sequence[str] = ()):
+        # Un commit solo agrega un segmento nuevo con los documentos recibidos
+        # y marca los reemplazados como borrados; el resto del índice no se
+        # toca. Lanza ``ValueError`` si alguno de ``new_names`` ya está indexado.
+        self.load()
+        segments = self._build_segments(documents)
+
+        with self._lock, index_lock(self.index_dir):
+            # Otro worker pudo haber publicado cambios: el commit se aplica
+            # sobre la última generación en disco, no sobre la que se tenía.
+            self._reload_locked()
+            snapshot = self._snapshot
+            existing = [name for name in new_names if name in snapshot.document_locations]
+            if existing:
+                raise ValueError(f"El documento {existing[0]} ya está indexado")
+            index = snapshot.index or self._new_index([])
+            deleted_names = [name for name in deleted_names if name in snapshot.document_locations]
+            if deleted_names:
+                index = index.without_documents(deleted_names)
+            for segment in segments:
+                index = index.with_segment(segment)
+            self._persist(segments, deleted_names)
+            self._set_index(index)
+
+        self._maybe_compact()
+
+    def _set_index(self, index: Optional[BM25Index]):
+        # Se llama con ``_lock`` tomado. La instantánea se arma completa y se
+        # publica con una sola asignación; una consulta que tomó la anterior
+        # guarda su resultado con la generación vieja y nunca se reutiliza.
+        locations = {} if index is None else {name: (i, doc_id) for i, doc_id, name in index.live_documents()}
+        self._snapshot = IndexSnapshot(index, MappingProxyType(locations), self._snapshot.generation + 1)
+        self.query_cache.clear()
+
+    def _persist(self, segments: List[Segment], deleted_names: List[str]):
+        # Un índice que no quedó en disco no se publica: los demás workers
+        # nunca lo verían y la próxima recarga lo descartaría.
         try:
-            index_data = {
-                'documents': self.documents,
-                'chunks': self.chunks,
-                'chunk_metadata': self.chunk_metadata,
-                'tokenized_chunks': self.tokenized_chunks,
-                'timestamp': str(np.datetime64('now'))
-            }
-            
-            with open(self.index_file, 'w', encoding='utf-8') as f:
-                json.dump(index_data, f, ensure_ascii=False, indent=2)
-                
-            print(f"Índice guardado en {self.index_file}")
-            
+            with span('persist'):
+                create_index(self.index_dir, self.tokenizer.config())
+                records = []
+                if deleted_names:
+                    records.append({'op': 'delete', 'documents': deleted_names})
+                records.extend({'op': 'add', 'segment': name} for name in self._save_segments(segments))
+                append_log(self.index_dir, records)
+                self._publish()
         except Exception as e:
             print(f"Error guardando índice: {e}")
+            raise
+        print(f"Índice guardado en {self.index_dir}")
+
+    def _publish(self):
+        # Con ``index_lock`` tomado y el log ya escrito: los demás workers
+        # verán el manifest nuevo y recargarán; este ya tiene el índice en memoria.
+        bump_generation(self.index_dir, self.tokenizer.config())
+        self._stamp = manifest_stamp(self.index_dir)
+
+    def _save_segments(self, segments: List[Segment]) -> List[str]:
+        names = []
+        for segment in segments:
+            name = self._reserve_segment_name()
+            save_segment(os.path.join(self.index_dir, name), segment, k1=self.k1, b=self.b, epsilon=self.epsilon)
+            names.append(name)
+        return names
+
+    def _reserve_segment_name(self) -> str:
+        # Con ``index_lock`` tomado; otros workers también crean segmentos, así
+        # que el número sale del directorio y no solo del contador propio.
+        existing = [segment_number(entry) for entry in os.listdir(self.index_dir)] if os.path.isdir(self.index_dir) else []
+        self._next_segment = max([self._next_segment - 1] + existing) + 1
+        name = f"seg-{self._next_segment:06d}"
+        self._next_segment += 1
+        return name
+
+    def _reload(self):
+        with self._lock, index_lock(self.index_dir, shared=True):
+            self._reload_locked()
+
+    def _reload_locked(self):
+        """Vuelve a mapear el índice si cambió en disco. Requiere ``_lock`` e ``index_lock``."""
+        stamp = manifest_stamp(self.index_dir)
+        if stamp == self._stamp:
+            return
+        try:
+            manifest = read_manifest(self.index_dir) if stamp is not None else None
+            if manifest is not None and not self._is_compatible(manifest):
+                # Solo pasa si conviven versiones distintas del servicio; se
+                # sigue sirviendo el índice actual en lugar de mezclar tokenizadores.
+                print(f"Índice en {self.index_dir} con otro formato o tokenizador, no se recarga")
+                self._stamp = stamp
+                return
+            with span('index_load'):
+                index = self._load_from_disk() if manifest else None
+        except Exception as e:
+            print(f"Error recargando índice: {e}")
+            return
+        self._stamp = stamp
+        self._set_index(index)
+        print(f"Índice recargado desde {self.index_dir} (generación {manifest.get('generation') if manifest else 0})")
+
+    def _load_from_disk(self) -> Optional[BM25Index]:
+        return load_index(self.index_dir, k1=self.k1, b=self.b, epsilon=self.epsilon, shard_count=self.shard_count)
+
+    def _is_compatible(self, manifest: Dict) -> bool:
+        return manifest.get('format_version') == FORMAT_VERSION and manifest.get('tokenizer') == self.tokenizer.config()
+
+    def _maybe_compact(self):
+        index = self._snapshot.index
+        if index is None or self._compaction_lock.locked():
+            return
+        total_chunks = int(index.chunk_offsets[-1])
+        deleted_ratio = 1 - index.corpus_size / total_chunks if total_chunks else 0.0
+        if max(len(shard) for shard in index.shards) > self.max_segments or deleted_ratio > self.max_deleted_ratio:
+            threading.Thread(target=self.compact_index, daemon=True).start()
+
+    def compact_index(self) -> bool:
+        """
+        Une los segmentos de cada shard en uno y reescribe el log con una
+        entrada por shard. Si mientras tanto hubo otro commit, se descarta el
+        resultado y la compactación se vuelve a intentar tras el siguiente.
+        """
+        with self._compaction_lock:
+            index = self._snapshot.index
+            if index is None or index.is_compact:
+                return False
+
+            try:
+                with span('compaction'):
+                    compacted = index.compacted()
+                with self._lock, index_lock(self.index_dir):
+                    self._reload_locked()
+                    if self._snapshot.index is not index:
+                        return False
+                    with span('persist'):
+                        names = self._save_segments(compacted.segments)
+                        rewrite_log(self.index_dir, [{'op': 'add', 'segment': name} for name in names])
+                        self._publish()
+                    self._set_index(self._new_index(
+                        [load_segment(os.path.join(self.index_dir, name)) for name in names]
+                    ))
+                    self._remove_unused_segments(keep=names)
+                print(f"Índice compactado en {', '.join(names)}")
+                return True
+
+            except Exception as e:
+                print(f"Error compactando índice: {e}")
+                return False
+
+    def _remove_unused_segments(self, keep: List[str]):
+        # Los demás workers pueden seguir leyendo segmentos borrados que tienen
+        # mapeados; en POSIX el archivo sigue accesible hasta que lo sueltan.
+        for entry in os.listdir(self.index_dir):
+            if segment_number(entry) and entry not in keep:
+                shutil.rmtree(os.path.join(self.index_dir, entry), ignore_errors=True)
     
     def _load_index(self):
         try:
-            if os.path.exists(self.index_file):
-                with open(self.index_file, 'r', encoding='utf-8') as f:
-                    index_data = json.load(f)
-                
-                self.documents = index_data.get('documents', {})
-                self.chunks = index_data.get('chunks', [])
-                self.chunk_metadata = index_data.get('chunk_metadata', [])
-                self.tokenized_chunks = index_data.get('tokenized_chunks', [])
-                
-                if self.tokenized_chunks:
-                    self.bm25 = BM25Okapi(self.tokenized_chunks, k1=1.2, b=0.75)
-                    print(f"Índice cargado desde {self.index_file} ({len(self.documents)} documentos)")
+            with index_lock(self.index_dir, shared=True):
+                stamp = manifest_stamp(self.index_dir)
+                with span('index_load'):
+                    index = self._load_from_disk()
+                manifest = read_manifest(self.index_dir)
+            if index is None:
+                if os.path.exists(self.legacy_index_file):
+                    self._migrate_legacy_index()
                 else:
-                    print("Índice cargado pero está vacío")
-            else:
-                print("No existe índice previo, empezando limpio")
+                    print("No existe índice previo, empezando limpio")
+                return
+
+            self._next_segment = max([segment_number(entry) for entry in os.listdir(self.index_dir)] + [0]) + 1
+            if not self._is_compatible(manifest):
+                self._rebuild_index(index)
+                return
+            with self._lock:
+                self._stamp = stamp
+                self._set_index(index)
+            print(f"Índice cargado desde {self.index_dir} ({len(self._snapshot.document_locations)} documentos)")
                 
         except Exception as e:
+            # Se sigue con un índice vacío: la próxima consulta vuelve a
+            # intentar cargarlo (``snapshot`` compara el manifest).
             print(f"Error cargando índice: {e}")
-            self.clear_index()
+            self._discard_corrupt_index()
+
+    def _discard_corrupt_index(self):
+        """
+        Borra el índice solo si, con el lock exclusivo tomado, vuelve a fallar
+        la carga y el problema está en los datos: un manifest ilegible, o uno
+        de una versión soportada cuyo log o segmentos no se pueden leer. Un
+        formato más nuevo (otro worker con una versión posterior durante un
+        despliegue) o un error de E/S no borran nada.
+        """
+        with self._lock, index_lock(self.index_dir):
+            try:
+                manifest = read_manifest(self.index_dir)
+                if manifest is None or manifest.get('format_version') not in SUPPORTED_VERSIONS:
+                    return
+                self._load_from_disk()
+                return
+            except OSError:
+                return
+            except Exception as e:
+                print(f"Índice dañado en {self.index_dir}, se descarta: {e}")
+            self._set_index(None)
+            self._remove_index_files()
+            self._stamp = manifest_stamp(self.index_dir)
+
+    def _rebuild_index(self, index: BM25Index):
+        # Un índice de otro tokenizador o de un formato anterior no sirve tal
+        # cual: se vuelven a preparar los textos ya indexados y se escribe de nuevo.
+        documents = {
+            name: self._prepare(index.segments[i].document_texts[doc_id])
+            for i, doc_id, name in index.live_documents()
+        }
+        self.reset_index(documents)
+        print(f"Índice reconstruido ({len(documents)} documentos)")
+
+    def _migrate_legacy_index(self):
+        with open(self.legacy_index_file, 'r', encoding='utf-8') as f:
+            index_data = json.load(f)
+
+        # El chunker actual produce los mismos chunks que el anterior, así que
+        # alcanza con volver a preparar el texto de cada documento.
+        documents = {
+            filename: self._prepare(text) for filename, text in index_data.get('documents', {}).items()
+        }
+
+        self._commit(documents, deleted_names=[])
+        os.remove(self.legacy_index_file)
+        print(f"Índice JSON migrado a {self.index_dir} ({len(documents)} documentos)")
     
-    def search(self, query: str, top_k: int = 5, min_score: float = 0.25) -> List[Dict]:
-        if not self.bm25 or not self.chunks:
-            return []
-        
-        cleaned_query = clean_text(query)
-        tokenized_query = self._tokenize(cleaned_query)
-        scores = self.bm25.get_scores(tokenized_query)
-        top_indices = np.argsort(scores)[::-1][:top_k]
-        results = []
-        for idx in top_indices:
-            score = scores[idx]
-            normalized_score = float(score) / 10.0
-            chunk_text = self.chunk_metadata[idx]['text'].lower()
-            keyword_matches = sum(1 for word in tokenized_query if word in chunk_text)
-            phrase_match = cleaned_query.lower() in chunk_text
-            if normalized_score >= min_score and (keyword_matches >= 2 or phrase_match):
-                results.append({
-                    'text': self.chunk_metadata[idx]['text'],
-                    'document_name': self.chunk_metadata[idx]['document_name'],
-                    'relevance_score': normalized_score
-                })
-        return results
+    def search(self, query: str, top_k: int = 5, min_score: float = 0.25, fuzzy: bool = True) -> List[Dict]:
+        return self.search_batch([query], top_k, min_score, fuzzy=fuzzy)[0]
+
+    def search_batch(self, queries: List[str], top_k: int = 5, min_score: float = 0.25,
+                     deadline: Optional[float] = None, fuzzy: bool = True) -> List[List[Dict]]:
+        """
+        Busca varias consultas con una sola pasada de puntuación sobre el
+        índice. Devuelve los resultados en el orden de ``queries``. Lanza
+        ``TimeoutError`` si se alcanza ``deadline`` (``time.monotonic``).
+        Una frase entre comillas solo encuentra chunks con sus términos
+        seguidos; con ``fuzzy`` los términos que no están en el índice se
+        reemplazan por sus parecidos.
+        """
+        with self.slow_query_log.trace('search', queries) as trace:
+            index, _, generation = self.snapshot
+            parsed_queries = self._parse_queries(index, queries, fuzzy)
+            keys = [('search', *self._cache_key(parsed), top_k, min_score) for parsed in parsed_queries]
+            trace.set_tokens(index, [parsed.tokens for parsed in parsed_queries])
+            results = [self.query_cache.get(key, generation) for key in keys]
+
+            missing = [i for i, result in enumerate(results) if result is None]
+            if missing:
+                batch_hits = self._search_hits(index, [parsed_queries[i] for i in missing], top_k, min_score, deadline)
+                for i, hits in zip(missing, batch_hits):
+                    results[i] = [
+                        {'text': text, 'document_name': document_name, 'relevance_score': score,
+                         'other_documents': other_documents}
+                        for _, text, document_name, score, other_documents in hits
+                    ]
+                    self.query_cache.put(keys[i], results[i], generation)
+            return [[dict(result) for result in query_results] for query_results in results]
+
+    def _parse_queries(self, index: Optional[BM25Index], queries: List[str], fuzzy: bool) -> List[ParsedQuery]:
+        with span('query_tokenize'):
+            parsed_queries = [self._parse_query(query) for query in queries]
+        if fuzzy:
+            with span('query_expand'):
+                parsed_queries = [self._expand_query(index, parsed) for parsed in parsed_queries]
+        return parsed_queries
+
+    @staticmethod
+    def _cache_key(parsed: ParsedQuery) -> Tuple:
+        # Con los términos ya expandidos: con o sin ``fuzzy`` una consulta
+        # sin términos desconocidos comparte la entrada de la caché.
+        return tuple(parsed.tokens), tuple(map(tuple, parsed.phrases)), parsed.min_matches, tuple(parsed.groups)
+
+    def _search_hits(self, index: Optional[BM25Index], parsed_queries: List[ParsedQuery],
+                     top_k: int, min_score: float,
+                     deadline: Optional[float] = None) -> List[List[Tuple[int, str, str, float, List[str]]]]:
+        """
+        Chunks que pasan el filtro de búsqueda de cada consulta (tokens,
+        frases), como (id, texto, documento, puntaje normalizado, otros
+        documentos con el mismo texto).
+        """
+        if not index or not index.corpus_size:
+            return [[] for _ in parsed_queries]
+
+        # Un chunk debe contener al menos dos términos de la consulta, o todos
+        # si la consulta tiene uno solo; los reemplazos de un término
+        # desconocido cuentan como uno (``groups``). El conteo sale de los postings, así
+        # que compara términos completos y se aplica dentro de la puntuación,
+        # antes de elegir el top k; después solo se lee el texto de los elegidos.
+        batch_hits = [[] for _ in parsed_queries]
+        pending = list(range(len(parsed_queries)))
+        k = top_k
+        while pending:
+            with span('query_score'):
+                top_results = self._top_k(index, [parsed_queries[i] for i in pending], top_k, k,
+                                          min_score * self.score_scale, deadline)
+            with span('query_hits'):
+                retry = []
+                for i, (top_indices, top_scores) in zip(pending, top_results):
+                    batch_hits[i] = self._distinct_hits(index, top_indices, top_scores, top_k)
+                    # Si se descartaron chunks repetidos y puede haber más, se
+                    # vuelve a pedir el doble para completar el top k.
+                    if len(batch_hits[i]) < top_k and len(top_indices) == k:
+                        retry.append(i)
+            pending = retry
+            k *= 2
+        return batch_hits
+
+    def _top_k(self, index: BM25Index, parsed_queries: List[ParsedQuery], top_k: int, k: int,
+               min_score: float, deadline: Optional[float]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Los ``k`` mejores chunks de cada consulta (``k`` crece por encima de
+        ``top_k`` al reintentar porque había repetidos). Las que tienen
+        frases solo puntúan los chunks que las contienen
+        (``BM25Index.top_k_phrases``); las demás se puntúan juntas.
+
+        Se reordenan por cercanía de los términos siempre los mismos
+        ``top_k * proximity_candidates`` mejores por BM25, así que el orden
+        no depende de cuántas veces se reintentó. Si ``k`` es mayor, el resto
+        sigue en el orden de BM25, detrás de los reordenados.
+        """
+        pool = top_k * self.proximity_candidates if self.proximity_weight > 0 else top_k
+        fetch = max(k, pool)
+        results = [None] * len(parsed_queries)
+        plain = [i for i, parsed in enumerate(parsed_queries) if not parsed.phrases]
+        if plain:
+            plain_results = index.top_k_batch(
+                [parsed_queries[i].tokens for i in plain], fetch,
+                min_matches=[parsed_queries[i].min_matches for i in plain],
+                groups=[parsed_queries[i].groups for i in plain],
+                min_score=min_score,
+                deadline=deadline,
+                executor=get_shard_executor() if len(index.shards) > 1 else None
+            )
+            for i, result in zip(plain, plain_results):
+                results[i] = result
+        for i, (tokens, phrases, min_matches, groups) in enumerate(parsed_queries):
+            if phrases:
+                results[i] = index.top_k_phrases(tokens, phrases, fetch, min_matches, min_score, deadline, groups)
+        reranked = []
+        for parsed, (ids, scores) in zip(parsed_queries, results):
+            top_ids, top_scores = index.rerank_by_proximity(
+                parsed.tokens, ids[:pool], scores[:pool], min(k, pool), self.proximity_weight, self.proximity_window
+            )
+            if k > pool:
+                top_ids = np.concatenate([top_ids, ids[pool:k]])
+                top_scores = np.concatenate([top_scores, scores[pool:k]])
+            reranked.append((top_ids, top_scores))
+        return reranked
+
+    def _distinct_hits(self, index: BM25Index, top_indices: np.ndarray, top_scores: np.ndarray,
+                       top_k: int) -> List[Tuple[int, str, str, float, List[str]]]:
+        # Un texto repetido en varios documentos (o en varios lugares de uno)
+        # ocupa un solo lugar del top k, con el primer chunk encontrado; los
+        # demás documentos quedan como atribución. Los postings siguen siendo
+        # por documento, así que los puntajes no dependen de los repetidos.
+        hits = []
+        positions = {}
+        for idx, score in zip(top_indices, top_scores):
+            chunk, document_name = index.chunk(idx)
+            position = positions.get(chunk)
+            if position is not None:
+                hit = hits[position]
+                if document_name != hit[2] and document_name not in hit[4]:
+                    hit[4].append(document_name)
+            elif len(hits) < top_k:
+                positions[chunk] = len(hits)
+                hits.append((int(idx), chunk, document_name, float(score) / self.score_scale, []))
+        return hits
     
-    def answer_question(self, question: str) -> Tuple[str, List[Dict]]:
-        search_results = self.search(question, top_k=5, min_score=0.15)
-        if not search_results:
-            return "No encuentro esa información en los documentos cargados.", []
+    def answer_question(self, question: str, top_k: int = 5, min_score: float = 0.15,
+                        fuzzy: bool = True) -> Tuple[str, List[Dict]]:
+        return self.answer_batch([question], top_k, min_score, fuzzy=fuzzy)[0]
+
+    def answer_batch(self, questions: List[str], top_k: int = 5, min_score: float = 0.15,
+                     deadline: Optional[float] = None, fuzzy: bool = True) -> List[Tuple[str, List[Dict]]]:
+        """Responde varias preguntas puntuándolas juntas; las respuestas siguen el orden de ``questions``."""
+        with self.slow_query_log.trace('ask', questions) as trace:
+            index, _, generation = self.snapshot
+            parsed_questions = self._parse_queries(index, questions, fuzzy)
+            keys = [('ask', *self._cache_key(parsed), top_k, min_score) for parsed in parsed_questions]
+            trace.set_tokens(index, [parsed.tokens for parsed in parsed_questions])
+            answers = [self.query_cache.get(key, generation) for key in keys]
 
-        question_tokens = set(self._tokenize(clean_text(question)))
+            missing = [i for i, answer in enumerate(answers) if answer is None]
+            if missing:
+                batch_hits = self._search_hits(index, [parsed_questions[i] for i in missing], top_k, min_score, deadline)
+                for i, hits in zip(missing, batch_hits):
+                    with span('answer_select'):
+                        answers[i] = self._answer_from_hits(index, parsed_questions[i].tokens, hits)
+                    self.query_cache.put(keys[i], answers[i], generation)
+            return [(answer, [dict(citation) for citation in citations]) for answer, citations in answers]
 
-        best_sentence = ""
+    async def search_async(self, query: str, top_k: int = 5, min_score: float = 0.25,
+                           timeout: Optional[float] = None, fuzzy: bool = True) -> Optional[List[Dict]]:
+        """Como ``search`` pero fuera del event loop; devuelve ``None`` si vence el timeout."""
+        return (await self.search_batch_async([query], top_k, min_score, timeout, fuzzy))[0]
+
+    async def search_batch_async(self, queries: List[str], top_k: int = 5, min_score: float = 0.25,
+                                 timeout: Optional[float] = None, fuzzy: bool = True) -> List[Optional[List[Dict]]]:
+        return await self._run_batch(self.search_batch, queries, top_k, min_score, timeout, fuzzy)
+
+    async def answer_question_async(self, question: str, top_k: int = 5, min_score: float = 0.15,
+                                    timeout: Optional[float] = None,
+                                    fuzzy: bool = True) -> Optional[Tuple[str, List[Dict]]]:
+        """Como ``answer_question`` pero fuera del event loop; devuelve ``None`` si vence el timeout."""
+        return (await self.answer_batch_async([question], top_k, min_score, timeout, fuzzy))[0]
+
+    async def answer_batch_async(self, questions: List[str], top_k: int = 5, min_score: float = 0.15,
+                                 timeout: Optional[float] = None,
+                                 fuzzy: bool = True) -> List[Optional[Tuple[str, List[Dict]]]]:
+        return await self._run_batch(self.answer_batch, questions, top_k, min_score, timeout, fuzzy)
+
+    async def _run_batch(self, func, items: List[str], top_k: int, min_score: float,
+                         timeout: Optional[float], fuzzy: bool = True) -> List:
+        """
+        Ejecuta ``func`` sobre ``items`` por grupos en el pool de consultas.
+        Al vencer el timeout devuelve los resultados de los grupos terminados
+        y ``None`` en el resto: los grupos pendientes no se llegan a puntuar y
+        el que estaba en curso se corta en el siguiente término.
+        """
+        timeout = self.query_timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        results = [None] * len(items)
+        for start in range(0, len(items), self.query_group_size):
+            group = items[start:start + self.query_group_size]
+            try:
+                results[start:start + len(group)] = await asyncio.wait_for(
+                    run_in_query_executor(func, group, top_k, min_score, deadline=deadline, fuzzy=fuzzy),
+                    None if deadline is None else deadline - time.monotonic()
+                )
+            except TimeoutError:
+                print(f"Consulta cortada por timeout ({timeout}s): {start} de {len(items)} resueltas")
+                break
+        return results
+
+    def _answer_from_hits(self, index: Optional[BM25Index], question_tokens: List[str],
+                          hits: List[Tuple[int, str, str, float, List[str]]]) -> Tuple[str, List[Dict]]:
+        if not hits:
+            return "No encuentro esa información en los documentos cargados.", []
+
+        # Las oraciones de cada chunk y sus términos se calcularon al indexar;
+        # aquí solo se cuentan coincidencias con los términos de la pregunta.
+        question_terms = set(question_tokens)
+        best_sentence = None
         best_score = 0
         citations = []
-        for result in search_results[:3]:
-            sentences = re.split(r'(?<=[.!?])\s+', result['text'])
-            for sentence in sentences:
-                sentence_tokens = set(self._tokenize(sentence))
-                score = len(question_tokens & sentence_tokens)
-                if score > best_score and len(sentence) > 20:
-                    best_score = score
-                    best_sentence = sentence
-                    best_citation = {
-                        'text': sentence.strip(),
-                        'document_name': result['document_name']
-                    }
-            if len(citations) < 3 and sentences:
+        for chunk_id, _, document_name, _, other_documents in hits[:3]:
+            seg, local_id = index.locate(chunk_id)
+            sentence_ids = seg.sentences.chunk_sentences(local_id)
+            if not len(sentence_ids):
+                continue
+            counts = seg.sentences.match_counts(sentence_ids, seg.term_ids(question_terms))
+            top = int(np.argmax(counts))
+            if counts[top] > best_score:
+                best_score = int(counts[top])
+                best_sentence = (seg, sentence_ids[top])
+            if len(citations) < 3:
                 citations.append({
-                    'text': sentences[0].strip(),
-                    'document_name': result['document_name']
+                    'text': seg.sentence_text(sentence_ids[0]),
+                    'document_name': document_name,
+                    'other_documents': other_documents
                 })
 
         if best_sentence:
-            answer = best_sentence.strip()
+            seg, sentence_id = best_sentence
+            answer = seg.sentence_text(sentence_id)
         else:
             answer_parts = []
-            for i, result in enumerate(search_results[:2]):
-                sentences = extract_sentences(result['text'], num_sentences=2)
+            for _, text, _, _, _ in hits[:2]:
+                sentences = extract_sentences(text, num_sentences=2)
                 if sentences:
                     answer_parts.append(sentences)
             answer = " ".join(answer_parts) if answer_parts else "No encuentro información específica sobre esa pregunta en los documentos."
@@ -150,32 +824,46 @@ class DocumentService:
         return answer, citations
     
     def get_document_count(self) -> int:
-        return len(self.documents)
+        return len(self.snapshot.document_locations.keys() | self.pending_documents.keys())
     
     def get_document_names(self) -> List[str]:
-        return list(self.documents.keys())
+        return self._document_names(self.snapshot.document_locations)
+
+    def _document_names(self, locations: Mapping[str, Tuple[int, int]]) -> List[str]:
+        names = list(locations)
+        names.extend(name for name in self.pending_documents if name not in locations)
+        return names
     
     def clear_index(self):
-        self.documents.clear()
-        self.chunks.clear()
-        self.chunk_metadata.clear()
-        self.tokenized_chunks.clear()
-        self.bm25 = None
-        
-        if os.path.exists(self.index_file):
+        with self._lock, index_lock(self.index_dir):
+            self.pending_documents = {}
+            self._set_index(None)
+            self._remove_index_files()
+            self._stamp = manifest_stamp(self.index_dir)
+
+    def _remove_index_files(self):
+        if os.path.exists(self.index_dir):
             try:
-                os.remove(self.index_file)
-                print(f"Índice persistente eliminado: {self.index_file}")
+                shutil.rmtree(self.index_dir)
+                print(f"Índice persistente eliminado: {self.index_dir}")
             except Exception as e:
                 print(f"Error eliminando índice: {e}")
     
     def get_index_info(self) -> Dict:
+        index, locations, generation = self.snapshot
+        names = self._document_names(locations)
         return {
-            'documents_count': len(self.documents),
-            'chunks_count': len(self.chunks),
-            'has_bm25_index': self.bm25 is not None,
-            'index_file_exists': os.path.exists(self.index_file),
-            'document_names': list(self.documents.keys())
+            'documents_count': len(names),
+            'chunks_count': index.corpus_size if index else 0,
+            'segments_count': len(index.segments) if index else 0,
+            'has_bm25_index': index is not None,
+            'index_file_exists': os.path.exists(os.path.join(self.index_dir, MANIFEST_FILE)),
+            'index_generation': generation,
+            'disk_generation': (read_manifest(self.index_dir) or {}).get('generation', 0),
+            'query_cache': self.query_cache.stats(),
+            'document_names': names
         }
 
-document_service = DocumentService()
\ No newline at end of file
+# Importar el módulo no carga el índice: ``app.main`` lo carga en segundo
+# plano al arrancar y ``/ready`` informa cuándo terminó.
+document_service = DocumentService(load=False)
\ No newline at end of file
@@ -0,0 +1,82 @@
+import zlib
+from typing import Iterable, Optional, Set
+
+import numpy as np
+
+from app.services.postings import _ranges
+from app.utils.tokenizer import fold_accents
+
+
+def deletion_variants(term: str) -> Set[str]:
+    """El término y las variantes que resultan de borrarle una letra."""
+    return {term} | {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def edit_distance(a: str, b: str) -> Optional[int]:
+    """
+    0 si ``a`` y ``b`` son iguales, 1 si están a una edición (una letra
+    insertada, borrada o cambiada, o dos vecinas transpuestas) y ``None``
+    si están más lejos.
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) > 1:
+        return None
+    i = 0
+    while i < len(b) and a[i] == b[i]:
+        i += 1
+    if len(a) > len(b):
+        return 1 if a[i + 1:] == b[i:] else None
+    if a[i + 1:] == b[i + 1:]:
+        return 1
+    if a[i + 1:i + 2] == b[i:i + 1] and a[i:i + 1] == b[i + 1:i + 2] and a[i + 2:] == b[i + 2:]:
+        return 1
+    return None
+
+
+def _key(variant: str) -> int:
+    # 32 bits de hash y el largo arriba: variantes de distinto largo nunca chocan.
+    return zlib.crc32(variant.encode('utf-8')) | len(variant) << 32
+
+
+class FuzzyIndex:
+    """
+    Índice de términos parecidos del vocabulario de un segmento, al estilo
+    SymSpell: por cada término, sin tildes, se guarda la clave de él mismo y
+    de cada variante con una letra borrada. Dos términos a una edición de
+    distancia comparten alguna variante, y dos que solo difieren en las
+    tildes comparten todas. ``keys`` está ordenado y ``terms`` tiene el id
+    del término de cada clave, así que buscar los candidatos de un término
+    es una búsqueda binaria vectorizada de las claves de sus variantes.
+
+    Las claves son un hash: una colisión solo agrega un candidato que se
+    descarta al verificar la distancia con ``edit_distance``.
+    """
+
+    def __init__(self, keys: np.ndarray, terms: np.ndarray):
+        self.keys = keys
+        self.terms = terms
+
+    @classmethod
+    def build(cls, terms: Iterable[str]) -> 'FuzzyIndex':
+        keys, ids = [], []
+        for term_id, term in enumerate(terms):
+            variants = deletion_variants(fold_accents(term))
+            keys.extend(map(_key, variants))
+            ids.extend([term_id] * len(variants))
+        keys = np.array(keys, dtype=np.uint64)
+        order = np.argsort(keys, kind='stable')
+        return cls(keys[order], np.array(ids, dtype=np.int32)[order])
+
+    def candidates(self, term: str) -> np.ndarray:
+        """Ids, sin repetir, de los términos que comparten alguna variante con ``term`` sin tildes."""
+        keys = np.array([_key(variant) for variant in deletion_variants(fold_accents(term))], dtype=np.uint64)
+        starts = np.searchsorted(self.keys, keys, side='left')
+        ends = np.searchsorted(self.keys, keys, side='right')
+        return np.unique(self.terms[_ranges(starts, ends - starts)])
+
+    @property
+    def nbytes(self) -> int:
+        return self.keys.nbytes + self.terms.nbytes
@@ -0,0 +1,356 @@
+import json
+import os
+import re
+import shutil
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.bm25_index import BM25Index, Segment, compute_max_weights
+from app.services.fuzzy_index import FuzzyIndex
+from app.services.postings import CompressedPostings, PostingLists, TermPositions
+from app.services.sentence_index import SentenceIndex
+from app.services.string_table import StringTable, TermDictionary
+from app.utils.text_utils import find_chunk_spans, utf8_spans
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso, alcanza con el lock del servicio.
+    fcntl = None
+
+FORMAT_VERSION = 9
+# La versión 2 guardaba el texto de cada chunk; se sigue leyendo y se
+# convierte a offsets al abrir el segmento. Las versiones 2 y 3 no tienen
+# índice de oraciones y las anteriores a la 5 no tienen las cotas de cada
+# término: se leen para poder reconstruir el índice. La 6 agrega la tabla
+# de filas de los textos de documentos repetidos; la 7 comprime los
+# postings. Las versiones 5 y 6 se leen tal cual, con los postings sin
+# comprimir. La 8 agrega las posiciones de cada término; sin ellas las
+# frases se resuelven solo con los términos y no hay aporte por cercanía.
+# La 9 agrega el índice de términos parecidos; en las anteriores se arma
+# del vocabulario la primera vez que se usa.
+SUPPORTED_VERSIONS = (2, 3, 4, 5, 6, 7, 8, FORMAT_VERSION)
+SENTENCE_SECTIONS = ('documents', 'starts', 'ends', 'term_offsets', 'terms', 'chunk_first', 'chunk_end')
+MANIFEST_FILE = "manifest.json"
+LOG_FILE = "segments.log"
+SEGMENT_PATTERN = re.compile(r'^seg-(\d+)$')
+
+
+def _save_array(directory: str, name: str, array: np.ndarray):
+    np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(array))
+
+
+def _load_array(directory: str, name: str) -> np.ndarray:
+    return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+
+
+def _save_strings(directory: str, name: str, table: StringTable):
+    _save_array(directory, f"{name}.blob", table.blob)
+    _save_array(directory, f"{name}.offsets", table.offsets)
+    if table.rows is not None:
+        _save_array(directory, f"{name}.rows", table.rows)
+
+
+def _load_strings(directory: str, name: str, table_class=StringTable):
+    rows = None
+    if os.path.exists(os.path.join(directory, f"{name}.rows.npy")):
+        rows = _load_array(directory, f"{name}.rows")
+    return table_class(_load_array(directory, f"{name}.blob"), _load_array(directory, f"{name}.offsets"), rows)
+
+
+def _as_table(strings) -> StringTable:
+    return strings if isinstance(strings, StringTable) else StringTable.from_strings(strings)
+
+
+def save_segment(directory: str, segment: Segment, k1: float, b: float, epsilon: float):
+    """
+    Escribe un segmento en formato binario versionado: un manifest JSON con
+    los escalares y un archivo ``.npy`` por sección (diccionario de términos,
+    postings, posiciones, términos parecidos, longitudes, offsets de chunks y
+    tablas de documentos).
+
+    Se escribe en un directorio temporal y se renombra al final, para que un
+    lector nunca vea un segmento a medio escribir.
+    """
+    tmp_directory = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+
+    _save_strings(tmp_directory, "terms", segment.vocab)
+    postings = CompressedPostings.from_postings(segment.postings)
+    _save_array(tmp_directory, "postings.offsets", postings.offsets)
+    _save_array(tmp_directory, "postings.doc_bytes", postings.doc_bytes)
+    _save_array(tmp_directory, "postings.doc_starts", postings.doc_starts)
+    _save_array(tmp_directory, "postings.freqs", postings.frequencies)
+    if segment.positions is not None:
+        _save_array(tmp_directory, "positions.offsets", segment.positions.offsets)
+        _save_array(tmp_directory, "positions.values", segment.positions.values)
+    _save_array(tmp_directory, "fuzzy.keys", segment.fuzzy.keys)
+    _save_array(tmp_directory, "fuzzy.terms", segment.fuzzy.terms)
+    _save_array(tmp_directory, "doc_len", segment.doc_len)
+    _save_array(tmp_directory, "idf", segment.idf)
+    _save_array(tmp_directory, "length_norm", segment.length_norm)
+    _save_array(tmp_directory, "max_weights", segment.max_weights)
+    _save_array(tmp_directory, "chunk_documents", segment.chunk_documents)
+    _save_array(tmp_directory, "chunk_starts", segment.chunk_starts)
+    _save_array(tmp_directory, "chunk_ends", segment.chunk_ends)
+    for section in SENTENCE_SECTIONS:
+        _save_array(tmp_directory, f"sentences.{section}", getattr(segment.sentences, section))
+    _save_strings(tmp_directory, "document_names", _as_table(segment.document_names))
+    _save_strings(tmp_directory, "document_texts", _as_table(segment.document_texts))
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'documents_count': len(segment.document_names),
+        'chunks_count': segment.chunk_count,
+        'terms_count': len(segment.vocab),
+        'avgdl': segment.avgdl,
+        'average_idf': segment.average_idf,
+        'k1': k1,
+        'b': b,
+        'epsilon': epsilon,
+        'timestamp': str(np.datetime64('now'))
+    }
+    with open(os.path.join(tmp_directory, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    os.rename(tmp_directory, directory)
+
+
+def load_segment(directory: str) -> Segment:
+    """
+    Abre un segmento guardado con ``save_segment``. Las secciones numéricas y
+    los bloques de texto se mapean con ``np.memmap``, por lo que el costo de
+    apertura no depende del tamaño del segmento y varios procesos comparten
+    las mismas páginas.
+    """
+    with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest.get('format_version') not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Versión de segmento no soportada: {manifest.get('format_version')}")
+
+    document_texts = _load_strings(directory, "document_texts")
+    chunk_documents = _load_array(directory, "chunk_documents")
+    if manifest['format_version'] == 2:
+        chunk_starts, chunk_ends = _chunk_offsets_from_texts(
+            document_texts, chunk_documents, _load_strings(directory, "chunks")
+        )
+    else:
+        chunk_starts, chunk_ends = _load_array(directory, "chunk_starts"), _load_array(directory, "chunk_ends")
+    sentences = None
+    if manifest['format_version'] >= 4:
+        sentences = SentenceIndex(*(_load_array(directory, f"sentences.{section}") for section in SENTENCE_SECTIONS))
+    offsets = _load_array(directory, "postings.offsets")
+    frequencies = _load_array(directory, "postings.freqs")
+    if manifest['format_version'] >= 7:
+        postings = CompressedPostings(
+            offsets, _load_array(directory, "postings.doc_bytes"), _load_array(directory, "postings.doc_starts"),
+            frequencies
+        )
+    else:
+        postings = PostingLists(offsets, _load_array(directory, "postings.docs"), frequencies)
+    positions = None
+    if manifest['format_version'] >= 8 and os.path.exists(os.path.join(directory, "positions.values.npy")):
+        positions = TermPositions(_load_array(directory, "positions.offsets"), _load_array(directory, "positions.values"))
+    fuzzy = None
+    if manifest['format_version'] >= 9:
+        fuzzy = FuzzyIndex(_load_array(directory, "fuzzy.keys"), _load_array(directory, "fuzzy.terms"))
+    length_norm = _load_array(directory, "length_norm")
+    if manifest['format_version'] >= 5:
+        max_weights = _load_array(directory, "max_weights")
+    else:
+        max_weights = compute_max_weights(offsets, *postings.arrays(), length_norm, manifest['k1'])
+
+    return Segment(
+        _load_strings(directory, "document_names"),
+        document_texts,
+        chunk_documents,
+        chunk_starts,
+        chunk_ends,
+        _load_strings(directory, "terms", TermDictionary),
+        postings,
+        _load_array(directory, "doc_len"),
+        _load_array(directory, "idf"),
+        length_norm,
+        manifest['avgdl'],
+        manifest['average_idf'],
+        max_weights,
+        sentences,
+        positions,
+        fuzzy
+    )
+
+
+def _chunk_offsets_from_texts(document_texts: StringTable, chunk_documents: np.ndarray, chunks: StringTable):
+    chunk_starts = np.zeros(len(chunks), dtype=np.int32)
+    chunk_ends = np.zeros(len(chunks), dtype=np.int32)
+    for doc_id in range(len(document_texts)):
+        chunk_ids = np.flatnonzero(chunk_documents == doc_id)
+        text = document_texts[doc_id]
+        spans = find_chunk_spans(text, [chunks[i] for i in chunk_ids])
+        if spans is None:
+            raise ValueError(f"Chunk fuera del texto de su documento: {doc_id}")
+        for chunk_id, (start, end) in zip(chunk_ids, utf8_spans(text, spans)):
+            chunk_starts[chunk_id], chunk_ends[chunk_id] = start, end
+    return chunk_starts, chunk_ends
+
+
+def create_index(index_dir: str, tokenizer: Optional[Dict] = None):
+    """Crea el directorio del índice y su manifest, con la configuración del tokenizador usado."""
+    os.makedirs(index_dir, exist_ok=True)
+    if not os.path.exists(os.path.join(index_dir, MANIFEST_FILE)):
+        write_manifest(index_dir, {'format_version': FORMAT_VERSION, 'tokenizer': tokenizer, 'generation': 0})
+
+
+def write_manifest(index_dir: str, manifest: Dict):
+    # Se reemplaza con os.replace: el manifest siempre está completo y cada
+    # versión es un inodo nuevo, lo que hace confiable a ``manifest_stamp``.
+    tmp_path = os.path.join(index_dir, f"{MANIFEST_FILE}.tmp-{os.getpid()}")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(index_dir, MANIFEST_FILE))
+
+
+def bump_generation(index_dir: str, tokenizer: Optional[Dict] = None) -> int:
+    """
+    Publica una nueva generación del índice para los demás procesos. Se llama
+    después de escribir el log, con el lock de escritura tomado.
+    """
+    generation = (read_manifest(index_dir) or {}).get('generation', 0) + 1
+    write_manifest(index_dir, {'format_version': FORMAT_VERSION, 'tokenizer': tokenizer, 'generation': generation})
+    return generation
+
+
+def manifest_stamp(index_dir: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Identifica la versión publicada del índice con un solo ``stat`` (inodo,
+    fecha de modificación y tamaño del manifest), sin leerlo. ``None`` si no
+    existe un índice.
+    """
+    try:
+        stat = os.stat(os.path.join(index_dir, MANIFEST_FILE))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+@contextmanager
+def index_lock(index_dir: str, shared: bool = False):
+    """
+    Lock entre procesos sobre el índice: exclusivo para escribir y compartido
+    para leer el log al recargar. El archivo del lock vive junto al
+    directorio del índice para sobrevivir a ``clear_index``. No es reentrante.
+    """
+    if fcntl is None:
+        yield
+        return
+    lock_path = f"{os.path.normpath(index_dir)}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def read_manifest(index_dir: str) -> Optional[Dict]:
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def append_log(index_dir: str, records: List[Dict]):
+    """Agrega operaciones al log de segmentos; cada línea es un registro JSON."""
+    with open(os.path.join(index_dir, LOG_FILE), 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def rewrite_log(index_dir: str, records: List[Dict]):
+    tmp_path = os.path.join(index_dir, f"{LOG_FILE}.tmp-{os.getpid()}")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(index_dir, LOG_FILE))
+
+
+def read_log(index_dir: str) -> List[Dict]:
+    log_path = os.path.join(index_dir, LOG_FILE)
+    if not os.path.exists(log_path):
+        return []
+    records = []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Una línea truncada solo puede ser la última (escritura interrumpida).
+                break
+    return records
+
+
+def segment_number(name: str) -> int:
+    match = SEGMENT_PATTERN.match(name)
+    return int(match.group(1)) if match else 0
+
+
+def load_index(index_dir: str, k1: float = 1.2, b: float = 0.75, epsilon: float = 0.25,
+               shard_count: int = 1) -> Optional[BM25Index]:
+    """
+    Reconstruye el índice reproduciendo el log de segmentos: cada ``add``
+    mapea un segmento desde disco y cada ``delete`` marca documentos como
+    borrados. Devuelve ``None`` si no existe un índice.
+    """
+    manifest = read_manifest(index_dir)
+    if manifest is None:
+        return None
+
+    if manifest.get('format_version') not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Versión de índice no soportada: {manifest.get('format_version')}")
+
+    # Una compactación concurrente puede borrar segmentos que el log leído
+    # todavía menciona; en ese caso se vuelve a leer el log ya reescrito.
+    for attempt in range(3):
+        try:
+            return _replay_log(index_dir, k1, b, epsilon, shard_count)
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+
+
+def _replay_log(index_dir: str, k1: float, b: float, epsilon: float, shard_count: int) -> BM25Index:
+    segments = []
+    deleted_documents = []
+    locations = {}
+    for record in read_log(index_dir):
+        if record['op'] == 'add':
+            segment = load_segment(os.path.join(index_dir, record['segment']))
+            for doc_id, name in enumerate(segment.document_names):
+                locations[name] = (len(segments), doc_id)
+            segments.append(segment)
+            deleted_documents.append(None)
+        elif record['op'] == 'delete':
+            for name in record['documents']:
+                location = locations.pop(name, None)
+                if location is None:
+                    continue
+                i, doc_id = location
+                if deleted_documents[i] is None:
+                    deleted_documents[i] = np.zeros(len(segments[i].document_names), dtype=bool)
+                deleted_documents[i][doc_id] = True
+
+    return BM25Index(segments, deleted_documents, k1, b, epsilon, shard_count)
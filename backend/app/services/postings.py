@@ -0,0 +1,180 @@
+from typing import Tuple
+
+import numpy as np
+
+class PostingLists:
+    """
+    Postings sin comprimir: ids locales de chunk y frecuencias de todos los
+    términos concatenados, en el tramo ``offsets[t]:offsets[t + 1]`` del
+    término ``t``. Es el formato de los segmentos anteriores a la versión 7.
+    """
+
+    def __init__(self, offsets: np.ndarray, docs: np.ndarray, frequencies: np.ndarray):
+        self.offsets = offsets
+        self.docs = docs
+        self.frequencies = frequencies
+
+    def term(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.docs[start:end], self.frequencies[start:end]
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.docs, self.frequencies
+
+    @property
+    def nbytes(self) -> int:
+        return self.docs.nbytes + self.frequencies.nbytes
+
+
+class CompressedPostings:
+    """
+    Postings comprimidos. Los ids de chunk de cada término se guardan como
+    diferencias con el anterior (el primero, con cero) y empaquetados con el
+    ancho más chico, 1, 2 o 4 bytes, que alcanza para la mayor diferencia
+    del término. Como los ids están ordenados las diferencias son chicas:
+    los términos frecuentes ocupan un byte por posting. ``doc_starts[t]`` es
+    el byte donde empieza el término ``t``; el ancho sale de dividir sus
+    bytes por sus postings.
+
+    Las frecuencias se guardan en el entero sin signo más chico que alcanza
+    para la mayor del segmento (casi siempre ``uint8``), indexadas igual que
+    en ``PostingLists``. Decodificar un término es ver sus bytes con el tipo
+    de su ancho y una suma acumulada: no hay bucles en Python.
+    """
+
+    def __init__(self, offsets: np.ndarray, doc_bytes: np.ndarray, doc_starts: np.ndarray, frequencies: np.ndarray):
+        self.offsets = offsets
+        self.doc_bytes = doc_bytes
+        self.doc_starts = doc_starts
+        self.frequencies = frequencies
+
+    @classmethod
+    def encode(cls, offsets: np.ndarray, docs: np.ndarray, frequencies: np.ndarray) -> 'CompressedPostings':
+        offsets = np.asarray(offsets, dtype=np.int64)
+        counts = np.diff(offsets)
+        gaps = _gaps(offsets, np.asarray(docs, dtype=np.int64))
+        largest = np.zeros(len(counts), dtype=np.int64)
+        present = counts > 0
+        if present.any():
+            largest[present] = np.maximum.reduceat(gaps, offsets[:-1][present])
+        widths = np.select([largest < 1 << 8, largest < 1 << 16], [1, 2], 4)
+
+        doc_starts = np.zeros(len(offsets), dtype=np.int64)
+        np.cumsum(widths * counts, out=doc_starts[1:])
+        doc_bytes = np.empty(int(doc_starts[-1]), dtype=np.uint8)
+        for width in WIDTHS:
+            terms = np.flatnonzero((widths == width) & present)
+            if len(terms):
+                selected = gaps[_ranges(offsets[terms], counts[terms])]
+                doc_bytes[_ranges(doc_starts[terms], counts[terms] * width)] = (
+                    selected.astype(WIDTHS[width]).view(np.uint8)
+                )
+        return cls(offsets, doc_bytes, doc_starts, _narrow(frequencies))
+
+    @classmethod
+    def from_postings(cls, postings) -> 'CompressedPostings':
+        if isinstance(postings, cls):
+            return postings
+        return cls.encode(postings.offsets, *postings.arrays())
+
+    def term(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        if start == end:
+            return np.empty(0, dtype=np.int32), self.frequencies[start:end]
+        data = self.doc_bytes[self.doc_starts[term_id]:self.doc_starts[term_id + 1]]
+        gaps = np.asarray(data).view(WIDTHS[len(data) // int(end - start)])
+        return np.cumsum(gaps, dtype=np.int32), self.frequencies[start:end]
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Todos los postings decodificados, como los arreglos de ``PostingLists``."""
+        counts = np.diff(self.offsets)
+        present = counts > 0
+        widths = np.zeros(len(counts), dtype=np.int64)
+        widths[present] = np.diff(self.doc_starts)[present] // counts[present]
+        gaps = np.empty(int(self.offsets[-1]), dtype=np.int64)
+        for width, dtype in WIDTHS.items():
+            terms = np.flatnonzero(widths == width)
+            if len(terms):
+                data = np.asarray(self.doc_bytes)[_ranges(self.doc_starts[terms], counts[terms] * width)]
+                gaps[_ranges(self.offsets[terms], counts[terms])] = data.view(dtype)
+        # La suma acumulada corre sobre todos los términos: se le resta lo
+        # acumulado hasta el comienzo de cada uno.
+        totals = np.cumsum(gaps)
+        before = np.concatenate(([0], totals))[self.offsets[:-1]]
+        return (totals - np.repeat(before, counts)).astype(np.int32), self.frequencies
+
+    @property
+    def nbytes(self) -> int:
+        return self.doc_bytes.nbytes + self.doc_starts.nbytes + self.frequencies.nbytes
+
+
+class TermPositions:
+    """
+    Posiciones de cada término dentro de cada chunk: el número de orden del
+    token entre los tokens indexados del chunk (las stopwords y los tokens
+    cortos no cuentan). Están en el orden de los postings, así que las del
+    término ``t`` son ``values[offsets[t]:offsets[t + 1]]``, ``tf`` valores
+    crecientes por cada posting. Se guardan en el entero sin signo más chico
+    que alcanza para el chunk más largo.
+    """
+
+    def __init__(self, offsets: np.ndarray, values: np.ndarray):
+        self.offsets = offsets
+        self.values = values
+
+    @classmethod
+    def build(cls, posting_offsets: np.ndarray, frequencies: np.ndarray, values: np.ndarray) -> 'TermPositions':
+        """``values`` son las posiciones de todos los postings, en su orden, ``frequencies[j]`` por posting."""
+        totals = np.zeros(len(frequencies) + 1, dtype=np.int64)
+        np.cumsum(frequencies, out=totals[1:])
+        return cls(totals[np.asarray(posting_offsets, dtype=np.int64)], _narrow(values))
+
+    def term(self, term_id: int) -> np.ndarray:
+        return self.values[self.offsets[term_id]:self.offsets[term_id + 1]]
+
+    def select(self, term_id: int, frequencies: np.ndarray, selected: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Posiciones de los postings ``selected`` (índices dentro del término,
+        crecientes) como (posting de cada posición, posición).
+        """
+        starts = np.cumsum(frequencies, dtype=np.int64) - frequencies
+        counts = np.asarray(frequencies[selected], dtype=np.int64)
+        positions = self.term(term_id)[_ranges(starts[selected], counts)]
+        return np.repeat(np.arange(len(selected)), counts), positions.astype(np.int64)
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.values.nbytes
+
+
+# Ancho en bytes de las diferencias de un término -> tipo con que se leen.
+WIDTHS = {1: np.dtype('<u1'), 2: np.dtype('<u2'), 4: np.dtype('<u4')}
+
+
+def _gaps(offsets: np.ndarray, docs: np.ndarray) -> np.ndarray:
+    gaps = np.diff(docs, prepend=0)
+    # Cada término empieza de cero: su primer id se guarda entero.
+    firsts = offsets[:-1][np.diff(offsets) > 0]
+    gaps[firsts] = docs[firsts]
+    return gaps
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenación de ``range(start, start + length)`` para cada par, sin bucles."""
+    nonempty = lengths > 0
+    starts, lengths = np.asarray(starts[nonempty], dtype=np.int64), lengths[nonempty]
+    if not len(lengths):
+        return np.empty(0, dtype=np.int64)
+    steps = np.ones(int(lengths.sum()), dtype=np.int64)
+    steps[0] = starts[0]
+    # Al empezar cada tramo se salta desde el último valor del anterior.
+    steps[np.cumsum(lengths)[:-1]] = starts[1:] - (starts[:-1] + lengths[:-1] - 1)
+    return np.cumsum(steps)
+
+
+def _narrow(values: np.ndarray) -> np.ndarray:
+    maximum = int(values.max()) if len(values) else 0
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if maximum <= np.iinfo(dtype).max:
+            return np.asarray(values).astype(dtype)
+    raise ValueError(f"Frecuencia fuera de rango: {maximum}")
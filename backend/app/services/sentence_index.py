@@ -0,0 +1,116 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+class SentenceIndex:
+    """
+    Oraciones de los documentos de un segmento, precalculadas al indexar
+    para elegir la mejor oración de una respuesta sin regex ni tokenización.
+
+    Cada oración es (``documents``, ``starts``, ``ends``) con offsets de bytes
+    relativos a su documento, y sus términos distintos son ids del vocabulario
+    del segmento en formato CSR (``term_offsets``, ``terms``). El chunk ``i``
+    está formado por las oraciones ``chunk_first[i]:chunk_end[i]``.
+    """
+
+    def __init__(self, documents: np.ndarray, starts: np.ndarray, ends: np.ndarray, term_offsets: np.ndarray,
+                 terms: np.ndarray, chunk_first: np.ndarray, chunk_end: np.ndarray):
+        self.documents = documents
+        self.starts = starts
+        self.ends = ends
+        self.term_offsets = term_offsets
+        self.terms = terms
+        self.chunk_first = chunk_first
+        self.chunk_end = chunk_end
+
+    @classmethod
+    def build(cls, sentence_documents: List[int], sentence_spans: List[Tuple[int, int]],
+              sentence_terms: List[List[str]], term_ids: Dict[str, int], chunk_documents: np.ndarray,
+              chunk_starts: np.ndarray, chunk_ends: np.ndarray):
+        # Los términos que no quedaron en el vocabulario son de oraciones que
+        # no pertenecen a ningún chunk y nunca se consultan.
+        terms_per_sentence = [
+            [term_ids[term] for term in terms if term in term_ids] for terms in sentence_terms
+        ]
+        term_offsets = np.zeros(len(terms_per_sentence) + 1, dtype=np.int64)
+        np.cumsum([len(terms) for terms in terms_per_sentence], out=term_offsets[1:])
+        spans = np.asarray(sentence_spans, dtype=np.int32).reshape(-1, 2)
+        documents = np.asarray(sentence_documents, dtype=np.int32)
+        chunk_first, chunk_end = cls._chunk_ranges(documents, spans[:, 0], chunk_documents, chunk_starts, chunk_ends)
+        return cls(
+            documents, spans[:, 0].copy(), spans[:, 1].copy(), term_offsets,
+            np.fromiter((term for terms in terms_per_sentence for term in terms), dtype=np.int32,
+                        count=int(term_offsets[-1])),
+            chunk_first, chunk_end
+        )
+
+    @classmethod
+    def empty(cls, chunk_count: int):
+        return cls(
+            np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32),
+            np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32),
+            np.zeros(chunk_count, dtype=np.int32), np.zeros(chunk_count, dtype=np.int32)
+        )
+
+    @staticmethod
+    def _chunk_ranges(documents, starts, chunk_documents, chunk_starts, chunk_ends):
+        # Las oraciones están ordenadas por documento y posición; un chunk
+        # abarca las de su documento que empiezan dentro de su rango.
+        keys = documents.astype(np.int64) << 32 | starts
+        chunk_keys = np.asarray(chunk_documents, dtype=np.int64) << 32
+        chunk_first = np.searchsorted(keys, chunk_keys | chunk_starts, side='left').astype(np.int32)
+        chunk_end = np.searchsorted(keys, chunk_keys | chunk_ends, side='left').astype(np.int32)
+        return chunk_first, chunk_end
+
+    @classmethod
+    def merge(cls, parts: Sequence[Tuple['SentenceIndex', np.ndarray, np.ndarray, np.ndarray, np.ndarray]]):
+        """
+        Une los índices de oraciones de varios segmentos. Cada parte es
+        (índice, documentos vivos, chunks vivos, nuevo id de cada documento,
+        nuevo id de cada término).
+        """
+        documents, starts, ends, counts, terms, chunk_first, chunk_end = [], [], [], [], [], [], []
+        sentence_count = 0
+        for sentences, live_documents, live_chunks, document_map, term_map in parts:
+            live = live_documents[sentences.documents]
+            # Nuevo id de cada oración; también vale para los límites exclusivos.
+            sentence_map = np.zeros(len(live) + 1, dtype=np.int64)
+            np.cumsum(live, out=sentence_map[1:])
+            sentence_map += sentence_count
+            sentence_count += int(live.sum())
+
+            lengths = np.diff(sentences.term_offsets)
+            documents.append(document_map[sentences.documents[live]])
+            starts.append(sentences.starts[live])
+            ends.append(sentences.ends[live])
+            counts.append(lengths[live])
+            terms.append(term_map[sentences.terms[np.repeat(live, lengths)]])
+            chunk_first.append(sentence_map[sentences.chunk_first[live_chunks]])
+            chunk_end.append(sentence_map[sentences.chunk_end[live_chunks]])
+
+        term_offsets = np.zeros(sum(len(c) for c in counts) + 1, dtype=np.int64)
+        if counts:
+            np.cumsum(np.concatenate(counts), out=term_offsets[1:])
+        return cls(
+            _concatenate(documents, np.int32), _concatenate(starts, np.int32), _concatenate(ends, np.int32),
+            term_offsets, _concatenate(terms, np.int32), _concatenate(chunk_first, np.int32),
+            _concatenate(chunk_end, np.int32)
+        )
+
+    def chunk_sentences(self, chunk_id: int) -> range:
+        return range(int(self.chunk_first[chunk_id]), int(self.chunk_end[chunk_id]))
+
+    def match_counts(self, sentence_ids: range, term_ids: np.ndarray) -> np.ndarray:
+        """Cuántos de ``term_ids`` contiene cada oración del rango, en una sola pasada vectorizada."""
+        if not len(sentence_ids):
+            return np.zeros(0, dtype=np.int64)
+        bounds = self.term_offsets[sentence_ids.start:sentence_ids.stop + 1]
+        matches = np.isin(self.terms[bounds[0]:bounds[-1]], term_ids)
+        cumulative = np.zeros(len(matches) + 1, dtype=np.int64)
+        np.cumsum(matches, out=cumulative[1:])
+        return cumulative[bounds[1:] - bounds[0]] - cumulative[bounds[:-1] - bounds[0]]
+
+
+def _concatenate(arrays: List[np.ndarray], dtype) -> np.ndarray:
+    return np.concatenate(arrays).astype(dtype) if arrays else np.empty(0, dtype=dtype)
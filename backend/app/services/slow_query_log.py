@@ -0,0 +1,321 @@
+import collections
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional
+
+from app.utils.metrics import Counter, registry, start_trace, stop_trace
+
+PROFILE_MODES = ('off', 'cprofile', 'sampling')
+PROFILE_SUFFIXES = ('.prof', '.folded')
+SETTINGS_FILE = "settings.json"
+
+SLOW_QUERIES = registry.register(Counter(
+    "qa_slow_queries_total", "Llamadas de búsqueda o respuesta que superaron el umbral de consulta lenta.", ("kind",)
+))
+
+
+class SlowQuerySettings(NamedTuple):
+    # Segundos a partir de los que una llamada se registra; None no registra nada.
+    threshold: Optional[float]
+    profile: str = 'off'
+    # Perfiles que se conservan en el directorio; se borran los más viejos.
+    max_profiles: int = 20
+
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo: un hilo toma cada ``interval`` segundos la pila
+    de los hilos registrados con ``sys._current_frames``. No instrumenta cada
+    llamada como cProfile, así que el costo no depende del código perfilado.
+    Las pilas se cuentan en formato "colapsado" (``a;b;c cantidad``), el que
+    usan flamegraph.pl y speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._active: Dict[int, collections.Counter] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> collections.Counter:
+        stacks = collections.Counter()
+        with self._lock:
+            self._active[threading.get_ident()] = stacks
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        return stacks
+
+    def stop(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    # Sin consultas perfilándose el hilo termina; el próximo ``start`` lo vuelve a crear.
+                    self._thread = None
+                    return
+                active = list(self._active.items())
+            frames = sys._current_frames()
+            for ident, stacks in active:
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[_collapse(frame)] += 1
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class QueryTrace:
+    """
+    Mide una llamada de ``search_batch`` o ``answer_batch``: el tiempo total,
+    el de cada etapa y, si está activado, un perfil. Al salir, si la llamada
+    superó el umbral, la registra en ``SlowQueryLog``.
+    """
+
+    __slots__ = ('log', 'kind', 'queries', 'settings', 'index', 'tokenized', 'stages', 'profiler', 'stacks', 'start')
+
+    def __init__(self, log: 'SlowQueryLog', kind: str, queries: List[str], settings: SlowQuerySettings):
+        self.log = log
+        self.kind = kind
+        self.queries = queries
+        self.settings = settings
+        self.index = None
+        self.tokenized = None
+        self.profiler = None
+        self.stacks = None
+
+    def set_tokens(self, index, tokenized: List[List[str]]):
+        self.index = index
+        self.tokenized = tokenized
+
+    def __enter__(self):
+        self.stages = start_trace()
+        if self.settings.profile == 'cprofile':
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # Ya hay otro perfilador activo en este hilo.
+                self.profiler = None
+        elif self.settings.profile == 'sampling':
+            self.stacks = self.log.sampler.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        stop_trace()
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.stacks is not None:
+            self.log.sampler.stop()
+        if elapsed >= self.settings.threshold:
+            self.log.record(self, elapsed)
+        return False
+
+
+class _NoTrace:
+    """Traza vacía para cuando el registro está desactivado: no mide nada."""
+
+    def set_tokens(self, index, tokenized):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NO_TRACE = _NoTrace()
+
+
+class SlowQueryLog:
+    """
+    Registro de consultas lentas. Cada llamada que supera el umbral se
+    imprime con el tiempo de cada etapa, la cantidad de tokens y de chunks
+    candidatos de sus consultas, y queda entre las últimas ``recent_size``
+    para el endpoint de administración. Con ``profile`` se guarda además un
+    perfil de la llamada (cProfile o por muestreo) en ``directory``.
+
+    La configuración que se cambia en tiempo de ejecución se escribe en
+    ``settings.json`` dentro de ``directory``: con varios workers, cada uno
+    la vuelve a leer cuando cambia el archivo, como hace con el manifest.
+    """
+
+    recent_size = 50
+    # Cada cuánto se revisa ``settings.json`` como máximo, en segundos.
+    check_interval = 1.0
+    # Consultas de un lote que se detallan en el registro.
+    detailed_queries = 10
+
+    def __init__(self, directory: str, defaults: SlowQuerySettings):
+        self.directory = directory
+        self.defaults = defaults
+        self.settings = defaults
+        self.recent = collections.deque(maxlen=self.recent_size)
+        self.sampler = SamplingProfiler()
+        self._stamp = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+
+    @property
+    def settings_file(self) -> str:
+        return os.path.join(self.directory, SETTINGS_FILE)
+
+    def trace(self, kind: str, queries: List[str]):
+        settings = self.current_settings()
+        if settings.threshold is None:
+            return NO_TRACE
+        return QueryTrace(self, kind, queries, settings)
+
+    def current_settings(self) -> SlowQuerySettings:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self._refresh()
+        return self.settings
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.settings_file)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._stamp:
+            return
+        try:
+            settings = self.defaults
+            if stamp is not None:
+                with open(self.settings_file, 'r', encoding='utf-8') as f:
+                    settings = validate_settings(settings._replace(**json.load(f)))
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Error leyendo {self.settings_file}: {e}")
+            return
+        self._stamp = stamp
+        self.settings = settings
+
+    def update(self, **changes) -> SlowQuerySettings:
+        """
+        Cambia la configuración y la guarda para los demás workers. Lanza
+        ``ValueError`` si algún valor no es válido.
+        """
+        with self._lock:
+            self._refresh()
+            settings = validate_settings(self.settings._replace(**changes))
+            os.makedirs(self.directory, exist_ok=True)
+            temporary = f"{self.settings_file}.{os.getpid()}.tmp"
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump(settings._asdict(), f)
+            os.replace(temporary, self.settings_file)
+            self.settings = settings
+            self._checked_at = float('-inf')
+        print(f"Registro de consultas lentas: umbral {settings.threshold}s, perfil {settings.profile}")
+        return settings
+
+    def reset(self) -> SlowQuerySettings:
+        """Vuelve a la configuración del entorno en todos los workers."""
+        with self._lock:
+            if os.path.exists(self.settings_file):
+                os.remove(self.settings_file)
+            self._stamp = None
+            self.settings = self.defaults
+            self._checked_at = float('-inf')
+        return self.defaults
+
+    def record(self, trace: QueryTrace, elapsed: float):
+        stages = collections.defaultdict(float)
+        for (stage, *_), seconds in trace.stages:
+            stages[stage] += seconds
+        stages['other'] = max(0.0, elapsed - sum(stages.values()))
+
+        queries = []
+        for i, text in enumerate(trace.queries[:self.detailed_queries]):
+            tokens = trace.tokenized[i] if trace.tokenized is not None else []
+            queries.append({
+                'text': text[:200],
+                'tokens': len(tokens),
+                'candidates': trace.index.candidate_count(tokens) if trace.index is not None and tokens else 0
+            })
+
+        entry = {
+            'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'kind': trace.kind,
+            'seconds': round(elapsed, 4),
+            'batch_size': len(trace.queries),
+            'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()},
+            'queries': queries,
+            'profile': self._save_profile(trace)
+        }
+        self.recent.append(entry)
+        SLOW_QUERIES.inc(trace.kind)
+        print(f"Consulta lenta ({trace.kind}, {elapsed:.3f}s): {json.dumps(entry, ensure_ascii=False)}")
+
+    def _save_profile(self, trace: QueryTrace) -> Optional[str]:
+        if trace.profiler is None and trace.stacks is None:
+            return None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}-{trace.kind}"
+            if trace.profiler is not None:
+                path = os.path.join(self.directory, name + '.prof')
+                trace.profiler.dump_stats(path)
+            else:
+                path = os.path.join(self.directory, name + '.folded')
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.writelines(f"{stack} {count}\n" for stack, count in trace.stacks.most_common())
+            self._rotate(trace.settings.max_profiles)
+            return path
+        except OSError as e:
+            print(f"Error guardando perfil de consulta lenta: {e}")
+            return None
+
+    def _rotate(self, max_profiles: int):
+        # Los nombres empiezan con la fecha, así que el orden alfabético es el cronológico.
+        profiles = sorted(entry for entry in os.listdir(self.directory) if entry.endswith(PROFILE_SUFFIXES))
+        for entry in profiles[:max(0, len(profiles) - max_profiles)]:
+            try:
+                os.remove(os.path.join(self.directory, entry))
+            except FileNotFoundError:
+                pass
+
+    def profiles(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(entry for entry in os.listdir(self.directory) if entry.endswith(PROFILE_SUFFIXES))
+
+
+def validate_settings(settings: SlowQuerySettings) -> SlowQuerySettings:
+    threshold, profile, max_profiles = settings
+    if threshold is not None and (not isinstance(threshold, (int, float)) or threshold < 0):
+        raise ValueError(f"Umbral inválido: {threshold}")
+    if profile not in PROFILE_MODES:
+        raise ValueError(f"Perfil inválido: {profile}. Opciones: {', '.join(PROFILE_MODES)}")
+    if not isinstance(max_profiles, int) or max_profiles < 0:
+        raise ValueError(f"Cantidad de perfiles inválida: {max_profiles}")
+    return SlowQuerySettings(None if threshold is None else float(threshold), profile, max_profiles)
+
+
+def settings_from_env() -> SlowQuerySettings:
+    """``SLOW_QUERY_SECONDS`` (``off`` desactiva), ``SLOW_QUERY_PROFILE`` y ``SLOW_QUERY_MAX_PROFILES``."""
+    threshold = os.getenv("SLOW_QUERY_SECONDS", "1.0")
+    return validate_settings(SlowQuerySettings(
+        None if threshold.lower() in ("", "off") else float(threshold),
+        os.getenv("SLOW_QUERY_PROFILE", "off"),
+        int(os.getenv("SLOW_QUERY_MAX_PROFILES", "20"))
+    ))
@@ -0,0 +1,111 @@
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class StringTable(Sequence):
+    """
+    Secuencia inmutable de cadenas guardada como un único bloque UTF-8 más
+    una tabla de offsets. Ambos arreglos pueden venir de ``np.memmap``, así
+    que leer la tabla desde disco no copia ni decodifica nada por adelantado.
+
+    Con ``rows`` la cadena ``i`` es la fila ``rows[i]`` del bloque: las
+    cadenas repetidas se guardan una sola vez.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray, rows: Optional[np.ndarray] = None):
+        self.blob = blob
+        self.offsets = offsets
+        self.rows = rows
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str], deduplicate: bool = False):
+        return cls.from_bytes((s.encode('utf-8') for s in strings), deduplicate)
+
+    @classmethod
+    def from_bytes(cls, encoded: Iterable[bytes], deduplicate: bool = False):
+        encoded = list(encoded)
+        rows = None
+        if deduplicate:
+            unique = {}
+            rows = np.fromiter((unique.setdefault(e, len(unique)) for e in encoded), dtype=np.int64, count=len(encoded))
+            if len(unique) == len(encoded):
+                rows = None
+            encoded = list(unique)
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(blob, offsets, rows)
+
+    def _row(self, index: int) -> int:
+        return index if self.rows is None else int(self.rows[index])
+
+    def raw(self, index: int) -> bytes:
+        row = self._row(index)
+        return self.blob[self.offsets[row]:self.offsets[row + 1]].tobytes()
+
+    def substring(self, index: int, start: int, end: int) -> str:
+        """Decodifica solo los bytes ``start:end`` de la cadena ``index``, sin leer el resto."""
+        base = int(self.offsets[self._row(index)])
+        return self.blob[base + start:base + end].tobytes().decode('utf-8')
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.raw(index).decode('utf-8')
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1 if self.rows is None else len(self.rows)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self.raw(i).decode('utf-8')
+
+
+class TermDictionary(StringTable):
+    """
+    Tabla de términos ordenada: el id de un término es su posición, y la
+    búsqueda es binaria sobre el bloque de bytes. El orden de bytes UTF-8
+    coincide con el orden de ``sorted`` sobre ``str``.
+    """
+
+    def get(self, term: str, default: Optional[int] = None) -> Optional[int]:
+        key = term.encode('utf-8')
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.raw(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self.raw(low) == key:
+            return low
+        return default
+
+    def __contains__(self, term) -> bool:
+        return self.get(term) is not None
+
+    def length_groups(self) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Los términos agrupados por largo en bytes: para cada largo, los ids de
+        esos términos y sus bytes como un arreglo ``S<largo>``, ordenado porque
+        la tabla lo está. Permite cruzar vocabularios enteros con
+        ``np.unique`` o ``np.searchsorted`` sin decodificar término por término.
+        """
+        rows = np.arange(len(self)) if self.rows is None else self.rows
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        order = np.argsort(lengths, kind='stable')
+        groups = {}
+        for ids in np.split(order, np.flatnonzero(np.diff(lengths[order])) + 1):
+            width = int(lengths[ids[0]]) if len(ids) else 0
+            if width == 0:
+                continue
+            keys = np.asarray(self.blob)[starts[ids, None] + np.arange(width)]
+            groups[width] = (ids, keys.view(f'S{width}').ravel())
+        return groups
+
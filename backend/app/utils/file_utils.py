@@ -1,39 +1,125 @@
-import PyPDF2
-from typing import Dict, List
+import asyncio
+import codecs
+import hashlib
+import os
+import tempfile
+from typing import Dict, List, Tuple
 from fastapi import UploadFile, HTTPException
 
-async def extract_text_from_file(file: UploadFile) -> str:
-    filename = file.filename.lower()
-    content = await file.read()
-    
+from app.utils.metrics import span
+from app.utils.process_pool import run_in_process_pool
+
+PDF_PAGES_PER_TASK = 20
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+class FileTooLargeError(ValueError):
+    pass
+
+async def spool_upload(file: UploadFile, max_size_mb: int = 10) -> str:
+    """
+    Copia el archivo subido a un temporal en disco por bloques, sin cargarlo
+    entero en memoria, y corta apenas se supera el tamaño máximo. Devuelve la
+    ruta del temporal; quien la recibe debe borrarla.
+    """
+    path, _ = await spool_upload_with_digest(file, max_size_mb)
+    return path
+
+async def spool_upload_with_digest(file: UploadFile, max_size_mb: int = 10) -> Tuple[str, str]:
+    """
+    Como ``spool_upload``, pero calcula además el SHA-256 del contenido
+    mientras lo copia. Devuelve (ruta del temporal, hash en hexadecimal).
+    """
+    max_size_bytes = max_size_mb * 1024 * 1024
+    if not validate_file_size(file, max_size_mb):
+        raise FileTooLargeError(file.filename)
+
+    suffix = os.path.splitext(file.filename)[1].lower()
+    spooled = tempfile.NamedTemporaryFile(prefix="upload-", suffix=suffix, delete=False)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with spooled:
+            while True:
+                block = await file.read(UPLOAD_CHUNK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_size_bytes:
+                    raise FileTooLargeError(file.filename)
+                digest.update(block)
+                spooled.write(block)
+    except BaseException:
+        os.remove(spooled.name)
+        raise
+    return spooled.name, digest.hexdigest()
+
+def read_text_file(path: str) -> str:
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    parts = []
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(UPLOAD_CHUNK_SIZE)
+            if not block:
+                break
+            parts.append(decoder.decode(block))
+    parts.append(decoder.decode(b'', final=True))
+    return "".join(parts)
+
+def extract_pdf_pages(path: str, start: int, end: int) -> Tuple[int, str]:
+    """Devuelve el total de páginas del PDF y el texto de las páginas [start, end)."""
+    # PyPDF2 se importa recién con el primer PDF (en los procesos del pool):
+    # no suma al arranque de la aplicación.
+    import PyPDF2
+
+    with open(path, 'rb') as f:
+        pdf_reader = PyPDF2.PdfReader(f)
+        pages = pdf_reader.pages
+        text = "".join(pages[page_num].extract_text() + "\n" for page_num in range(start, min(end, len(pages))))
+        return len(pages), text
+
+async def extract_pdf_text(path: str) -> str:
+    # La primera tarea extrae el primer bloque de páginas y de paso informa el
+    # total; el resto se reparte por rangos entre los procesos del pool. Cada
+    # proceso abre el PDF desde disco, así que los bytes no viajan por pickle.
+    # gather conserva el orden, así que el texto se une igual que antes.
+    page_count, first_pages = await run_in_process_pool(extract_pdf_pages, path, 0, PDF_PAGES_PER_TASK)
+    parts = await asyncio.gather(*(
+        run_in_process_pool(extract_pdf_pages, path, start, start + PDF_PAGES_PER_TASK)
+        for start in range(PDF_PAGES_PER_TASK, page_count, PDF_PAGES_PER_TASK)
+    ))
+    return "".join([first_pages] + [text for _, text in parts])
+
+async def extract_text_from_path(path: str, filename: str) -> str:
     try:
-        if filename.endswith('.txt'):
-            text = content.decode('utf-8', errors='ignore')
+        if filename.lower().endswith('.txt'):
+            with span('extract'):
+                text = await run_in_process_pool(read_text_file, path)
             return text.strip()
             
-        elif filename.endswith('.pdf'):
-            import io
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
-            text = ""
-            
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n"
-                
+        elif filename.lower().endswith('.pdf'):
+            with span('extract'):
+                text = await extract_pdf_text(path)
             return text.strip()
             
         else:
             raise HTTPException(
                 status_code=400,
-                detail=f"Formato no soportado: {filename}. Use .txt o .pdf"
+                detail=f"Formato no soportado: {filename.lower()}. Use .txt o .pdf"
             )
             
     except Exception as e:
         raise HTTPException(
             status_code=400,
-            detail=f"Error procesando archivo {file.filename}: {str(e)}"
+            detail=f"Error procesando archivo {filename}: {str(e)}"
         )
 
+async def extract_text_from_file(file: UploadFile, max_size_mb: int = 10) -> str:
+    path = await spool_upload(file, max_size_mb)
+    try:
+        return await extract_text_from_path(path, file.filename)
+    finally:
+        os.remove(path)
+
 def validate_file(file: UploadFile) -> bool:
     allowed_extensions = ['.txt', '.pdf']
     filename = file.filename.lower()
@@ -0,0 +1,218 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Límites de los buckets en segundos, de medio milisegundo a diez segundos.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Si se pasa, se llama solo al exponer las métricas y devuelve pares
+        # (etiquetas, valor): lo que ya se lleva en otro lado no se duplica.
+        self.callback = callback
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            values = sorted(self.callback())
+        else:
+            with self._lock:
+                values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}" for labels, v in values]
+
+
+class Counter(_Metric):
+    """Contador monótono por combinación de etiquetas."""
+
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Valor instantáneo por combinación de etiquetas."""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    """
+    Histograma acumulativo al estilo Prometheus. Cada observación cuesta una
+    búsqueda binaria y dos sumas bajo un lock; los buckets acumulados se
+    calculan recién al exponer las métricas.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por etiquetas: [conteo por bucket (el último es +Inf)..., suma].
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[position] += 1
+            counts[-1] += value
+
+    def time(self, *labels: str) -> "Span":
+        return Span(self, labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((labels, list(counts)) for labels, counts in self._values.items())
+        lines = []
+        names = self.labelnames + ("le",)
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Span:
+    """Mide la duración de un bloque ``with`` y la observa en un histograma."""
+
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram: Histogram, labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        if _collector.trace is not None:
+            _collector.trace.append((self.labels, elapsed))
+        collected = _collector.spans
+        if collected is not None:
+            collected.append((self.histogram.name, self.labels, elapsed))
+        else:
+            self.histogram.observe(elapsed, *self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"La métrica {metric.name} ya está registrada")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "qa_stage_duration_seconds", "Duración de cada etapa de la ingesta y de las consultas.", ("stage",)
+))
+
+
+def span(stage: str) -> Span:
+    """Mide un bloque como etapa ``stage`` de ``qa_stage_duration_seconds``."""
+    return Span(STAGE_SECONDS, (stage,))
+
+
+class _Collector(threading.local):
+    # En los procesos del pool de ingesta las etapas no se observan en el
+    # registro local, que nadie expone: se juntan y vuelven con el resultado.
+    spans: Optional[List[Tuple[str, Tuple[str, ...], float]]] = None
+    # Etapas de la consulta en curso en este hilo, además de observarlas.
+    trace: Optional[List[Tuple[Tuple[str, ...], float]]] = None
+
+
+_collector = _Collector()
+
+
+def collect_spans(func: Callable, *args, **kwargs):
+    """
+    Ejecuta ``func`` guardando las etapas medidas en lugar de observarlas.
+    Devuelve (resultado, etapas); el proceso que expone las métricas las
+    registra con ``record_spans``. Es serializable para el pool de procesos.
+    """
+    _collector.spans = spans = []
+    try:
+        return func(*args, **kwargs), spans
+    finally:
+        _collector.spans = None
+
+
+def record_spans(spans: Iterable[Tuple[str, Tuple[str, ...], float]]):
+    for name, labels, elapsed in spans:
+        registry.get(name).observe(elapsed, *labels)
+
+
+def start_trace() -> List[Tuple[Tuple[str, ...], float]]:
+    """Empieza a anotar, en este hilo, las etapas medidas (etiquetas, segundos)."""
+    _collector.trace = trace = []
+    return trace
+
+
+def stop_trace():
+    _collector.trace = None
@@ -0,0 +1,39 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_worker_count() -> int:
+    """Cantidad de procesos para ingesta; ``INGEST_WORKERS=0`` ejecuta todo en el proceso actual."""
+    return int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    global _executor
+    if _executor is None and get_worker_count() > 0:
+        _executor = ProcessPoolExecutor(max_workers=get_worker_count())
+    return _executor
+
+
+async def run_in_process_pool(func: Callable, *args, **kwargs):
+    """
+    Ejecuta una función CPU-bound en el pool de procesos sin bloquear el event
+    loop. ``func`` y sus argumentos deben poder serializarse con pickle.
+    """
+    if kwargs:
+        func = functools.partial(func, **kwargs)
+    executor = get_process_pool()
+    if executor is None:
+        return await asyncio.to_thread(func, *args)
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+def shutdown_process_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,66 @@
+import asyncio
+import functools
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+_executor: Optional[ThreadPoolExecutor] = None
+_shard_executor: Optional[ThreadPoolExecutor] = None
+# Un semáforo por event loop: asyncio no permite compartirlos entre loops.
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def get_query_concurrency() -> int:
+    """Cantidad máxima de consultas puntuándose a la vez (``QUERY_WORKERS``)."""
+    return max(1, int(os.getenv("QUERY_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+
+def get_query_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=get_query_concurrency(), thread_name_prefix="query")
+    return _executor
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(get_query_concurrency())
+    return semaphore
+
+
+async def run_in_query_executor(func: Callable, *args, **kwargs):
+    """
+    Ejecuta una consulta CPU-bound en el pool de hilos de consultas sin
+    bloquear el event loop. Las consultas que exceden el límite esperan su
+    turno en el loop, no en la cola del pool, así que una que se cancela
+    por timeout mientras espera nunca llega a ocupar un hilo.
+    """
+    if kwargs:
+        func = functools.partial(func, **kwargs)
+    async with _get_semaphore():
+        return await asyncio.get_running_loop().run_in_executor(get_query_executor(), func, *args)
+
+
+def get_shard_executor() -> ThreadPoolExecutor:
+    """
+    Pool de hilos para puntuar los shards de una consulta en paralelo
+    (``SHARD_WORKERS``). Es distinto del pool de consultas: una consulta que
+    espera a sus shards nunca les quita un hilo.
+    """
+    global _shard_executor
+    if _shard_executor is None:
+        workers = max(1, int(os.getenv("SHARD_WORKERS", str(os.cpu_count() or 1))))
+        _shard_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard")
+    return _shard_executor
+
+
+def shutdown_query_executor():
+    global _executor, _shard_executor
+    for executor in (_executor, _shard_executor):
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    _shard_executor = None
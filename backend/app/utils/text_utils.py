@@ -1,5 +1,11 @@
+import bisect
+import collections
+import itertools
 import re
-from typing import List
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from app.utils.metrics import span
+from app.utils.tokenizer import Tokenizer, default_tokenizer
 
 def clean_text(text: str) -> str:
     text = text.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
@@ -7,48 +13,155 @@ def clean_text(text: str) -> str:
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
 
-def split_into_chunks(text: str, chunk_size: int = 500, overlap: int = 150) -> List[str]:
+# Comillas rectas, tipográficas o angulares; ``clean_text`` las descarta.
+PHRASE_PATTERN = re.compile(r'["“”«»]([^"“”«»]+)["“”«»]')
 
-    if not text:
-        return []
+def extract_phrases(query: str) -> List[str]:
+    """Frases entre comillas de una consulta (``"ciencia de datos"``), en orden."""
+    return PHRASE_PATTERN.findall(query)
+
+SENTENCE_SEPARATOR = re.compile(r'(?<=[.!?])\s+')
+
+def iter_sentence_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """Recorre las oraciones de ``text`` como offsets (inicio, fin), sin espacios en los bordes."""
+    position = 0
+    for separator in itertools.chain(SENTENCE_SEPARATOR.finditer(text), [None]):
+        start = position
+        end = separator.start() if separator else len(text)
+        position = separator.end() if separator else len(text)
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            yield start, end
 
-    sentence_pattern = re.compile(r'(?<=[.!?])\s+')
-    sentences = sentence_pattern.split(text)
-    chunks = []
-    current_chunk = ""
-    i = 0
-
-    while i < len(sentences):
-        sentence = sentences[i].strip()
-        if not sentence:
-            i += 1
-            continue
-
-        if len(current_chunk) + len(sentence) + 1 > chunk_size:
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-            if overlap > 0 and chunks:
-                overlap_sentences = []
-                chunk_sentences = sentence_pattern.split(chunks[-1])
-                total = 0
-                for s in reversed(chunk_sentences):
-                    total += len(s) + 1
-                    overlap_sentences.insert(0, s)
+def iter_chunk_spans(text: str, chunk_size: int = 500, overlap: int = 150,
+                     sentence_spans: Optional[List[Tuple[int, int]]] = None) -> Iterator[Tuple[int, int]]:
+    """
+    Divide el texto en chunks de oraciones completas en una sola pasada y
+    devuelve cada chunk como offsets (inicio, fin) sobre ``text``.
+
+    Mantiene una ventana deslizante de oraciones; al cerrar un chunk conserva
+    las últimas oraciones que suman al menos ``overlap`` caracteres. El texto
+    debe venir de ``clean_text`` (oraciones separadas por un solo espacio)
+    para que ``text[inicio:fin]`` sea exactamente el chunk. Si ya se tienen
+    las oraciones de ``iter_sentence_spans`` se pueden pasar en ``sentence_spans``.
+    """
+    window = collections.deque()
+    # Largo del chunk unido con espacios, más uno: suma de (largo + 1) por oración.
+    window_length = 0
+
+    for start, end in sentence_spans if sentence_spans is not None else iter_sentence_spans(text):
+        length = end - start
+        if window and window_length + length > chunk_size:
+            yield window[0][0], window[-1][1]
+            kept = 0
+            total = 0
+            if overlap > 0:
+                for kept_start, kept_end in reversed(window):
+                    total += kept_end - kept_start + 1
+                    kept += 1
                     if total >= overlap:
                         break
-                current_chunk = " ".join(overlap_sentences)
-            else:
-                current_chunk = ""
-        if current_chunk:
-            current_chunk += " " + sentence
-        else:
-            current_chunk = sentence
-        i += 1
-
-    if current_chunk and len(current_chunk) > 30:
-        chunks.append(current_chunk.strip())
-
-    return chunks
+            while len(window) > kept:
+                dropped_start, dropped_end = window.popleft()
+                window_length -= dropped_end - dropped_start + 1
+
+        window.append((start, end))
+        window_length += length + 1
+
+    if window and window_length - 1 > 30:
+        yield window[0][0], window[-1][1]
+
+def split_into_chunks(text: str, chunk_size: int = 500, overlap: int = 150) -> List[str]:
+    if not text:
+        return []
+    return [text[start:end] for start, end in iter_chunk_spans(text, chunk_size, overlap)]
+
+def tokenize(text: str) -> List[str]:
+    return default_tokenizer.tokenize(text)
+
+def utf8_spans(text: str, spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Convierte offsets de caracteres sobre ``text`` en offsets de bytes sobre su codificación UTF-8."""
+    if text.isascii():
+        return list(spans)
+    positions = sorted({position for span in spans for position in span})
+    byte_offsets = {}
+    previous, byte_position = 0, 0
+    for position in positions:
+        byte_position += len(text[previous:position].encode('utf-8'))
+        byte_offsets[position] = byte_position
+        previous = position
+    return [(byte_offsets[start], byte_offsets[end]) for start, end in spans]
+
+def find_chunk_spans(text: str, chunks: List[str]) -> Optional[List[Tuple[int, int]]]:
+    """
+    Ubica cada chunk dentro de ``text`` (en orden y posiblemente solapados) y
+    devuelve sus offsets de caracteres, o ``None`` si alguno no aparece.
+    """
+    spans = []
+    position = 0
+    for chunk in chunks:
+        start = text.find(chunk, position)
+        if start < 0:
+            return None
+        spans.append((start, start + len(chunk)))
+        position = start
+    return spans
+
+# Las oraciones más cortas nunca se eligen como respuesta.
+ANSWER_SENTENCE_MIN_LENGTH = 20
+
+class PreparedDocument(NamedTuple):
+    """
+    Documento listo para indexar. Chunks y oraciones son offsets de bytes
+    (inicio, fin) sobre ``text`` codificado en UTF-8; ``sentence_terms`` tiene
+    los términos distintos de cada oración candidata a respuesta (vacío si la
+    oración es demasiado corta).
+    """
+    text: str
+    chunk_spans: List[Tuple[int, int]]
+    tokenized_chunks: List[List[str]]
+    sentence_spans: List[Tuple[int, int]]
+    sentence_terms: List[List[str]]
+
+def prepare_document(text: str, chunk_size: int = 300, overlap: int = 100,
+                     tokenizer: Optional[Tokenizer] = None) -> PreparedDocument:
+    """
+    Limpia, divide y tokeniza un documento. Es una función pura y serializable
+    para poder ejecutarla en el pool de procesos de la ingesta.
+    """
+    tokenizer = tokenizer or default_tokenizer
+    with span('clean'):
+        cleaned_text = clean_text(text)
+    with span('chunk'):
+        sentence_spans = list(iter_sentence_spans(cleaned_text))
+        spans = [
+            (start, end)
+            for start, end in iter_chunk_spans(cleaned_text, chunk_size, overlap, sentence_spans)
+            if end - start > 20
+        ]
+
+    # Los chunks se solapan y están hechos de oraciones completas: se tokeniza
+    # cada oración una vez y los tokens de un chunk son los de sus oraciones.
+    with span('tokenize'):
+        sentence_tokens = [tokenizer.tokenize(cleaned_text[start:end]) for start, end in sentence_spans]
+        sentence_starts = [start for start, _ in sentence_spans]
+        tokenized = []
+        for start, end in spans:
+            first = bisect.bisect_left(sentence_starts, start)
+            last = bisect.bisect_left(sentence_starts, end)
+            tokenized.append(list(itertools.chain.from_iterable(sentence_tokens[first:last])))
+
+        sentence_terms = [
+            sorted(set(tokens)) if end - start > ANSWER_SENTENCE_MIN_LENGTH else []
+            for (start, end), tokens in zip(sentence_spans, sentence_tokens)
+        ]
+    byte_spans = utf8_spans(cleaned_text, spans + sentence_spans)
+    return PreparedDocument(
+        cleaned_text, byte_spans[:len(spans)], tokenized, byte_spans[len(spans):], sentence_terms
+    )
 
 def extract_sentences(text: str, num_sentences: int = 3) -> str:
     if not text:
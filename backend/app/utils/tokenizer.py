@@ -0,0 +1,113 @@
+import hashlib
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional
+
+TOKEN_PATTERN = re.compile(r'\w+(?:-\w+)*')
+
+SPANISH_STOPWORDS = frozenset("""
+    a al algo algunas algunos ante antes aquel aquella aquellas aquellos aqui aquí así bien cada como cómo con
+    contra cual cuál cuales cuáles cuando cuándo de del desde donde dónde dos el él ella ellas ellos en entre era
+    eran es esa esas ese eso esos esta está estaba estaban estado estamos están estar estas este esto estos fue
+    fueron ha había habían han hasta hay la las le les lo los más mas me mi mí mis mucho muy nada ni no nos
+    nosotros o otra otras otro otros para pero poco por porque que qué quien quién quienes se sea ser si sí
+    sido sin sino sobre son su sus también tan tanto te tiene tienen todo todos tu tú tus un una unas uno unos
+    usted ustedes y ya yo
+""".split())
+
+ENGLISH_STOPWORDS = frozenset("""
+    a about above after again against all am an and any are as at be because been before being below between
+    both but by can could did do does doing down during each few for from further had has have having he her
+    here hers him his how i if in into is it its itself just me more most my no nor not now of off on once only
+    or other our ours out over own same she should so some such than that the their theirs them then there
+    these they this those through to too under until up very was we were what when where which while who whom
+    why will with would you your yours
+""".split())
+
+STOPWORDS = {'es': SPANISH_STOPWORDS, 'en': ENGLISH_STOPWORDS}
+
+VOWELS = 'aeiou'
+ACCENTED_VOWELS = 'áéíóú'
+
+# Cambia cuando ``light_stem`` da otros stems: los índices con stemming se rearman.
+STEMMER_VERSION = 2
+
+
+def fold_accents(term: str) -> str:
+    """Quita tildes, diéresis y la virgulilla de la ñ: ``canción`` -> ``cancion``."""
+    if term.isascii():
+        return term
+    decomposed = unicodedata.normalize('NFD', term)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+@lru_cache(maxsize=65536)
+def light_stem(token: str) -> str:
+    """
+    Stemmer liviano para español e inglés: solo pliega plurales regulares
+    (``canciones`` -> ``cancion``, ``ciudades`` -> ``ciudad``, ``datos`` ->
+    ``dato``). Las tildes se quitan antes, porque el plural las gana o las
+    pierde: ``canción`` y ``canciones`` dan ``cancion``, ``país`` y
+    ``países`` dan ``pais``. El vocabulario es chico comparado con la
+    cantidad de tokens, así que el resultado se memoiza por token.
+    """
+    if len(token) > 4 and token.endswith('ses') and token[-4] in ACCENTED_VOWELS:
+        # Hiato (``países``): la ``s`` es del singular, se quita solo ``es``.
+        return fold_accents(token[:-2])
+    token = fold_accents(token)
+    if len(token) > 6 and token.endswith('iones'):
+        return token[:-5] + 'ion'
+    if len(token) > 5 and token.endswith('es') and token[-3] in 'lnrd' and token[-4] in VOWELS:
+        return token[:-2]
+    if len(token) > 4 and token.endswith('s') and token[-2] in 'aeo':
+        return token[:-1]
+    return token
+
+
+class Tokenizer:
+    """
+    Tokenizador del índice y de las consultas: una sola pasada de una regex
+    precompilada sobre el texto en minúsculas, descarte de stopwords y de
+    tokens cortos y, opcionalmente, stemming liviano.
+
+    Debe poder serializarse con pickle porque viaja al pool de procesos de
+    la ingesta; ``config`` se guarda en el manifest del índice para detectar
+    índices construidos con otro tokenizador.
+    """
+
+    def __init__(self, languages=('es', 'en'), stem: bool = False, min_length: int = 3,
+                 stopwords: Optional[FrozenSet[str]] = None):
+        self.languages = tuple(languages)
+        self.stem = stem
+        self.min_length = min_length
+        self.stopwords = stopwords if stopwords is not None else frozenset().union(
+            *(STOPWORDS[language] for language in self.languages)
+        )
+
+    def tokenize(self, text: str) -> List[str]:
+        stopwords = self.stopwords
+        min_length = self.min_length
+        tokens = [
+            token for token in TOKEN_PATTERN.findall(text.lower())
+            if len(token) >= min_length and token not in stopwords
+        ]
+        if self.stem:
+            return [light_stem(token) for token in tokens]
+        return tokens
+
+    def config(self) -> Dict:
+        config = {
+            'pattern': TOKEN_PATTERN.pattern,
+            'languages': list(self.languages),
+            # Cambiar cualquier stopword, aunque la cantidad siga igual, cambia la huella.
+            'stopwords': hashlib.sha256("\n".join(sorted(self.stopwords)).encode('utf-8')).hexdigest()[:16],
+            'stem': self.stem,
+            'min_length': self.min_length
+        }
+        if self.stem:
+            config['stemmer'] = STEMMER_VERSION
+        return config
+
+
+default_tokenizer = Tokenizer()
@@ -0,0 +1,129 @@
+"""
+Corpus sintético y determinista en español e inglés para los benchmarks.
+
+Cada documento está en un idioma: sus oraciones mezclan stopwords de ese
+idioma con términos de contenido sacados de un vocabulario compartido con
+frecuencias tipo Zipf (unas pocas palabras reales muy comunes y una cola
+larga de palabras inventadas a partir de sílabas). Con la misma semilla se
+obtienen siempre los mismos documentos y las mismas preguntas, así que dos
+corridas en commits distintos miden exactamente el mismo trabajo.
+"""
+from typing import Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+
+from app.utils.text_utils import iter_chunk_spans
+from app.utils.tokenizer import STOPWORDS
+
+CONTENT_WORDS = (
+    "datos lenguaje programación índice búsqueda documento consulta análisis sistema rendimiento memoria "
+    "proceso canciones ciudades resultado servidor archivo usuario contrato factura informe manual "
+    "search engine index query latency throughput memory document ranking server report invoice "
+    "contract manual network storage"
+).split()
+
+SYLLABLES = (
+    "ba be bi bo bu ca ce ci co cu da de di do du fa fe fi fo ga ge go la le li lo lu ma me mi mo mu "
+    "na ne ni no nu pa pe pi po pu ra re ri ro ru sa se si so su ta te ti to tu va ve vi vo za zo "
+    "ción ría tor men dad ble"
+).split()
+
+QUESTION_TEMPLATES = {
+    'es': ("¿Qué es {}?", "¿Cómo funciona {}?", "¿Dónde se usa {}?", "¿Para qué sirve {}?"),
+    'en': ("What is {}?", "How does {} work?", "Where is {} used?", "Why does {} matter?")
+}
+
+# Largo de chunk y solapamiento por defecto de ``prepare_document``.
+CHUNK_SIZE = 300
+CHUNK_OVERLAP = 100
+
+
+class Vocabulary(NamedTuple):
+    words: np.ndarray
+    # Probabilidad de cada palabra: ``1 / rango``, normalizada.
+    weights: np.ndarray
+
+
+def build_vocabulary(size: int, seed: int = 0) -> Vocabulary:
+    """Vocabulario de contenido de ``size`` términos, en orden de frecuencia."""
+    rng = np.random.default_rng(seed)
+    words = list(CONTENT_WORDS[:size])
+    seen = set(words) | STOPWORDS['es'] | STOPWORDS['en']
+    while len(words) < size:
+        word = "".join(rng.choice(SYLLABLES, size=int(rng.integers(2, 5))))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    weights = 1 / np.arange(1, size + 1)
+    return Vocabulary(np.array(words), weights / weights.sum())
+
+
+def synthetic_text(rng: np.random.Generator, vocabulary: Vocabulary, language: str,
+                   sentences: int) -> Tuple[str, List[Tuple[int, int]]]:
+    """
+    Texto de ``sentences`` oraciones ya normalizado (``clean_text`` lo deja
+    igual) y los offsets de cada oración, como los de ``iter_sentence_spans``.
+    """
+    stopwords = sorted(STOPWORDS[language])
+    lengths = rng.integers(6, 19, size=sentences)
+    total = int(lengths.sum())
+    # Cerca de 4 de cada 10 palabras son stopwords, como en un texto real.
+    is_stopword = rng.random(total) < 0.4
+    content = vocabulary.words[rng.choice(len(vocabulary.words), size=total, p=vocabulary.weights)]
+    function = np.array(stopwords)[rng.integers(0, len(stopwords), size=total)]
+    words = np.where(is_stopword, function, content).tolist()
+    endings = rng.choice(list(".?!"), size=sentences, p=[0.8, 0.1, 0.1])
+
+    parts, spans = [], []
+    position = 0
+    start = 0
+    for length, ending in zip(lengths.tolist(), endings):
+        sentence = " ".join(words[start:start + length]).capitalize() + ending
+        start += length
+        parts.append(sentence)
+        spans.append((position, position + len(sentence)))
+        position += len(sentence) + 1
+    return " ".join(parts), spans
+
+
+def synthetic_documents(chunks: int, vocabulary: Vocabulary, seed: int = 0,
+                        sentences: Tuple[int, int] = (20, 80)) -> Iterator[Tuple[str, str, int]]:
+    """
+    Genera documentos (nombre, texto, chunks) hasta sumar al menos ``chunks``
+    chunks según el chunker de la ingesta. Alterna documentos en español e
+    inglés de entre ``sentences`` oraciones.
+    """
+    rng = np.random.default_rng(seed)
+    total = 0
+    number = 0
+    while total < chunks:
+        language = 'es' if number % 2 == 0 else 'en'
+        text, spans = synthetic_text(rng, vocabulary, language, int(rng.integers(sentences[0], sentences[1] + 1)))
+        count = sum(
+            1 for start, end in iter_chunk_spans(text, CHUNK_SIZE, CHUNK_OVERLAP, spans) if end - start > 20
+        )
+        yield f"{language}-{number:07d}.txt", text, count
+        total += count
+        number += 1
+
+
+def synthetic_questions(count: int, vocabulary: Vocabulary, seed: int = 1,
+                        terms: Tuple[int, int] = (1, 4)) -> List[str]:
+    """
+    Preguntas distintas entre sí, en ambos idiomas, con entre ``terms``
+    términos de contenido. Los términos siguen la misma distribución que el
+    corpus: cada pregunta suele mezclar palabras comunes con otras raras.
+    """
+    rng = np.random.default_rng(seed)
+    questions = []
+    seen = set()
+    while len(questions) < count:
+        language = 'es' if len(questions) % 2 == 0 else 'en'
+        size = min(int(rng.integers(terms[0], terms[1] + 1)), len(vocabulary.words))
+        words = vocabulary.words[rng.choice(len(vocabulary.words), size=size, replace=False, p=vocabulary.weights)]
+        templates = QUESTION_TEMPLATES[language]
+        question = templates[int(rng.integers(len(templates)))].format(" ".join(words))
+        if question not in seen:
+            seen.add(question)
+            questions.append(question)
+    return questions
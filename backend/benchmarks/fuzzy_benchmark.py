@@ -0,0 +1,116 @@
+"""
+Latencia de expandir un término de consulta mal escrito (sin tildes o con
+una letra insertada, borrada, cambiada o dos transpuestas) a los términos
+parecidos del vocabulario: ``BM25Index.similar_terms`` con el índice de
+variantes de cada segmento (``FuzzyIndex``) contra comparar el término con
+todo el vocabulario. Informa también cuánto tarda armar el índice, cuánto
+ocupa y en qué fracción de los casos el término original está entre los
+sugeridos; verifica que ambos métodos sugieran lo mismo.
+
+Uso, desde ``backend/``::
+
+    python -m benchmarks.fuzzy_benchmark [--vocabulary N] [--queries N]
+"""
+import argparse
+import json
+import random
+import time
+
+from app.services.bm25_index import FUZZY_MIN_LENGTH, BM25Index, Segment
+from app.services.fuzzy_index import FuzzyIndex, edit_distance, fold_accents
+from benchmarks.corpus import build_vocabulary
+from benchmarks.pruning_benchmark import summary
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def build_index(words, chunk_length: int, seed: int = 0) -> BM25Index:
+    # Cada palabra aparece en algún chunk; el resto de cada chunk son palabras al azar.
+    rng = random.Random(seed)
+    chunks = [[word] + rng.choices(words, k=chunk_length - 1) for word in words]
+    return BM25Index([Segment.build(
+        ["vocabulario.txt"], [""], [0] * len(chunks), [(0, 0)] * len(chunks), chunks
+    )])
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    if fold_accents(word) != word:
+        return fold_accents(word)
+    i = rng.randrange(len(word) - 1)
+    edit = rng.choice(("insert", "delete", "replace", "transpose"))
+    if edit == "insert":
+        return word[:i] + rng.choice(LETTERS) + word[i:]
+    if edit == "delete":
+        return word[:i] + word[i + 1:]
+    if edit == "replace":
+        return word[:i] + rng.choice(LETTERS.replace(word[i], "")) + word[i + 1:]
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def scan_similar_terms(index: BM25Index, token: str, limit: int):
+    # Lo mismo que ``similar_terms`` comparando con cada término del vocabulario.
+    folded = fold_accents(token)
+    max_distance = 1 if len(folded) >= FUZZY_MIN_LENGTH else 0
+    found = []
+    for term in index.segments[0].vocab:
+        distance = edit_distance(folded, fold_accents(term))
+        if distance is not None and distance <= max_distance:
+            found.append((distance, -index.doc_freq(term), term))
+    found.sort()
+    return [term for distance, _, term in found if distance == found[0][0]][:limit]
+
+
+def measure(func, queries, repeat: int):
+    latencies, results = [], []
+    for _ in range(repeat):
+        results = []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(func(query))
+            latencies.append(time.perf_counter() - start)
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--chunk-length", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--limit", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    words = build_vocabulary(args.vocabulary).words.tolist()
+    index = build_index(words, args.chunk_length)
+    segment = index.segments[0]
+    start = time.perf_counter()
+    fuzzy = FuzzyIndex.build(segment.vocab)
+    build_seconds = time.perf_counter() - start
+
+    rng = random.Random(1)
+    originals = rng.sample([word for word in words if len(fold_accents(word)) >= FUZZY_MIN_LENGTH], args.queries)
+    queries = [misspell(word, rng) for word in originals]
+    # Solo se expanden los términos que no están en el índice.
+    unknown = [(original, query) for original, query in zip(originals, queries) if index.doc_freq(query) == 0]
+    originals, queries = [original for original, _ in unknown], [query for _, query in unknown]
+
+    fuzzy_latencies, fuzzy_results = measure(lambda query: index.similar_terms(query, args.limit), queries, args.repeat)
+    scan_latencies, scan_results = measure(lambda query: scan_similar_terms(index, query, args.limit), queries, 1)
+
+    report = {
+        'vocabulary': len(segment.vocab),
+        'queries': len(queries),
+        'build_seconds': round(build_seconds, 3),
+        'bytes_per_term': round(fuzzy.nbytes / len(segment.vocab), 1),
+        'identical': fuzzy_results == scan_results,
+        'recall': round(sum(original in result for original, result in zip(originals, fuzzy_results))
+                        / max(len(queries), 1), 3),
+        'expansions_per_term': round(sum(map(len, fuzzy_results)) / max(len(queries), 1), 2),
+        'fuzzy_index': summary(fuzzy_latencies),
+        'vocabulary_scan': summary(scan_latencies)
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Latencia de las consultas con frase a medida que crecen los chunks: la
+intersección de postings y posiciones (``BM25Index.phrase_chunks``) contra
+buscar la frase como substring en el texto de cada chunk que tiene todos
+sus términos, que es lo que hacía el ``phrase_match`` anterior. Los
+términos de las frases aparecen la misma cantidad de veces con cualquier
+largo de chunk, así que solo cambia el texto que hay alrededor. Verifica
+además que ambos encuentren los mismos chunks.
+
+Uso, desde ``backend/``::
+
+    python -m benchmarks.phrase_benchmark [--chunks N] [--lengths 25,100,400,800] [--repeat N]
+"""
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from app.services.bm25_index import BM25Index, Segment
+from benchmarks.pruning_benchmark import summary
+
+PHRASES = [["ciencia", "datos"], ["base", "relacional", "consulta"], ["modelo", "lenguaje"]]
+
+
+def synthetic_chunks(count: int, length: int, vocabulary: int, seed: int = 0):
+    # Cada término de las frases aparece en el 20% de los chunks, y en la
+    # mitad de ellos la frase completa: los postings no dependen de ``length``.
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(count):
+        tokens = [f"t{rng.randrange(vocabulary)}" for _ in range(length)]
+        for phrase in PHRASES:
+            if rng.random() < 0.1:
+                start = rng.randrange(length)
+                tokens[start:start] = phrase
+            elif rng.random() < 0.1:
+                for term in phrase:
+                    tokens.insert(rng.randrange(len(tokens) + 1), term)
+        chunks.append(tokens)
+    return chunks
+
+
+def build_index(chunks) -> BM25Index:
+    # Un documento por chunk cuyo texto son sus tokens separados por espacios.
+    texts = [" ".join(tokens) for tokens in chunks]
+    segment = Segment.build(
+        [f"doc{i}.txt" for i in range(len(chunks))], texts, list(range(len(chunks))),
+        [(0, len(text)) for text in texts], chunks
+    )
+    return BM25Index([segment])
+
+
+def substring_chunks(index: BM25Index, phrase):
+    # Candidatos con todos los términos (de los postings) y después la frase en el texto.
+    candidates = None
+    for term in phrase:
+        docs, _ = index.term_contributions(term)
+        candidates = docs if candidates is None else np.intersect1d(candidates, docs)
+    text = " ".join(phrase)
+    return np.array([
+        chunk_id for chunk_id in candidates.tolist() if f" {text} " in f" {index.chunk(chunk_id)[0]} "
+    ], dtype=np.int64)
+
+
+def measure(func, repeat: int):
+    latencies = []
+    for _ in range(repeat):
+        for phrase in PHRASES:
+            start = time.perf_counter()
+            func(phrase)
+            latencies.append(time.perf_counter() - start)
+    return summary(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--lengths", default="25,100,400,800", help="tokens por chunk, separados por comas")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    report = {'chunks': args.chunks, 'phrases': [" ".join(phrase) for phrase in PHRASES], 'lengths': {}}
+    for length in (int(value) for value in args.lengths.split(",")):
+        index = build_index(synthetic_chunks(args.chunks, length, args.vocabulary))
+        segment = index.segments[0]
+        report['lengths'][length] = {
+            'identical': all(
+                index.phrase_chunks([phrase]).tolist() == substring_chunks(index, phrase).tolist() for phrase in PHRASES
+            ),
+            'matches': [len(index.phrase_chunks([phrase])) for phrase in PHRASES],
+            'positions_bytes_per_token': round(segment.positions.nbytes / int(segment.doc_len.sum()), 3),
+            'positional': measure(lambda phrase: index.phrase_chunks([phrase]), args.repeat),
+            'substring': measure(lambda phrase: substring_chunks(index, phrase), args.repeat)
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compara los postings comprimidos (diferencias de ids empaquetadas en 1, 2
+o 4 bytes por término y frecuencias en el entero más chico) contra los arreglos ``int32`` sin comprimir de los
+segmentos anteriores a la versión 7: bytes por posting y latencia del top k
+de consultas cortas (``/api/search``) y largas (``/api/ask``, con MaxScore).
+Verifica además que ambos resultados sean idénticos.
+
+Uso, desde ``backend/``::
+
+    python -m benchmarks.postings_benchmark [--documents N] [--chunks N] [--queries N]
+"""
+import argparse
+import copy
+import json
+import random
+
+from app.services.bm25_index import BM25Index
+from app.services.postings import PostingLists
+from benchmarks.pruning_benchmark import measure, question_queries, summary, without_stopwords
+from benchmarks.shard_benchmark import build_index, synthetic_corpus
+
+
+def uncompressed(index: BM25Index) -> BM25Index:
+    segments = []
+    for seg in index.segments:
+        seg = copy.copy(seg)
+        seg.postings = PostingLists(seg.offsets, *(array.astype('int32') for array in seg.postings.arrays()))
+        segments.append(seg)
+    return BM25Index(segments, k1=index.k1, b=index.b, epsilon=index.epsilon)
+
+
+def postings_report(index: BM25Index) -> dict:
+    count = sum(int(seg.offsets[-1]) for seg in index.segments)
+    total = sum(seg.postings.nbytes for seg in index.segments)
+    return {'bytes': total, 'bytes_per_posting': round(total / count, 3) if count else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--chunks", type=int, default=50)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--stopwords", type=int, default=20)
+    args = parser.parse_args()
+
+    corpus = without_stopwords(synthetic_corpus(args.documents, args.chunks, args.vocabulary), args.stopwords)
+    compressed = build_index(corpus, 1)
+    raw = uncompressed(compressed)
+    rng = random.Random(1)
+    workloads = {
+        'search': [[f"t{rng.randint(args.stopwords, 2000)}" for _ in range(rng.randint(1, 3))]
+                   for _ in range(args.queries)],
+        'ask': question_queries(args.queries, args.vocabulary, 4, 14, args.stopwords)
+    }
+
+    report = {
+        'chunks': args.documents * args.chunks,
+        'postings': sum(int(seg.offsets[-1]) for seg in compressed.segments),
+        'uncompressed': postings_report(raw),
+        'compressed': postings_report(compressed),
+        'latency': {}
+    }
+    report['compression_ratio'] = round(report['uncompressed']['bytes'] / report['compressed']['bytes'], 2)
+    for name, queries in workloads.items():
+        raw_latencies, expected = measure(raw, queries, args.top_k, pruning=True)
+        compressed_latencies, results = measure(compressed, queries, args.top_k, pruning=True)
+        report['latency'][name] = {
+            'identical': results == expected,
+            'uncompressed': summary(raw_latencies),
+            'compressed': summary(compressed_latencies)
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
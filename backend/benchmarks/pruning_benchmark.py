@@ -0,0 +1,116 @@
+"""
+Compara la latencia del top k con poda MaxScore contra la puntuación
+exhaustiva de todos los postings, con consultas largas de varios términos
+como las que recibe ``/api/ask``. Verifica además que ambos resultados sean
+idénticos y desglosa la latencia según los postings de cada consulta.
+
+Uso, desde ``backend/``::
+
+    python -m benchmarks.pruning_benchmark [--documents N] [--chunks N] [--queries N] [--terms MIN,MAX]
+                                           [--stopwords N]
+"""
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from app.services import bm25_index
+from benchmarks.shard_benchmark import build_index, synthetic_corpus
+
+POSTINGS_BUCKETS = (0, 5000, 20000, 50000, 100000)
+
+
+def without_stopwords(corpus, stopwords: int):
+    # El tokenizador descarta las palabras más frecuentes (``t0`` a ``t{N-1}``).
+    return {
+        name: [[token for token in chunk if int(token[1:]) >= stopwords] for chunk in chunks]
+        for name, chunks in corpus.items()
+    }
+
+
+def question_queries(count: int, vocabulary: int, min_terms: int, max_terms: int, stopwords: int, seed: int = 1):
+    # Términos distintos con la misma distribución Zipf del corpus, sin las
+    # stopwords: cada pregunta mezcla palabras comunes con otras raras.
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, vocabulary + 1)
+    weights[:stopwords] = 0
+    weights /= weights.sum()
+    return [
+        [f"t{term}" for term in rng.choice(vocabulary, size=int(rng.integers(min_terms, max_terms + 1)),
+                                           replace=False, p=weights)]
+        for _ in range(count)
+    ]
+
+
+def measure(index, queries, k: int, pruning: bool, repeat: int = 3):
+    latencies = []
+    results = []
+    for query in queries:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ids, scores = index.top_k_batch([query], k, min_matches=[min(2, len(query))], pruning=pruning)[0]
+            best = min(best, time.perf_counter() - start)
+        latencies.append(best)
+        results.append((ids.tolist(), scores.tolist()))
+    return latencies, results
+
+
+def summary(latencies) -> dict:
+    ordered = sorted(latencies)
+    return {
+        'mean_ms': round(statistics.mean(ordered) * 1000, 3),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p95_ms': round(ordered[int(len(ordered) * 0.95)] * 1000, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--chunks", type=int, default=50)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--terms", default="4,14")
+    parser.add_argument("--stopwords", type=int, default=20)
+    args = parser.parse_args()
+
+    min_terms, max_terms = (int(n) for n in args.terms.split(","))
+    corpus = without_stopwords(synthetic_corpus(args.documents, args.chunks, args.vocabulary), args.stopwords)
+    index = build_index(corpus, 1)
+    queries = question_queries(args.queries, args.vocabulary, min_terms, max_terms, args.stopwords)
+    postings = [sum(index.doc_freq(token) for token in set(query)) for query in queries]
+
+    # Se poda siempre, también por debajo de MAX_SCORE_MIN_POSTINGS, para ver dónde conviene.
+    bm25_index.MAX_SCORE_MIN_POSTINGS = 0
+    exhaustive, expected = measure(index, queries, args.top_k, pruning=False)
+    pruned, results = measure(index, queries, args.top_k, pruning=True)
+
+    report = {
+        'chunks': args.documents * args.chunks,
+        'queries': args.queries,
+        'top_k': args.top_k,
+        'identical': results == expected,
+        'exhaustive': summary(exhaustive),
+        'max_score': summary(pruned),
+        'by_postings': {}
+    }
+    for low, high in zip(POSTINGS_BUCKETS, POSTINGS_BUCKETS[1:] + (None,)):
+        selected = [i for i, count in enumerate(postings) if count >= low and (high is None or count < high)]
+        if selected:
+            exhaustive_ms = statistics.mean(exhaustive[i] for i in selected) * 1000
+            pruned_ms = statistics.mean(pruned[i] for i in selected) * 1000
+            report['by_postings'][f"{low}+" if high is None else f"{low}-{high}"] = {
+                'queries': len(selected),
+                'exhaustive_mean_ms': round(exhaustive_ms, 3),
+                'max_score_mean_ms': round(pruned_ms, 3),
+                'speedup': round(exhaustive_ms / pruned_ms, 2)
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Mide la latencia de ``top_k_batch`` según la cantidad de shards: el mismo
+corpus sintético se reparte en 1, 2, 4 y 8 shards y cada consulta se puntúa
+con los shards en paralelo (scatter-gather) en un pool de hilos. Verifica
+además que el resultado sea idéntico al del índice sin shards. Informa
+también cuánto tarda armar la vista del índice sobre segmentos ya
+construidos (lo que pasa en cada commit, recarga y arranque), que con más de
+un segmento incluye sumar las frecuencias de documento de todos ellos.
+
+Uso, desde ``backend/``::
+
+    python -m benchmarks.shard_benchmark [--documents N] [--chunks N] [--vocabulary N] [--queries N] [--shards 1,2,4,8]
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.services.bm25_index import BM25Index, Segment, balanced_ranges
+
+
+def synthetic_corpus(documents: int, chunks_per_document: int, vocabulary: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    # Frecuencias tipo Zipf: pocos términos muy comunes y una cola larga.
+    weights = 1 / np.arange(1, vocabulary + 1)
+    weights /= weights.sum()
+    corpus = {}
+    for d in range(documents):
+        lengths = rng.integers(20, 60, size=chunks_per_document)
+        terms = rng.choice(vocabulary, size=int(lengths.sum()), p=weights)
+        chunks = np.split(terms, np.cumsum(lengths)[:-1])
+        corpus[f"doc{d:05d}.txt"] = [[f"t{term}" for term in chunk] for chunk in chunks]
+    return corpus
+
+
+def build_index(corpus, shard_count: int) -> BM25Index:
+    # Igual que ``DocumentService._build_segments``: tramos contiguos de documentos.
+    all_names = list(corpus)
+    segments = []
+    for part in balanced_ranges([len(corpus[name]) for name in all_names], shard_count):
+        names = all_names[part.start:part.stop]
+        chunk_documents = [doc_id for doc_id, name in enumerate(names) for _ in corpus[name]]
+        tokenized = [tokens for name in names for tokens in corpus[name]]
+        segments.append(Segment.build(names, [""] * len(names), chunk_documents, [(0, 0)] * len(tokenized), tokenized))
+    return BM25Index(segments, shard_count=shard_count)
+
+
+def measure_view(index: BM25Index, repeat: int = 3) -> float:
+    # Una vista nueva sobre los mismos segmentos, como ``with_segment`` o ``load_index``.
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        BM25Index(index.segments, index.deleted_documents, shard_count=index.shard_count)
+        seconds.append(time.perf_counter() - start)
+    return round(min(seconds) * 1000, 3)
+
+
+def measure(index: BM25Index, queries, k: int, executor) -> dict:
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.top_k_batch([query], k, min_matches=[min(2, len(query))], executor=executor)[0])
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 3)
+    }, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--chunks", type=int, default=50)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--shards", default="1,2,4,8")
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.documents, args.chunks, args.vocabulary)
+    rng = random.Random(1)
+    queries = [[f"t{rng.randint(0, 200)}" for _ in range(rng.randint(2, 5))] for _ in range(args.queries)]
+
+    baseline = None
+    report = {'chunks': args.documents * args.chunks, 'queries': args.queries, 'shards': {}}
+    for shard_count in (int(n) for n in args.shards.split(",")):
+        index = build_index(corpus, shard_count)
+        with ThreadPoolExecutor(max_workers=shard_count) as executor:
+            measure(index, queries[:10], args.top_k, executor)
+            timings, results = measure(index, queries, args.top_k, executor if shard_count > 1 else None)
+        results = [(ids.tolist(), scores.tolist()) for ids, scores in results]
+        if baseline is None:
+            baseline = results
+        timings['identical_to_unsharded'] = baseline == results
+        timings['view_ms'] = measure_view(index)
+        report['shards'][shard_count] = timings
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
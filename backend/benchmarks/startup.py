@@ -0,0 +1,67 @@
+"""
+Tiempo de arranque de un worker, medido en un proceso nuevo: importar
+``app.main`` (sin cargar el índice) y cargar el índice de ``--index-dir``
+hasta que el servicio queda listo. Imprime un JSON con ambos tiempos, los
+módulos pesados que quedaron importados y el pico de memoria residente.
+
+Uso, desde ``backend/``::
+
+    python -m benchmarks.startup --index-dir data/index
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict
+
+# Dependencias que la aplicación importa recién cuando las necesita.
+DEFERRED_MODULES = ("PyPDF2", "rank_bm25")
+
+
+def measure(index_dir: str) -> Dict:
+    start = time.perf_counter()
+    import app.main  # noqa: F401
+    imported = time.perf_counter()
+
+    from app.services.document_service import DocumentService
+    service = DocumentService(index_dir, load=False)
+    service.load()
+    ready = time.perf_counter()
+
+    from benchmarks.suite import peak_rss_mb
+    return {
+        'import_seconds': round(imported - start, 3),
+        'load_seconds': round(ready - imported, 3),
+        'ready_seconds': round(ready - start, 3),
+        'documents': len(service.snapshot.document_locations),
+        'deferred_modules_loaded': [name for name in DEFERRED_MODULES if name in sys.modules],
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def run_in_subprocess(index_dir: str) -> Dict:
+    """Corre la medición en un intérprete nuevo, como un worker recién lanzado."""
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--index-dir", os.path.abspath(index_dir)],
+        cwd=backend, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--index-dir", required=True)
+    args = parser.parse_args()
+
+    # Los mensajes del servicio van a stderr para que stdout sea solo el JSON.
+    with contextlib.redirect_stdout(sys.stderr):
+        report = measure(args.index_dir)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
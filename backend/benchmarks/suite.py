@@ -0,0 +1,224 @@
+"""
+Benchmark de punta a punta de ``DocumentService`` sobre el corpus sintético de
+``benchmarks.corpus``: throughput de la ingesta (``add_document`` y
+``build_index``), tiempo de guardado y carga del índice y su tamaño en disco,
+latencia p50/p95/p99 de ``search`` y ``answer_question`` y el pico de memoria
+residente tras cada fase, y el arranque de un worker en un proceso nuevo
+(importar la aplicación y cargar el índice). Escribe un JSON con el commit y los parámetros, y
+con ``--compare`` agrega el cociente contra el JSON de otra corrida.
+
+Uso, desde ``backend/``::
+
+    python -m benchmarks.suite [--chunks N] [--queries N] [--seed N] [--output run.json] [--compare base.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.services.document_service import DocumentService
+from app.services.index_store import save_segment
+from benchmarks.corpus import build_vocabulary, synthetic_documents, synthetic_questions
+from benchmarks.startup import run_in_subprocess
+
+
+def peak_rss_mb() -> float:
+    # ``ru_maxrss`` está en KiB en Linux y en bytes en macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    )
+
+
+def git_commit() -> str:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def latency_summary(latencies: List[float]) -> Dict:
+    ordered = sorted(latencies)
+    percentile = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 3)
+    return {
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+
+
+def measure_queries(func, questions: List[str], warmup: int) -> Dict:
+    for question in questions[:warmup]:
+        func(question)
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        func(question)
+        latencies.append(time.perf_counter() - start)
+    report = latency_summary(latencies)
+    report['queries'] = len(questions)
+    report['queries_per_second'] = round(len(latencies) / sum(latencies), 1)
+    return report
+
+
+def run(args, index_dir: str) -> Dict:
+    report = {}
+    vocabulary = build_vocabulary(args.vocabulary, args.seed)
+    documents = list(synthetic_documents(args.chunks, vocabulary, args.seed))
+    text_bytes = sum(len(text.encode('utf-8')) for _, text, _ in documents)
+    chunks = sum(count for _, _, count in documents)
+    report['corpus'] = {
+        'documents': len(documents),
+        'chunks': chunks,
+        'megabytes': round(text_bytes / 1e6, 2),
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+    service = DocumentService(index_dir)
+    start = time.perf_counter()
+    for name, text, _ in documents:
+        service.add_document(name, text)
+    elapsed = time.perf_counter() - start
+    report['add_document'] = {
+        'seconds': round(elapsed, 3),
+        'documents_per_second': round(len(documents) / elapsed, 1),
+        'chunks_per_second': round(chunks / elapsed, 1),
+        'megabytes_per_second': round(text_bytes / 1e6 / elapsed, 2),
+        'peak_rss_mb': peak_rss_mb()
+    }
+    del documents
+
+    # ``build_index`` arma los segmentos y los escribe en disco en un solo commit.
+    start = time.perf_counter()
+    service.build_index()
+    elapsed = time.perf_counter() - start
+    report['build_index'] = {
+        'seconds': round(elapsed, 3),
+        'chunks_per_second': round(chunks / elapsed, 1),
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+    # La escritura por separado, sobre un directorio aparte con los mismos segmentos.
+    with tempfile.TemporaryDirectory() as save_dir:
+        start = time.perf_counter()
+        for i, segment in enumerate(service.bm25.segments):
+            save_segment(os.path.join(save_dir, f"seg-{i + 1:06d}"), segment,
+                         k1=service.k1, b=service.b, epsilon=service.epsilon)
+        elapsed = time.perf_counter() - start
+    index_bytes = directory_size(index_dir)
+    postings = sum(int(segment.offsets[-1]) for segment in service.bm25.segments)
+    report['save'] = {
+        'seconds': round(elapsed, 3),
+        'index_megabytes': round(index_bytes / 1e6, 2),
+        'bytes_per_chunk': round(index_bytes / chunks, 1),
+        'bytes_per_posting': round(sum(seg.postings.nbytes for seg in service.bm25.segments) / max(postings, 1), 3),
+        'peak_rss_mb': peak_rss_mb()
+    }
+    del service
+
+    # Un servicio nuevo sobre el mismo directorio: es lo que hace cada worker al arrancar.
+    start = time.perf_counter()
+    service = DocumentService(index_dir)
+    elapsed = time.perf_counter() - start
+    report['load'] = {
+        'seconds': round(elapsed, 3),
+        'segments': len(service.bm25.segments),
+        'peak_rss_mb': peak_rss_mb()
+    }
+    report['startup'] = run_in_subprocess(index_dir)
+
+    questions = synthetic_questions(args.queries, vocabulary, args.seed + 1)
+    report['search'] = measure_queries(
+        lambda question: service.search(question, args.top_k), questions, args.warmup
+    )
+    service.query_cache.clear()
+    report['search']['peak_rss_mb'] = peak_rss_mb()
+    report['answer_question'] = measure_queries(
+        lambda question: service.answer_question(question, args.top_k), questions, args.warmup
+    )
+    report['answer_question']['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+
+def flatten(report: Dict, prefix: str = "") -> Dict[str, float]:
+    values = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+
+def compare(baseline: Dict, report: Dict) -> Dict:
+    """Cociente actual / anterior de cada métrica numérica presente en ambas corridas."""
+    before = flatten(baseline['results'])
+    after = flatten(report['results'])
+    return {
+        key: {'before': before[key], 'after': after[key], 'ratio': round(after[key] / before[key], 3)}
+        for key in after if key in before and before[key]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=10000, help="tamaño del corpus (de 1000 a 1000000)")
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--index-dir", help="directorio del índice; por defecto uno temporal")
+    parser.add_argument("--output", help="además de imprimirlo, escribe el JSON en este archivo")
+    parser.add_argument("--compare", help="JSON de una corrida anterior con los mismos parámetros")
+    args = parser.parse_args()
+
+    # Los mensajes del servicio van a stderr para que stdout sea solo el JSON.
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.index_dir:
+            results = run(args, args.index_dir)
+        else:
+            with tempfile.TemporaryDirectory() as directory:
+                results = run(args, os.path.join(directory, "index"))
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpus': os.cpu_count(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'index_dir')},
+        'results': results
+    }
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('parameters') != report['parameters']:
+            print(f"Aviso: {args.compare} se corrió con otros parámetros", file=sys.stderr)
+        report['compared_to'] = baseline.get('commit')
+        report['changes'] = compare(baseline, report)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Compara el tokenizador actual con el anterior (cuatro ``str.replace`` y un
+``split``) sobre un texto sintético en español e inglés: primero token a
+token sobre los mismos chunks y luego en la ingesta completa (preparar el
+documento y construir el segmento).
+
+Uso, desde ``backend/``::
+
+    python -m benchmarks.tokenizer_benchmark [--sentences N] [--repeat N]
+"""
+import argparse
+import json
+import random
+import time
+from typing import List
+
+from app.services.bm25_index import Segment
+from app.utils.text_utils import clean_text, iter_chunk_spans, prepare_document
+from app.utils.tokenizer import Tokenizer
+
+WORDS = (
+    "el la de que los para con una por sobre datos lenguaje programación índice búsqueda documento "
+    "consulta análisis sistema rendimiento memoria proceso canciones ciudades (ejemplo): resultado; "
+    "the of and to search engine index query latency throughput memory document ranking"
+).split()
+
+
+def legacy_tokenize(text: str) -> List[str]:
+    text_lower = text.lower()
+    tokens = text_lower.replace(',', ' ').replace('.', ' ').replace('!', ' ').replace('?', ' ').split()
+    return [token for token in tokens if len(token) > 2]
+
+
+def synthetic_text(sentences: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    return " ".join(
+        " ".join(rng.choices(WORDS, k=rng.randint(6, 18))).capitalize() + rng.choice(".!?")
+        for _ in range(sentences)
+    )
+
+
+def legacy_prepare_document(text: str):
+    cleaned_text = clean_text(text)
+    spans = [(start, end) for start, end in iter_chunk_spans(cleaned_text, 300, 100) if end - start > 20]
+    return cleaned_text, spans, [legacy_tokenize(cleaned_text[start:end]) for start, end in spans]
+
+
+def measure_ingest(prepare, text: str, repeat: int) -> dict:
+    best_prepare, best_build = float('inf'), float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cleaned_text, spans, tokenized = prepare(text)
+        middle = time.perf_counter()
+        segment = Segment.build(["bench.txt"], [cleaned_text], [0] * len(spans), spans, tokenized)
+        best_prepare = min(best_prepare, middle - start)
+        best_build = min(best_build, time.perf_counter() - middle)
+    return {
+        'prepare_seconds': round(best_prepare, 4),
+        'build_seconds': round(best_build, 4),
+        'postings': int(segment.offsets[-1])
+    }
+
+
+def measure(tokenize, chunks: List[str], repeat: int) -> dict:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = [tokenize(chunk) for chunk in chunks]
+        best = min(best, time.perf_counter() - start)
+    total_tokens = sum(len(t) for t in tokens)
+    return {
+        'seconds': round(best, 4),
+        'tokens': total_tokens,
+        'vocabulary': len({token for chunk_tokens in tokens for token in chunk_tokens}),
+        'tokens_per_second': round(total_tokens / best) if best else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sentences", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    raw_text = synthetic_text(args.sentences)
+    text = clean_text(raw_text)
+    chunks = [text[start:end] for start, end in iter_chunk_spans(text, 300, 100)]
+    results = {
+        'chunks': len(chunks),
+        'tokenize': {
+            'legacy': measure(legacy_tokenize, chunks, args.repeat),
+            'regex': measure(Tokenizer().tokenize, chunks, args.repeat),
+            'regex_stem': measure(Tokenizer(stem=True).tokenize, chunks, args.repeat)
+        },
+        'ingest': {
+            'legacy': measure_ingest(legacy_prepare_document, raw_text, args.repeat),
+            'regex': measure_ingest(prepare_document, raw_text, args.repeat)
+        }
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import pytest
+
+from app.services.document_cache import DocumentCache, cache_size_from_env
+from app.services.document_service import EMPTY_SNAPSHOT, document_service
+
+
+@pytest.fixture(autouse=True)
+def isolated_data_dir(tmp_path_factory, monkeypatch):
+    """
+    Cada test corre en un directorio temporal propio: los ``DocumentService()``
+    con el directorio por defecto y el servicio global que usan las rutas
+    escriben el índice, su lock, la caché de documentos y el log de
+    consultas lentas ahí y no en ``backend/data``.
+    """
+    work_dir = tmp_path_factory.mktemp("backend")
+    monkeypatch.chdir(work_dir)
+    data_dir = work_dir / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(document_service, "index_dir", str(data_dir / "index"))
+    monkeypatch.setattr(document_service, "legacy_index_file", str(data_dir / "document_index.json"))
+    monkeypatch.setattr(document_service, "document_cache",
+                        DocumentCache(str(data_dir / "document_cache"), cache_size_from_env()))
+    monkeypatch.setattr(document_service.slow_query_log, "directory", str(data_dir / "slow_queries"))
+    monkeypatch.setattr(document_service, "pending_documents", {})
+    monkeypatch.setattr(document_service, "_snapshot", EMPTY_SNAPSHOT)
+    monkeypatch.setattr(document_service, "_stamp", None)
+    document_service.query_cache.clear()
+    return data_dir
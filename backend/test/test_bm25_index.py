@@ -0,0 +1,454 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from rank_bm25 import BM25Okapi
+
+from app.services.bm25_index import BM25Index, Segment, balanced_ranges, merge_top_k, select_top_k
+
+CORPUS = [
+    "python es un lenguaje de programación interpretado".split(),
+    "java es un lenguaje compilado para la máquina virtual".split(),
+    "python permite escribir scripts rápidos y python es popular".split(),
+    "las bases de datos guardan información estructurada".split(),
+    "un lenguaje de consultas para bases de datos es sql".split(),
+]
+
+
+def build_index(tokenized_chunks, **kwargs):
+    segment = Segment.build(
+        ["corpus.txt"], [""], [0] * len(tokenized_chunks), [(0, 0)] * len(tokenized_chunks),
+        tokenized_chunks, **kwargs
+    )
+    return BM25Index([segment], **kwargs)
+
+
+class TestBM25Index:
+
+    def test_scores_match_bm25okapi(self):
+        index = build_index(CORPUS, k1=1.2, b=0.75)
+        reference = BM25Okapi(CORPUS, k1=1.2, b=0.75)
+        for query in (["python"], ["lenguaje", "python", "python"], ["bases", "datos", "sql"], ["inexistente"]):
+            candidates, scores = index.get_scores(query)
+            expected = reference.get_scores(query)
+            dense = np.zeros(len(CORPUS))
+            dense[candidates] = scores
+            assert np.allclose(dense, expected, rtol=1e-12, atol=1e-12)
+
+    def test_top_k_orders_by_score(self):
+        index = build_index(CORPUS)
+        ids, scores = index.top_k(["python", "lenguaje"], 2)
+        assert len(ids) == 2
+        assert list(ids) == [0, 2]
+        assert scores[0] >= scores[1]
+
+    def test_unknown_terms_return_no_candidates(self):
+        index = build_index(CORPUS)
+        ids, scores = index.top_k(["rust"], 5)
+        assert len(ids) == 0 and len(scores) == 0
+
+    def test_matches_count_query_tokens_from_postings(self):
+        index = build_index(CORPUS)
+        candidates, _, matches = index.score_candidates(["python", "lenguaje", "sql"])
+        assert dict(zip(candidates.tolist(), matches.tolist())) == {0: 2, 1: 1, 2: 1, 4: 2}
+
+    def test_top_k_filters_before_selecting(self):
+        index = build_index(CORPUS)
+        ids, _ = index.top_k(["python", "lenguaje", "sql"], 2, min_matches=2)
+        assert sorted(ids.tolist()) == [0, 4]
+
+        _, scores = index.get_scores(["python"])
+        ids, top_scores = index.top_k(["python"], 5, min_score=float(scores.max()))
+        assert ids.tolist() == [2] and top_scores[0] == scores.max()
+
+    def test_tokens_of_a_group_count_as_one_match(self):
+        # "datos" y "gato" reemplazan al mismo término mal escrito.
+        index = build_index([["datos", "gato"], ["gato", "jirafa"], ["jirafa", "hojas"]])
+        query = ["datos", "gato", "jirafa"]
+        ids, _ = index.top_k_batch([query], 5, min_matches=[2])[0]
+        assert sorted(ids.tolist()) == [0, 1]
+        ids, _ = index.top_k_batch([query], 5, min_matches=[2], groups=[[0, 0, 1]])[0]
+        assert ids.tolist() == [1]
+        ids, _ = index.top_k_phrases(query, [["gato"]], 5, min_matches=2, groups=[0, 0, 1])
+        assert ids.tolist() == [1]
+
+    def test_score_batch_matches_single_queries(self):
+        index = build_index(CORPUS)
+        queries = [["python", "lenguaje"], ["rust"], [], ["bases", "datos", "sql", "datos"], ["python"]]
+        for query, (candidates, scores, matches) in zip(queries, index.score_batch(queries)):
+            expected = index.score_candidates(query)
+            assert candidates.tolist() == expected[0].tolist()
+            assert scores.tolist() == expected[1].tolist()
+            assert matches.tolist() == expected[2].tolist()
+
+    def test_score_batch_stops_at_deadline(self):
+        index = build_index(CORPUS)
+        with pytest.raises(TimeoutError):
+            index.score_batch([["python"], ["sql"]], deadline=time.monotonic() - 1)
+        assert index.top_k_batch([["python"]], 2, deadline=time.monotonic() + 60)[0][0].tolist() == [2, 0]
+
+    def test_select_top_k_breaks_ties_by_chunk_id(self):
+        candidates = np.array([7, 3, 5, 1])
+        scores = np.array([1.0, 2.0, 1.0, 1.0])
+        ids, top_scores = select_top_k(candidates, scores, 3)
+        assert list(ids) == [3, 1, 5]
+        assert list(top_scores) == [2.0, 1.0, 1.0]
+
+    def test_segments_and_deletions_match_rebuilt_index(self):
+        first = Segment.build(["a.txt", "b.txt"], ["", ""], [0, 0, 1], [(0, 0)] * 3, CORPUS[:3])
+        second = Segment.build(["c.txt"], [""], [0, 0], [(0, 0)] * 2, CORPUS[3:])
+        index = BM25Index([first, second]).without_documents(["b.txt"])
+        reference = BM25Okapi(CORPUS[:2] + CORPUS[3:], k1=1.2, b=0.75)
+        live_ids = [0, 1, 3, 4]
+
+        for query in (["lenguaje", "python"], ["bases", "datos"], ["python"]):
+            candidates, scores = index.get_scores(query)
+            dense = dict(zip(candidates.tolist(), scores))
+            expected = reference.get_scores(query)
+            assert 2 not in dense
+            assert np.allclose([dense.get(i, 0.0) for i in live_ids], expected, rtol=1e-12, atol=1e-12)
+
+    def test_compacted_index_keeps_scores(self):
+        first = Segment.build(["a.txt", "b.txt"], ["", ""], [0, 0, 1], [(0, 0)] * 3, CORPUS[:3])
+        second = Segment.build(["c.txt"], [""], [0, 0], [(0, 0)] * 2, CORPUS[3:])
+        index = BM25Index([first, second]).without_documents(["a.txt"])
+        compacted = index.compacted()
+
+        assert len(compacted.segments) == 1
+        assert compacted.corpus_size == index.corpus_size == 3
+        for query in (["lenguaje", "python"], ["bases", "datos", "sql"]):
+            _, expected = index.top_k(query, 3)
+            _, scores = compacted.top_k(query, 3)
+            assert np.allclose(scores, expected)
+
+    def test_compacted_index_keeps_chunk_texts(self):
+        first = Segment.build(["a.txt", "b.txt"], ["uno dos", "año tres"], [0, 1], [(0, 3), (0, 4)], CORPUS[:2])
+        second = Segment.build(["c.txt"], ["canción"], [0], [(0, 8)], CORPUS[2:3])
+        index = BM25Index([first, second]).without_documents(["a.txt"])
+        compacted = index.compacted()
+
+        assert [compacted.chunk(i) for i in range(compacted.corpus_size)] == [("año", "b.txt"), ("canción", "c.txt")]
+
+
+def random_corpus(documents, chunks_per_document, seed=0):
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(60)]
+    return {
+        f"doc{d}.txt": [rng.choices(words, k=rng.randint(3, 12)) for _ in range(chunks_per_document)]
+        for d in range(documents)
+    }
+
+
+def build_sharded_index(corpus, shard_count):
+    all_names = list(corpus)
+    segments = []
+    for part in balanced_ranges([len(corpus[name]) for name in all_names], shard_count):
+        names = all_names[part.start:part.stop]
+        chunk_documents = [doc_id for doc_id, name in enumerate(names) for _ in corpus[name]]
+        tokenized = [tokens for name in names for tokens in corpus[name]]
+        segments.append(Segment.build(names, [""] * len(names), chunk_documents, [(0, 0)] * len(tokenized), tokenized))
+    return BM25Index(segments, shard_count=shard_count)
+
+
+class TestShardedIndex:
+
+    def test_balanced_ranges(self):
+        assert balanced_ranges([], 4) == []
+        assert balanced_ranges([5, 5, 5, 5], 1) == [range(0, 4)]
+        assert balanced_ranges([5, 5, 5, 5], 2) == [range(0, 2), range(2, 4)]
+        # Un documento grande no se parte: quedan menos tramos.
+        assert balanced_ranges([1, 1, 10, 1], 3) == [range(0, 3), range(3, 4)]
+        assert balanced_ranges([3, 2], 8) == [range(0, 1), range(1, 2)]
+
+    def test_shards_are_balanced_by_chunk_count(self):
+        corpus = random_corpus(9, 2)
+        segments = build_sharded_index(corpus, 3).segments + build_sharded_index(corpus, 1).segments
+        index = BM25Index(segments, shard_count=2)
+        assert sorted(index.shards) == [[0, 1, 2], [3]]
+
+    def test_sharded_results_identical_to_unsharded(self):
+        corpus = random_corpus(30, 4)
+        unsharded = build_sharded_index(corpus, 1)
+        queries = [["w1", "w2"], ["w3"], ["w5", "w8", "w13"], ["w0", "w9"]]
+        expected = unsharded.top_k_batch(queries, 10)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            sharded = build_sharded_index(corpus, 4).top_k_batch(queries, 10, executor=executor)
+        for (ids, scores), (expected_ids, expected_scores) in zip(sharded, expected):
+            assert ids.tolist() == expected_ids.tolist()
+            assert scores.tolist() == expected_scores.tolist()
+
+    def test_scatter_gather_matches_single_pass(self):
+        index = build_sharded_index(random_corpus(40, 5), 4)
+        assert len(index.shards) == 4
+        queries = [["w1", "w2"], ["w3"], ["w5", "w8", "w13", "w5"], ["inexistente"], []]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for k in (1, 3, 10, 500):
+                expected = index.top_k_batch(queries, k, min_matches=[1, 1, 2, 0, 0])
+                sharded = index.top_k_batch(queries, k, min_matches=[1, 1, 2, 0, 0], executor=executor)
+                for (ids, scores), (expected_ids, expected_scores) in zip(sharded, expected):
+                    assert ids.tolist() == expected_ids.tolist()
+                    assert scores.tolist() == expected_scores.tolist()
+
+    def test_global_idf_across_shards(self):
+        corpus = random_corpus(20, 3)
+        index = build_sharded_index(corpus, 3)
+        flat = [tokens for chunks in corpus.values() for tokens in chunks]
+        reference = BM25Okapi(flat)
+        assert index.corpus_size == len(flat)
+        for term in ("w1", "w7", "w42"):
+            assert index.idf(term) == pytest.approx(reference.idf[term], rel=1e-12)
+
+    def test_doc_freqs_merged_across_segments(self):
+        # Términos de distinto largo y con tildes, repartidos de forma
+        # despareja entre shards, con documentos borrados.
+        rng = random.Random(3)
+        words = ["a", "ñu", "sql", "java", "canción", "información", "w1", "w12", "w123", "programación"]
+        corpus = {
+            f"doc{d}.txt": [rng.choices(words[:3 + d % len(words)], k=rng.randint(2, 8)) for _ in range(3)]
+            for d in range(16)
+        }
+        index = build_sharded_index(corpus, 4).without_documents(["doc2.txt", "doc9.txt"])
+        assert len(index.segments) == 4 and not index.single_segment
+        live = [tokens for name, chunks in corpus.items() if name not in ("doc2.txt", "doc9.txt") for tokens in chunks]
+        for term in words + ["inexistente", "cancion"]:
+            assert index.doc_freq(term) == sum(term in tokens for tokens in live), term
+        reference = BM25Okapi(live)
+        assert index.average_idf == pytest.approx(reference.average_idf, rel=1e-12)
+
+    def test_merge_top_k_breaks_ties_by_chunk_id(self):
+        first = (np.array([4, 1]), np.array([2.0, 1.0]))
+        second = (np.array([0, 3]), np.array([2.0, 1.0]))
+        ids, scores = merge_top_k([first, second], 3)
+        assert ids.tolist() == [0, 4, 1] and scores.tolist() == [2.0, 2.0, 1.0]
+
+    def test_compacted_keeps_one_segment_per_shard(self):
+        corpus = random_corpus(12, 2)
+        index = build_sharded_index(corpus, 3).without_documents(["doc3.txt"])
+        compacted = index.compacted()
+        assert compacted.is_compact and len(compacted.segments) == 3
+        assert [len(seg.document_names) for seg in compacted.segments] == [4, 4, 3]
+        assert [compacted.chunk(i)[1] for i in range(compacted.corpus_size)] == [
+            name for name, chunks in corpus.items() if name != "doc3.txt" for _ in chunks
+        ]
+        assert compacted.corpus_size == index.corpus_size
+        for term in ("w1", "w30"):
+            assert compacted.idf(term) == pytest.approx(index.idf(term), rel=1e-12)
+
+
+def zipf_corpus(documents, chunks_per_document, seed=0):
+    # Pocos términos muy comunes y una cola larga, como en un corpus real.
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(300)]
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    return {
+        f"doc{d}.txt": [rng.choices(words, weights, k=rng.randint(5, 40)) for _ in range(chunks_per_document)]
+        for d in range(documents)
+    }
+
+
+def long_queries(count, seed=1):
+    rng = random.Random(seed)
+    # Cada token es muy común, intermedio o de la cola, como en una pregunta.
+    queries = [
+        [f"w{rng.choice([rng.randint(0, 5), rng.randint(0, 60), rng.randint(0, 299)])}"
+         for _ in range(rng.randint(2, 10))]
+        for _ in range(count)
+    ]
+    return queries + [["w0", "w1", "w0"], ["w250", "w0"], ["w0", "inexistente"], ["w3", "w3"]]
+
+
+class TestMaxScore:
+
+    @pytest.fixture(autouse=True)
+    def always_prune(self, monkeypatch):
+        # Los corpus de prueba son chicos: se poda aunque no convenga.
+        monkeypatch.setattr("app.services.bm25_index.MAX_SCORE_MIN_POSTINGS", 0)
+
+    def assert_same_top_k(self, index, queries, **kwargs):
+        for k in (1, 5, 20):
+            expected = index.top_k_batch(queries, k, pruning=False, **kwargs)
+            pruned = index.top_k_batch(queries, k, **kwargs)
+            for (ids, scores), (expected_ids, expected_scores) in zip(pruned, expected):
+                assert ids.tolist() == expected_ids.tolist()
+                assert scores.tolist() == expected_scores.tolist()
+
+    def test_identical_to_exhaustive_scoring(self):
+        index = build_sharded_index(zipf_corpus(60, 5), 1)
+        queries = long_queries(80)
+        self.assert_same_top_k(index, queries)
+        self.assert_same_top_k(index, queries, min_matches=[min(2, len(q)) for q in queries])
+        self.assert_same_top_k(index, queries, min_score=1.0)
+
+    def test_identical_with_segments_and_deletions(self):
+        corpus = zipf_corpus(60, 5, seed=3)
+        index = build_sharded_index(corpus, 4).without_documents(["doc7.txt", "doc31.txt"])
+        assert not index.single_segment
+        queries = long_queries(80, seed=4)
+        self.assert_same_top_k(index, queries, min_matches=[min(2, len(q)) for q in queries])
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assert_same_top_k(index, queries, executor=executor)
+
+    def test_identical_with_groups(self):
+        index = build_sharded_index(zipf_corpus(60, 5, seed=6), 3)
+        queries = long_queries(80, seed=7)
+        groups = [[j // 2 for j in range(len(q))] for q in queries]
+        self.assert_same_top_k(index, queries, min_matches=[min(2, g[-1] + 1) for g in groups], groups=groups)
+
+    def test_upper_bound_covers_every_contribution(self):
+        corpus = zipf_corpus(30, 4, seed=5)
+        for index in (build_sharded_index(corpus, 1), build_sharded_index(corpus, 3).without_documents(["doc2.txt"])):
+            for token in ("w0", "w1", "w17", "w250"):
+                _, contributions = index.term_contributions(token)
+                if len(contributions):
+                    assert contributions.max() <= index.upper_bound(*index.term_postings(token))
+
+    def test_common_terms_are_not_traversed(self, monkeypatch):
+        index = build_sharded_index(zipf_corpus(80, 5), 1)
+        rare = min((f"w{i}" for i in range(200, 300) if index.doc_freq(f"w{i}")), key=index.doc_freq)
+        traversed = []
+        live_postings = BM25Index._live_postings
+        monkeypatch.setattr(BM25Index, "_live_postings",
+                            lambda self, term: traversed.append(term) or live_postings(self, term))
+        ids, _ = index.top_k([rare, "w0", "w1", "w2"], 1)
+        assert len(ids) == 1 and len(traversed) == 1
+
+    def test_small_queries_are_scored_exhaustively(self, monkeypatch):
+        monkeypatch.setattr("app.services.bm25_index.MAX_SCORE_MIN_POSTINGS", 10 ** 9)
+        monkeypatch.setattr(BM25Index, "top_k_max_score", None)
+        index = build_sharded_index(zipf_corpus(10, 2), 1)
+        assert len(index.top_k(["w0", "w1"], 3)[0]) == 3
+
+
+def brute_force_phrase(tokenized_chunks, phrase):
+    return [
+        chunk_id for chunk_id, tokens in enumerate(tokenized_chunks)
+        if any(tokens[start:start + len(phrase)] == phrase for start in range(len(tokens) - len(phrase) + 1))
+    ]
+
+
+class TestPositions:
+
+    def test_positions_follow_tokens(self):
+        corpus = random_corpus(6, 4)
+        tokenized = [tokens for chunks in corpus.values() for tokens in chunks]
+        segment = build_sharded_index(corpus, 1).segments[0]
+        for term_id, term in enumerate(segment.vocab):
+            docs, tf = segment.postings.term(term_id)
+            rows, positions = segment.positions.select(term_id, tf, np.arange(len(docs)))
+            expected = [
+                (row, position) for row, chunk_id in enumerate(docs.tolist())
+                for position, token in enumerate(tokenized[chunk_id]) if token == term
+            ]
+            assert list(zip(rows.tolist(), positions.tolist())) == expected
+
+    def test_merge_keeps_positions_of_live_chunks(self):
+        corpus = random_corpus(12, 3)
+        index = BM25Index(build_sharded_index(corpus, 3).segments).without_documents(["doc2.txt", "doc7.txt"])
+        merged = index.compacted().segments[0]
+        expected = build_sharded_index({name: chunks for name, chunks in corpus.items()
+                                        if name not in ("doc2.txt", "doc7.txt")}, 1).segments[0]
+        assert merged.positions.offsets.tolist() == expected.positions.offsets.tolist()
+        assert merged.positions.values.tolist() == expected.positions.values.tolist()
+
+
+class TestPhraseQueries:
+
+    def test_phrase_chunks_match_consecutive_tokens(self):
+        corpus = random_corpus(20, 5)
+        tokenized = [tokens for chunks in corpus.values() for tokens in chunks]
+        rng = random.Random(3)
+        phrases = [tokenized[rng.randrange(len(tokenized))][:length] for length in (1, 2, 2, 3)]
+        phrases += [["w1", "w1"], ["w2", "w3"], ["w5", "inexistente"]]
+        for shard_count in (1, 3):
+            index = build_sharded_index(corpus, shard_count)
+            for phrase in phrases:
+                assert index.phrase_chunks([phrase]).tolist() == brute_force_phrase(tokenized, phrase), phrase
+
+    def test_phrase_order_matters(self):
+        index = build_index([["ciencia", "datos", "python"], ["datos", "ciencia"], ["ciencia", "otros", "datos"]])
+        assert index.phrase_chunks([["ciencia", "datos"]]).tolist() == [0]
+        assert index.phrase_chunks([["datos", "ciencia"]]).tolist() == [1]
+        assert index.phrase_chunks([["ciencia", "datos"], ["datos", "python"]]).tolist() == [0]
+
+    def test_top_k_phrases_scores_like_full_scoring(self):
+        index = build_sharded_index(random_corpus(30, 4), 2).without_documents(["doc4.txt"])
+        query = ["w1", "w2", "w7"]
+        allowed = set(index.phrase_chunks([["w1", "w2"]]).tolist())
+        candidates, scores, matches = index.score_candidates(query)
+        expected = [(chunk_id, score) for chunk_id, score, count in zip(candidates, scores, matches)
+                    if chunk_id in allowed and count >= 2]
+        expected_ids, expected_scores = select_top_k(
+            np.array([c for c, _ in expected], dtype=np.int64), np.array([s for _, s in expected]), 5
+        )
+        ids, top_scores = index.top_k_phrases(query, [["w1", "w2"]], 5, min_matches=2)
+        assert ids.tolist() == expected_ids.tolist()
+        assert top_scores.tolist() == expected_scores.tolist()
+
+    def test_deleted_chunks_are_excluded(self):
+        corpus = {"a.txt": [["ciencia", "datos"]], "b.txt": [["ciencia", "datos"]]}
+        index = build_sharded_index(corpus, 1).without_documents(["a.txt"])
+        assert index.phrase_chunks([["ciencia", "datos"]]).tolist() == [1]
+
+
+class TestProximity:
+
+    def test_closer_terms_get_larger_boost(self):
+        index = build_index([
+            ["ciencia", "datos", "relleno", "relleno", "relleno", "relleno"],
+            ["ciencia", "relleno", "datos", "relleno", "relleno", "relleno"],
+            ["ciencia", "relleno", "relleno", "relleno", "relleno", "relleno", "relleno", "datos"],
+            ["datos", "relleno", "relleno", "relleno", "relleno", "relleno"],
+            ["otros", "términos"],
+        ])
+        boost = index.proximity_boost(["ciencia", "datos"], np.arange(5), window=5)
+        idf = min(index.idf("ciencia"), index.idf("datos"))
+        assert boost.tolist() == pytest.approx([idf, idf / 4, 0.0, 0.0, 0.0])
+
+    def test_rerank_prefers_adjacent_terms(self):
+        index = build_index([
+            ["ciencia", "relleno", "relleno", "datos"],
+            ["relleno", "relleno", "ciencia", "datos"],
+        ] + [["otros", "términos"]] * 4)
+        candidates, scores = index.top_k(["ciencia", "datos"], 2)
+        assert scores[0] == scores[1] and candidates.tolist() == [0, 1]
+        reranked, _ = index.rerank_by_proximity(["ciencia", "datos"], candidates, scores, 2, weight=1.0, window=5)
+        assert reranked.tolist() == [1, 0]
+        unchanged, _ = index.rerank_by_proximity(["ciencia", "datos"], candidates, scores, 2, weight=0.0, window=5)
+        assert unchanged.tolist() == [0, 1]
+
+
+class TestSimilarTerms:
+
+    def test_accents_before_one_edit(self):
+        index = build_index([
+            ["información", "canción"], ["informativo", "canciones"], ["información", "formación"],
+        ])
+        assert index.similar_terms("informacion", 3) == ["información"]
+        assert index.similar_terms("cancion", 3) == ["canción"]
+        assert index.similar_terms("formacion", 3) == ["formación"]
+        assert index.similar_terms("informatica", 3) == []
+
+    def test_typos_ordered_by_doc_freq(self):
+        index = build_index([["python", "pylon"], ["python"], ["pylon", "java"], ["python", "datos"]])
+        assert index.similar_terms("pyton", 3) == ["python", "pylon"]
+        assert index.similar_terms("pyton", 1) == ["python"]
+        assert index.similar_terms("pyhton", 3) == ["python"]
+
+    def test_short_tokens_only_fold_accents(self):
+        index = build_index([["año", "java"], ["ano", "jaba"]])
+        assert index.similar_terms("jav", 3) == []
+        assert index.similar_terms("anó", 3) == ["ano", "año"]
+
+    def test_segments_and_deletions(self):
+        corpus = {"a.txt": [["canción", "python"]], "b.txt": [["pythons"]], "c.txt": [["canción"]]}
+        index = build_sharded_index(corpus, 3)
+        assert len(index.segments) == 3
+        assert index.similar_terms("cancion", 3) == ["canción"]
+        assert index.similar_terms("pyton", 3) == ["python"]
+        # Los términos que solo quedan en documentos borrados no se sugieren.
+        assert index.without_documents(["a.txt"]).similar_terms("pyton", 3) == []
+        merged = BM25Index(index.segments).compacted()
+        assert merged.similar_terms("cancion", 3) == ["canción"]
+        assert merged.similar_terms("pyton", 3) == ["python"]
@@ -0,0 +1,163 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.document_cache import DocumentCache
+from app.services.document_service import DocumentService, document_service
+from app.utils.text_utils import prepare_document
+
+client = TestClient(app)
+
+TEXT = "Python es un lenguaje de programación interpretado. Se usa mucho en ciencia de datos y automatización."
+TOKENIZER = {'stem': False}
+
+
+def entry_names(cache):
+    return sorted(os.listdir(cache.directory))
+
+
+class TestDocumentCache:
+
+    def test_round_trip_keeps_prepared_document(self, tmp_path):
+        cache = DocumentCache(str(tmp_path), max_bytes=1024 * 1024)
+        prepared = prepare_document(TEXT)
+        key = cache.key("abc", "python.txt", TOKENIZER)
+        assert cache.get(key) is None
+
+        cache.put(key, prepared)
+        assert cache.get(key) == prepared
+
+    def test_key_depends_on_extension_and_tokenizer(self, tmp_path):
+        cache = DocumentCache(str(tmp_path), max_bytes=1024 * 1024)
+        key = cache.key("abc", "python.txt", TOKENIZER)
+        assert cache.key("abc", "otro-nombre.TXT", TOKENIZER) == key
+        assert cache.key("abc", "python.pdf", TOKENIZER) != key
+        assert cache.key("abc", "python.txt", {'stem': True}) != key
+        assert cache.key("abd", "python.txt", TOKENIZER) != key
+
+    def test_least_recently_used_entries_are_evicted(self, tmp_path):
+        prepared = prepare_document(TEXT)
+        cache = DocumentCache(str(tmp_path), max_bytes=1024 * 1024)
+        cache.put("a", prepared)
+        entry_size = os.path.getsize(os.path.join(cache.directory, "a.npz"))
+        cache.max_bytes = 2 * entry_size
+        cache.put("b", prepared)
+        os.utime(os.path.join(cache.directory, "a.npz"), ns=(1, 1))
+        os.utime(os.path.join(cache.directory, "b.npz"), ns=(2, 2))
+
+        # El acierto sobre "a" la vuelve la más reciente: se desaloja "b".
+        assert cache.get("a") == prepared
+        cache.put("c", prepared)
+        assert entry_names(cache) == ["a.npz", "c.npz"]
+
+    def test_invalid_entries_are_discarded(self, tmp_path):
+        cache = DocumentCache(str(tmp_path), max_bytes=1024 * 1024)
+        with open(os.path.join(cache.directory, "roto.npz"), 'wb') as f:
+            f.write(b"no es un npz")
+        assert cache.get("roto") is None
+        assert entry_names(cache) == []
+
+    def test_zero_size_disables_cache(self, tmp_path):
+        cache = DocumentCache(str(tmp_path / "cache"), max_bytes=0)
+        cache.put("a", prepare_document(TEXT))
+        assert cache.get("a") is None
+        assert not os.path.exists(cache.directory)
+
+
+class TestUnchangedDocuments:
+
+    @pytest.fixture(autouse=True)
+    def service(self, tmp_path):
+        self.service = DocumentService(str(tmp_path / "index"))
+        self.documents = {
+            "python.txt": self.service._prepare(TEXT),
+            "sql.txt": self.service._prepare("SQL es un lenguaje de consultas para bases de datos relacionales."),
+        }
+        self.service.reset_index(self.documents)
+
+    def test_replacing_with_same_text_does_not_commit(self):
+        generation = self.service.snapshot.generation
+        assert self.service.replace_document("python.txt", TEXT)
+        assert self.service.snapshot.generation == generation
+
+        assert self.service.replace_document("python.txt", "Python también sirve para automatizar tareas.")
+        assert self.service.snapshot.generation == generation + 1
+
+    def test_is_indexed_compares_names_and_texts(self):
+        assert self.service.is_indexed(self.documents)
+        assert not self.service.is_indexed({"python.txt": self.documents["python.txt"]})
+        assert not self.service.is_indexed({**self.documents, "sql.txt": self.service._prepare("Otro texto distinto.")})
+
+
+OTHER_DOCUMENTS = {
+    "cocina.txt": "La paella valenciana lleva arroz, azafrán y pollo cocidos a fuego lento.",
+    "futbol.txt": "El fútbol se juega con once jugadores por equipo en una cancha de césped.",
+    "historia.txt": "La revolución industrial empezó en Inglaterra a fines del siglo dieciocho.",
+    "musica.txt": "El tango nació en el Río de la Plata y se baila en pareja con abrazo cerrado.",
+    "jardin.txt": "Las rosas necesitan sol directo, riego moderado y poda al final del invierno.",
+    "viajes.txt": "Los trenes nocturnos cruzan los Alpes y llegan a Viena por la mañana temprano.",
+}
+
+
+class TestDuplicateChunks:
+
+    @pytest.fixture(autouse=True)
+    def service(self, tmp_path):
+        self.service = DocumentService(str(tmp_path / "index"))
+        repeated = "Python es un lenguaje de programación interpretado y muy popular."
+        self.service.reset_index({
+            "a.txt": self.service._prepare(repeated),
+            "b.txt": self.service._prepare(repeated),
+            "c.txt": self.service._prepare(repeated),
+            "d.txt": self.service._prepare("Java es un lenguaje de programación compilado."),
+            **{name: self.service._prepare(text) for name, text in OTHER_DOCUMENTS.items()}
+        })
+
+    def test_repeated_chunks_take_one_slot_with_attribution(self):
+        # Los tres primeros chunks son d, a y b: se vuelve a puntuar para
+        # completar el top k y solo quedan dos textos distintos.
+        results = self.service.search("lenguaje de programación", top_k=3, min_score=0.0)
+        assert [result['document_name'] for result in results] == ["d.txt", "a.txt"]
+        assert results[0]['other_documents'] == []
+        assert results[1]['other_documents'] == ["b.txt", "c.txt"]
+
+        _, citations = self.service.answer_question("¿Qué lenguaje de programación es interpretado?")
+        assert citations[0]['document_name'] == "a.txt"
+        assert citations[0]['other_documents'] == ["b.txt", "c.txt"]
+
+    def test_repeated_document_texts_are_stored_once(self):
+        segment = self.service.bm25.segments[0]
+        assert len(segment.document_texts) == 10
+        assert segment.document_texts.rows.tolist() == [0, 0, 0, 1, 2, 3, 4, 5, 6, 7]
+
+        reloaded = DocumentService(self.service.index_dir)
+        assert reloaded.documents == self.service.documents
+        assert reloaded.search("lenguaje interpretado", min_score=0.0) == self.service.search("lenguaje interpretado", min_score=0.0)
+
+
+class TestIngestCache:
+
+    @pytest.fixture(autouse=True)
+    def setup_service(self):
+        document_service.clear_index()
+        yield
+        document_service.clear_index()
+
+    def test_reingesting_same_files_uses_cache_and_keeps_index(self, monkeypatch):
+        files = [
+            ("files", (f"{name}.txt", f"Contenido del archivo {name} con suficiente texto.".encode("utf-8"), "text/plain"))
+            for name in ("uno", "dos", "tres")
+        ]
+        assert client.post("/api/ingest", files=files).status_code == 200
+        generation = document_service.snapshot.generation
+
+        async def fail(*args, **kwargs):
+            raise AssertionError("El archivo no debería extraerse de nuevo")
+        monkeypatch.setattr("app.routers.ingest.extract_text_from_path", fail)
+
+        response = client.post("/api/ingest", files=files)
+        assert response.status_code == 200
+        assert response.json()["files_list"] == ["uno.txt", "dos.txt", "tres.txt"]
+        assert document_service.snapshot.generation == generation
@@ -1,5 +1,10 @@
+import os
+import threading
+import time
+
 import pytest
 from app.services.document_service import DocumentService
+from app.services.index_store import MANIFEST_FILE
 
 class TestDocumentServiceSimple:
 
@@ -12,6 +17,26 @@ class TestDocumentServiceSimple:
         assert "doc1.txt" in self.service.documents
         assert len(self.service.chunks) > 0
 
+    def test_search_matches_whole_terms_only(self):
+        self.service.add_document("redes.txt", "El archivo se comparte en redes sociales de todo el mundo cada día.")
+        self.service.add_document("red.txt", "Una red social abierta permite publicar mensajes cortos sin registro.")
+        self.service.add_document("otro.txt", "La cocina mediterránea usa aceite de oliva, tomate y mucho ajo fresco.")
+        self.service.build_index()
+        results = self.service.search("red social", min_score=0.0)
+        assert [r['document_name'] for r in results] == ["red.txt"]
+
+    def test_filtered_candidates_do_not_take_top_k_slots(self):
+        # kotlin.txt tiene el mejor puntaje pero un solo término de la consulta.
+        self.service.add_document("kotlin.txt", "Kotlin Kotlin Kotlin Kotlin corre sobre la máquina virtual y compila rápido.")
+        self.service.add_document("python.txt", "Python sirve para ciencia de datos con bibliotecas muy conocidas y libres.")
+        self.service.add_document("sensores.txt", "Python también analiza datos de sensores industriales en tiempo real.")
+        self.service.add_document("gobierno.txt", "Los datos abiertos del gobierno se publican cada mes en formato abierto.")
+        self.service.build_index()
+        assert self.service.bm25.top_k(["kotlin", "python", "datos"], 1)[0].tolist() == [0]
+
+        results = self.service.search("kotlin python datos", top_k=1, min_score=0.0)
+        assert [r['document_name'] for r in results] == ["python.txt"]
+
     def test_answer_question_no_info(self):
         self.service.add_document("manual.txt", "Python es un lenguaje interpretado")
         self.service.build_index()
@@ -32,3 +57,383 @@ class TestDocumentServiceSimple:
         assert self.service.get_document_count() == 2
         names = self.service.get_document_names()
         assert "doc1.txt" in names and "doc2.txt" in names
+
+
+def legacy_answer_question(service, question):
+    # Implementación anterior: divide y tokeniza las oraciones de cada
+    # resultado en cada pregunta; se conserva como referencia.
+    import re
+    from app.utils.text_utils import clean_text
+    search_results = service.search(question, top_k=5, min_score=0.15)
+    if not search_results:
+        return None
+    question_tokens = set(service._tokenize(clean_text(question)))
+    best_sentence, best_score, citations = "", 0, []
+    for result in search_results[:3]:
+        sentences = re.split(r'(?<=[.!?])\s+', result['text'])
+        for sentence in sentences:
+            score = len(question_tokens & set(service._tokenize(sentence)))
+            if score > best_score and len(sentence) > 20:
+                best_score, best_sentence = score, sentence
+        if len(citations) < 3 and sentences:
+            citations.append({'text': sentences[0].strip(), 'document_name': result['document_name'],
+                              'other_documents': result['other_documents']})
+    return (best_sentence.strip() if best_sentence else None), citations
+
+
+class TestAnswerQuestion:
+
+    def setup_method(self):
+        self.service = DocumentService()
+        self.service.clear_index()
+        self.service.add_document("python.txt", (
+            "Python es un lenguaje de programación interpretado. Python se usa en ciencia de datos. "
+            "Fue creado por Guido van Rossum. La versión tres de Python cambió la división de enteros. "
+            "Muchas empresas usan Python para automatizar procesos de análisis de datos."
+        ))
+        self.service.add_document("java.txt", (
+            "Java es un lenguaje compilado a bytecode. La máquina virtual de Java ejecuta ese bytecode. "
+            "Java se usa mucho en aplicaciones empresariales y en Android. Es un lenguaje con tipado estático."
+        ))
+        self.service.add_document("cocina.txt", (
+            "La receta lleva harina, huevos y azúcar. Hay que batir los huevos durante diez minutos. "
+            "El horno debe estar a ciento ochenta grados. La torta se sirve fría con crema."
+        ))
+        self.service.build_index()
+
+    def teardown_method(self):
+        self.service.clear_index()
+
+    def test_matches_legacy_sentence_selection(self):
+        questions = [
+            "¿Para qué se usa Python en ciencia de datos?",
+            "¿Qué ejecuta la máquina virtual de Java?",
+            "¿A cuántos grados debe estar el horno?",
+            "¿Cuánto tiempo hay que batir los huevos?",
+            "¿Qué lenguaje tiene tipado estático?",
+        ]
+        answered = 0
+        for question in questions:
+            expected = legacy_answer_question(self.service, question)
+            answer, citations = self.service.answer_question(question)
+            if expected is None:
+                assert citations == []
+                continue
+            best_sentence, expected_citations = expected
+            assert citations == expected_citations
+            if best_sentence is not None:
+                assert answer == best_sentence
+                answered += 1
+        assert answered >= 3
+
+    def test_answer_survives_compaction_and_reload(self):
+        question = "¿Qué ejecuta la máquina virtual de Java?"
+        self.service.insert_document("sql.txt", "SQL es un lenguaje de consultas. Se usa con bases de datos relacionales.")
+        self.service.delete_document("python.txt")
+        expected = self.service.answer_question(question)
+        assert "máquina virtual" in expected[0]
+
+        assert self.service.compact_index()
+        assert self.service.answer_question(question) == expected
+        assert DocumentService().answer_question(question) == expected
+
+
+CORPUS_A = {
+    "python.txt": "Python es un lenguaje de programación interpretado y muy usado en ciencia de datos.",
+    "java.txt": "Java es un lenguaje compilado que corre sobre la máquina virtual de Java.",
+    "cocina.txt": "La paella valenciana lleva arroz, azafrán, pollo y conejo cocidos a fuego lento.",
+}
+
+CORPUS_B = {
+    "futbol.txt": "El fútbol se juega con once jugadores por equipo y un arquero en cada arco.",
+    "tenis.txt": "El tenis se juega con raqueta sobre canchas de polvo de ladrillo o césped.",
+    "ajedrez.txt": "El ajedrez se juega sobre un tablero de sesenta y cuatro casillas blancas y negras.",
+}
+
+
+class TestIndexSnapshots:
+
+    def setup_method(self):
+        self.service = DocumentService()
+        self.service.clear_index()
+
+    def teardown_method(self):
+        self.service.clear_index()
+
+    def reset(self, corpus):
+        self.service.reset_index({name: self.service._prepare(text) for name, text in corpus.items()})
+
+    def test_old_snapshot_survives_reset(self):
+        self.reset(CORPUS_A)
+        old = self.service.snapshot
+        self.reset(CORPUS_B)
+
+        assert sorted(old.document_locations) == sorted(CORPUS_A)
+        assert old.index.chunk(0)[1] == "python.txt"
+        assert self.service.snapshot.generation > old.generation
+        assert sorted(self.service.get_document_names()) == sorted(CORPUS_B)
+        assert self.service.search("lenguaje python", min_score=0.0) == []
+
+    def test_index_dir_is_configurable(self, tmp_path):
+        index_dir = str(tmp_path / "index")
+        service = DocumentService(index_dir)
+        service.reset_index({name: service._prepare(text) for name, text in CORPUS_A.items()})
+
+        assert os.path.exists(os.path.join(index_dir, MANIFEST_FILE))
+        assert sorted(DocumentService(index_dir).get_document_names()) == sorted(CORPUS_A)
+        assert self.service.get_document_count() == 0
+
+    def test_lazy_service_loads_on_first_use(self, tmp_path):
+        index_dir = str(tmp_path / "index")
+        service = DocumentService(index_dir)
+        service.reset_index({name: service._prepare(text) for name, text in CORPUS_A.items()})
+
+        lazy = DocumentService(index_dir, load=False)
+        assert not lazy.ready.is_set()
+        assert lazy._snapshot.index is None
+        assert sorted(lazy.get_document_names()) == sorted(CORPUS_A)
+        assert lazy.ready.is_set() and lazy.load_seconds is not None
+
+    def test_commit_before_load_keeps_indexed_documents(self, tmp_path):
+        index_dir = str(tmp_path / "index")
+        service = DocumentService(index_dir)
+        service.reset_index({name: service._prepare(text) for name, text in CORPUS_A.items()})
+
+        lazy = DocumentService(index_dir, load=False)
+        lazy.add_document("tenis.txt", CORPUS_B["tenis.txt"])
+        lazy.build_index()
+        assert sorted(lazy.get_document_names()) == sorted([*CORPUS_A, "tenis.txt"])
+
+    def test_searches_use_old_index_until_new_one_is_published(self):
+        self.reset(CORPUS_A)
+        building = threading.Event()
+        release = threading.Event()
+        build_segment = self.service._build_segment
+
+        def slow_build_segment(documents):
+            building.set()
+            release.wait(5)
+            return build_segment(documents)
+
+        self.service._build_segment = slow_build_segment
+        writer = threading.Thread(target=self.reset, args=(CORPUS_B,))
+        writer.start()
+        try:
+            assert building.wait(5)
+            results = self.service.search("lenguaje python", min_score=0.0)
+            assert [r['document_name'] for r in results] == ["python.txt"]
+        finally:
+            release.set()
+            writer.join(5)
+
+        assert self.service.search("lenguaje python", min_score=0.0) == []
+        assert self.service.search("juega tenis", min_score=0.0)[0]['document_name'] == "tenis.txt"
+
+    def test_concurrent_reads_during_reingest(self):
+        self.reset(CORPUS_A)
+        expected = {"python.txt", "tenis.txt"}
+        errors = []
+        done = threading.Event()
+
+        def reader():
+            while not done.is_set():
+                try:
+                    # Cada consulta ve un índice completo: el de A o el de B.
+                    results = self.service.search_batch(["lenguaje python", "juega tenis"], min_score=0.0)
+                    names = {r['document_name'] for query_results in results for r in query_results}
+                    if len(names) != 1 or not names <= expected:
+                        errors.append(names)
+                except Exception as e:
+                    errors.append(e)
+
+        readers = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in readers:
+            thread.start()
+        for corpus in (CORPUS_B, CORPUS_A) * 5:
+            self.reset(corpus)
+        done.set()
+        for thread in readers:
+            thread.join(5)
+
+        assert errors == []
+
+
+PHRASE_CORPUS = {
+    "ciencia.txt": "La ciencia de datos combina estadística y programación para analizar información.",
+    "invertido.txt": "Los datos de la ciencia moderna se publican en revistas abiertas.",
+    "lejos.txt": "La ciencia avanza rápido cuando muchos equipos comparten abiertamente sus datos.",
+    **CORPUS_A,
+    **CORPUS_B,
+}
+
+
+class TestPhraseQueries:
+
+    @pytest.fixture(autouse=True)
+    def service(self, tmp_path):
+        self.service = DocumentService(str(tmp_path / "index"))
+        self.service.reset_index({name: self.service._prepare(text) for name, text in PHRASE_CORPUS.items()})
+
+    def names(self, query):
+        return [result['document_name'] for result in self.service.search(query, min_score=0.0)]
+
+    def test_quoted_phrase_requires_consecutive_terms_in_order(self):
+        assert sorted(self.names("ciencia datos")) == ["ciencia.txt", "invertido.txt", "lejos.txt", "python.txt"]
+        assert sorted(self.names('"ciencia de datos"')) == ["ciencia.txt", "python.txt"]
+        assert self.names('“datos de la ciencia”') == ["invertido.txt"]
+        assert self.names('"ciencia de datos" estadística')[0] == "ciencia.txt"
+        # Comillas sin cerrar o frases solo de stopwords no restringen nada.
+        assert sorted(self.names('ciencia datos "de la')) == sorted(self.names("ciencia datos"))
+
+    def test_ask_uses_phrase_filter(self):
+        _, citations = self.service.answer_question('¿Qué combina la "ciencia de datos"?')
+        assert citations[0]['document_name'] == "ciencia.txt"
+        assert {citation['document_name'] for citation in citations} <= {"ciencia.txt", "python.txt"}
+
+    def test_proximity_boosts_close_terms(self):
+        boosted = {result['document_name']: result['relevance_score']
+                   for result in self.service.search("ciencia datos", min_score=0.0)}
+        self.service.proximity_weight = 0.0
+        self.service.query_cache.clear()
+        plain = {result['document_name']: result['relevance_score']
+                 for result in self.service.search("ciencia datos", min_score=0.0)}
+        assert boosted["ciencia.txt"] > plain["ciencia.txt"]
+        assert boosted["invertido.txt"] > plain["invertido.txt"]
+        assert boosted["lejos.txt"] == plain["lejos.txt"]
+
+
+    def test_duplicated_chunk_does_not_change_ranking(self, tmp_path):
+        # Seis chunks con los términos lejos y uno con los términos juntos
+        # pero menos BM25: solo lo sube la cercanía si entra a los candidatos.
+        corpus = {f"otro{i}.txt": f"Texto sobre tema{i} con palabras distintas y ninguna coincidencia."
+                  for i in range(12)}
+        corpus.update({f"lejos{i}.txt": f"alfa gris azul rojo verde negro blanco marron lila beta extra{i}"
+                       for i in range(6)})
+        corpus["junto.txt"] = "alfa beta " + " ".join(f"relleno{i}" for i in range(15))
+        corpus["mejor.txt"] = "La alfa beta va primero. Otra alfa beta alfa beta seguida."
+
+        rankings = []
+        for name, documents in (("unico", corpus), ("repetido", {**corpus, "copia.txt": corpus["mejor.txt"]})):
+            service = DocumentService(str(tmp_path / name / "index"))
+            service.reset_index({doc: service._prepare(text) for doc, text in documents.items()})
+            # Con la copia, el primer pedido no alcanza y se reintenta con más chunks.
+            rankings.append([result['document_name'] for result in service.search("alfa beta", top_k=2, min_score=0.0)])
+        assert rankings[0] == rankings[1] == ["mejor.txt", "lejos0.txt"]
+
+
+FUZZY_CORPUS = {
+    "musica.txt": "La canción más escuchada del año combina guitarra y percusión.",
+    "informes.txt": "Cada informe resume la información pública del trimestre.",
+    **CORPUS_A,
+}
+
+
+class TestFuzzyQueries:
+
+    @pytest.fixture(autouse=True)
+    def service(self, tmp_path):
+        self.service = DocumentService(str(tmp_path / "index"))
+        self.service.reset_index({name: self.service._prepare(text) for name, text in FUZZY_CORPUS.items()})
+
+    def names(self, query, **kwargs):
+        return [result['document_name'] for result in self.service.search(query, min_score=0.0, **kwargs)]
+
+    def test_missing_accents_and_typos_are_expanded(self):
+        assert self.names("cancion") == ["musica.txt"]
+        assert self.names("informacion publica") == ["informes.txt"]
+        assert self.names("lenguaje pyton") == ["python.txt"]
+        assert self.names("guitara percusion") == ["musica.txt"]
+
+    def test_toggle_disables_expansion(self):
+        assert self.names("cancion", fuzzy=False) == []
+        assert self.names("cancion") == ["musica.txt"]
+        assert self.names("canción", fuzzy=False) == ["musica.txt"]
+
+    def test_known_terms_and_phrases_are_not_expanded(self):
+        parsed = self.service._expand_query(self.service.bm25, self.service._parse_query('informe "pyton" cancion'))
+        assert parsed.tokens == ["informe", "pyton", "canción"]
+        assert parsed.min_matches == 2
+        assert self.names('"pyton"') == []
+
+    def test_replacements_of_one_term_count_as_one_match(self):
+        self.service.reset_index({name: self.service._prepare(text) for name, text in {
+            "a.txt": "El gato duerme sobre los datos del servidor.",
+            "b.txt": "La jirafa come hojas altas.",
+            "c.txt": "Un texto cualquiera de relleno.",
+        }.items()})
+        parsed = self.service._expand_query(self.service.bm25, self.service._parse_query("gatos jirafa"))
+        assert parsed.tokens == ["datos", "gato", "jirafa"]
+        assert parsed.groups == [0, 0, 1]
+        # Un chunk con los dos reemplazos de "gatos" pero sin "jirafa" no pasa el filtro.
+        assert self.names("gatos jirafa") == self.names("gato jirafa") == []
+
+    def test_ask_answers_misspelled_question(self):
+        answer, citations = self.service.answer_question("¿Qué combina la cancion?")
+        assert citations[0]['document_name'] == "musica.txt"
+        assert "guitarra" in answer
+
+
+class TestAsyncQueries:
+
+    def setup_method(self):
+        self.service = DocumentService()
+        self.service.clear_index()
+        self.service.reset_index({name: self.service._prepare(text) for name, text in CORPUS_A.items()})
+
+    def teardown_method(self):
+        self.service.clear_index()
+
+    @pytest.mark.asyncio
+    async def test_async_variants_match_sync_results(self):
+        assert await self.service.search_async("lenguaje python", min_score=0.0) == \
+            self.service.search("lenguaje python", min_score=0.0)
+        assert await self.service.answer_question_async("¿Qué es Java?") == self.service.answer_question("¿Qué es Java?")
+
+    @pytest.mark.asyncio
+    async def test_batch_timeout_returns_finished_groups(self):
+        self.service.query_group_size = 2
+        search_batch = self.service.search_batch
+
+        def slow_search_batch(queries, *args, **kwargs):
+            time.sleep(0.15)
+            return search_batch(queries, *args, **kwargs)
+
+        self.service.search_batch = slow_search_batch
+        queries = ["lenguaje python", "java máquina virtual", "paella arroz", "python datos", "java compilado"]
+        results = await self.service.search_batch_async(queries, min_score=0.0, timeout=0.25)
+        assert results[:2] == search_batch(queries[:2], min_score=0.0)
+        assert results[2:] == [None, None, None]
+
+    @pytest.mark.asyncio
+    async def test_timeout_cuts_scoring_at_deadline(self):
+        self.service.query_timeout = 0.0
+        assert await self.service.search_async("lenguaje python", min_score=0.0) is None
+        assert await self.service.search_async("lenguaje python", min_score=0.0, timeout=5) != []
+
+
+class ShardedDocumentService(DocumentService):
+    shard_count = 3
+
+
+class TestShardedService:
+
+    def teardown_method(self):
+        DocumentService().clear_index()
+
+    def search_all(self, service_class, queries):
+        service = service_class()
+        service.clear_index()
+        service.reset_index({name: service._prepare(text) for name, text in {**CORPUS_A, **CORPUS_B}.items()})
+        service.insert_document("sql.txt", "SQL es un lenguaje de consultas para bases de datos relacionales.")
+        service.delete_document("java.txt")
+        results = [service.search(query, top_k=3, min_score=0.0) for query in queries]
+        assert service.compact_index()
+        assert [service.search(query, top_k=3, min_score=0.0) for query in queries] == results
+        return service, results
+
+    def test_sharded_results_match_unsharded(self):
+        queries = ["lenguaje python datos", "juega tenis raqueta", "paella arroz pollo", "lenguaje consultas"]
+        sharded, sharded_results = self.search_all(ShardedDocumentService, queries)
+        assert len(sharded.bm25.shards) == 3
+        _, expected = self.search_all(DocumentService, queries)
+        assert sharded_results == expected
@@ -2,6 +2,7 @@ import pytest
 from fastapi import UploadFile
 from app.utils import file_utils
 import io
+import os
 
 class TestFileUtils:
 
@@ -55,3 +56,39 @@ class TestFileUtils:
         invalid_pdf = b"Not a PDF"
         assert file_utils.validate_file_content(valid_pdf_header, "archivo.pdf")
         assert not file_utils.validate_file_content(invalid_pdf, "archivo.pdf")
+
+    @pytest.mark.asyncio
+    async def test_extract_pdf_text_splits_page_ranges_in_order(self, monkeypatch, tmp_path):
+        from reportlab.pdfgen import canvas
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer)
+        for page in range(5):
+            c.drawString(100, 750, f"Pagina numero {page}")
+            c.showPage()
+        c.save()
+
+        monkeypatch.setattr(file_utils, "PDF_PAGES_PER_TASK", 2)
+        pdf_path = tmp_path / "paginas.pdf"
+        pdf_path.write_bytes(buffer.getvalue())
+        text = await file_utils.extract_pdf_text(str(pdf_path))
+        positions = [text.index(f"Pagina numero {page}") for page in range(5)]
+        assert positions == sorted(positions)
+
+    @pytest.mark.asyncio
+    async def test_spool_upload_aborts_when_size_exceeded(self, monkeypatch):
+        monkeypatch.setattr(file_utils, "UPLOAD_CHUNK_SIZE", 1024)
+        file = UploadFile(filename="grande.txt", file=io.BytesIO(b"a" * (2 * 1024 * 1024)))
+        with pytest.raises(file_utils.FileTooLargeError):
+            await file_utils.spool_upload(file, max_size_mb=1)
+        assert file.file.tell() <= 1024 * 1024 + 1024
+
+    @pytest.mark.asyncio
+    async def test_spool_upload_keeps_multibyte_text(self, monkeypatch):
+        monkeypatch.setattr(file_utils, "UPLOAD_CHUNK_SIZE", 3)
+        content = "Canción de acción: ñandú".encode("utf-8")
+        file = UploadFile(filename="texto.txt", file=io.BytesIO(content))
+        path = await file_utils.spool_upload(file)
+        try:
+            assert file_utils.read_text_file(path) == "Canción de acción: ñandú"
+        finally:
+            os.remove(path)
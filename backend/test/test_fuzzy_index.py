@@ -0,0 +1,44 @@
+import random
+
+from app.services.fuzzy_index import FuzzyIndex, edit_distance, fold_accents
+
+
+def brute_force_similar(terms, term):
+    folded = fold_accents(term)
+    return sorted(term_id for term_id, candidate in enumerate(terms)
+                  if edit_distance(folded, fold_accents(candidate)) is not None)
+
+
+class TestFuzzyIndex:
+
+    def test_fold_accents(self):
+        assert fold_accents("canción") == "cancion"
+        assert fold_accents("Pingüino") == "Pinguino"
+        assert fold_accents("año") == "ano"
+        assert fold_accents("python") == "python"
+
+    def test_edit_distance(self):
+        assert edit_distance("python", "python") == 0
+        assert edit_distance("pyton", "python") == 1
+        assert edit_distance("python", "pyhton") == 1
+        assert edit_distance("pithon", "python") == 1
+        assert edit_distance("pythons", "python") == 1
+        assert edit_distance("ptyhno", "python") is None
+        assert edit_distance("pyth", "python") is None
+        assert edit_distance("xpytho", "python") is None
+
+    def test_candidates_cover_every_term_within_one_edit(self):
+        rng = random.Random(0)
+        terms = sorted({"".join(rng.choice("abcdeñó") for _ in range(rng.randint(3, 7))) for _ in range(400)})
+        index = FuzzyIndex.build(terms)
+        queries = terms[::10] + ["abcde", "ñoñoa", "ccc", "aéb"]
+        for query in queries:
+            candidates = set(index.candidates(query).tolist())
+            assert set(brute_force_similar(terms, query)) <= candidates, query
+
+    def test_accents_are_folded_on_both_sides(self):
+        terms = ["canción", "informacion", "ñandú"]
+        index = FuzzyIndex.build(terms)
+        assert index.candidates("cancion").tolist() == [0]
+        assert index.candidates("información").tolist() == [1]
+        assert index.candidates("nandu").tolist() == [2]
@@ -0,0 +1,371 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from app.services.bm25_index import Segment
+from app.services.document_service import DocumentService
+from app.services.string_table import StringTable
+from app.services.index_store import (
+    FORMAT_VERSION, LOG_FILE, MANIFEST_FILE, append_log, create_index, load_index, load_segment, read_log,
+    read_manifest, save_segment, write_manifest
+)
+from app.utils.tokenizer import Tokenizer
+
+TOKENIZED = [
+    ["python", "lenguaje", "programación"],
+    ["java", "lenguaje", "compilado"],
+    ["bases", "datos", "sql"],
+]
+
+
+def build_segment(names, tokenized_chunks):
+    # Cada documento es "texto <nombre>" y sus chunks, en orden, la palabra "texto".
+    return Segment.build(names, [f"texto {name}" for name in names],
+                         [i % len(names) for i in range(len(tokenized_chunks))],
+                         [(0, 5)] * len(tokenized_chunks), tokenized_chunks)
+
+
+def downgrade_segment(directory, segment, version):
+    # Hasta la versión 6 los postings se guardaban sin comprimir.
+    docs, frequencies = segment.postings.arrays()
+    np.save(os.path.join(directory, "postings.docs.npy"), docs.astype(np.int32))
+    np.save(os.path.join(directory, "postings.freqs.npy"), frequencies.astype(np.int32))
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest['format_version'] = version
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+
+class TestIndexStore:
+
+    def test_segment_round_trip_is_memory_mapped(self, tmp_path):
+        directory = str(tmp_path / "seg-000001")
+        segment = build_segment(["a.txt", "b.txt"], TOKENIZED)
+        save_segment(directory, segment, k1=1.2, b=0.75, epsilon=0.25)
+
+        loaded = load_segment(directory)
+        assert isinstance(loaded.postings.doc_bytes, np.memmap)
+        assert isinstance(loaded.chunk_starts, np.memmap)
+        assert isinstance(loaded.document_texts.blob, np.memmap)
+        assert [loaded.chunk_text(i) for i in range(3)] == ["texto"] * 3
+        assert list(loaded.document_names) == ["a.txt", "b.txt"]
+        assert list(loaded.chunk_documents) == [0, 1, 0]
+        assert loaded.term_postings("lenguaje")[1].tolist() == [0, 1]
+
+    def test_sentence_index_round_trip(self, tmp_path):
+        directory = str(tmp_path / "seg-000001")
+        segment = Segment.build(["a.txt"], ["Año uno. Canción dos."], [0], [(0, 23)], [["año", "uno", "canción", "dos"]],
+                                sentences=([0, 0], [(0, 9), (10, 23)], [["año", "uno"], ["canción", "dos"]]))
+        save_segment(directory, segment, k1=1.2, b=0.75, epsilon=0.25)
+
+        loaded = load_segment(directory)
+        assert isinstance(loaded.sentences.terms, np.memmap)
+        assert list(loaded.sentences.chunk_sentences(0)) == [0, 1]
+        assert [loaded.sentence_text(i) for i in range(2)] == ["Año uno.", "Canción dos."]
+        assert loaded.sentences.match_counts(range(0, 2), loaded.term_ids(["dos", "canción", "otra"])).tolist() == [0, 2]
+
+    def test_max_weights_are_stored_or_recomputed(self, tmp_path):
+        directory = str(tmp_path / "seg-000001")
+        segment = build_segment(["a.txt", "b.txt"], TOKENIZED)
+        save_segment(directory, segment, k1=1.2, b=0.75, epsilon=0.25)
+        loaded = load_segment(directory)
+        assert isinstance(loaded.max_weights, np.memmap)
+        assert loaded.max_weights.tolist() == segment.max_weights.tolist()
+
+        # Formato 4: sin cotas guardadas, se calculan al abrir el segmento.
+        os.remove(os.path.join(directory, "max_weights.npy"))
+        downgrade_segment(directory, segment, 4)
+        assert load_segment(directory).max_weights.tolist() == segment.max_weights.tolist()
+
+    def test_uncompressed_postings_are_still_read(self, tmp_path):
+        directory = str(tmp_path / "seg-000001")
+        segment = build_segment(["a.txt", "b.txt"], TOKENIZED)
+        save_segment(directory, segment, k1=1.2, b=0.75, epsilon=0.25)
+        downgrade_segment(directory, segment, 6)
+
+        loaded = load_segment(directory)
+        assert isinstance(loaded.postings.docs, np.memmap)
+        for term in segment.vocab:
+            expected = segment.term_postings(term)
+            actual = loaded.term_postings(term)
+            assert actual[0] == expected[0]
+            assert actual[1].tolist() == expected[1].tolist() and actual[2].tolist() == expected[2].tolist()
+
+    def test_positions_round_trip(self, tmp_path):
+        directory = str(tmp_path / "seg-000001")
+        segment = build_segment(["a.txt", "b.txt"], TOKENIZED + [["datos", "python", "lenguaje"]])
+        save_segment(directory, segment, k1=1.2, b=0.75, epsilon=0.25)
+
+        loaded = load_segment(directory)
+        assert isinstance(loaded.positions.values, np.memmap)
+        assert loaded.positions.values.tolist() == segment.positions.values.tolist()
+        assert loaded.phrase_chunks(["python", "lenguaje"]).tolist() == [0, 3]
+
+        # Sin posiciones (formato 7) una frase solo exige sus términos.
+        downgrade_segment(directory, segment, 7)
+        loaded = load_segment(directory)
+        assert loaded.positions is None
+        assert loaded.phrase_chunks(["lenguaje", "python"]).tolist() == [0, 3]
+
+    def test_fuzzy_index_round_trip(self, tmp_path):
+        directory = str(tmp_path / "seg-000001")
+        segment = build_segment(["a.txt"], [["canción", "python"], ["información"]])
+        save_segment(directory, segment, k1=1.2, b=0.75, epsilon=0.25)
+
+        loaded = load_segment(directory)
+        assert isinstance(loaded.fuzzy.keys, np.memmap)
+        assert loaded.fuzzy.keys.tolist() == segment.fuzzy.keys.tolist()
+        assert loaded.vocab[int(loaded.fuzzy.candidates("cancion")[0])] == "canción"
+
+        # Sin el índice guardado (formato 8) se arma del vocabulario al usarlo.
+        downgrade_segment(directory, segment, 8)
+        loaded = load_segment(directory)
+        assert loaded.fuzzy.terms.tolist() == segment.fuzzy.terms.tolist()
+
+    def test_version_2_segment_is_converted_to_offsets(self, tmp_path):
+        directory = str(tmp_path / "seg-000001")
+        segment = Segment.build(["a.txt"], ["Año uno. Canción dos."], [0, 0], [(0, 9), (10, 23)], TOKENIZED[:2])
+        save_segment(directory, segment, k1=1.2, b=0.75, epsilon=0.25)
+
+        # Formato anterior: el texto de cada chunk en una tabla y sin offsets.
+        os.remove(os.path.join(directory, "chunk_starts.npy"))
+        os.remove(os.path.join(directory, "chunk_ends.npy"))
+        chunks = StringTable.from_strings(["Año uno.", "Canción dos."])
+        np.save(os.path.join(directory, "chunks.blob.npy"), chunks.blob)
+        np.save(os.path.join(directory, "chunks.offsets.npy"), chunks.offsets)
+        downgrade_segment(directory, segment, 2)
+
+        loaded = load_segment(directory)
+        assert [loaded.chunk_text(i) for i in range(2)] == ["Año uno.", "Canción dos."]
+
+    def test_load_index_replays_log(self, tmp_path):
+        index_dir = str(tmp_path / "index")
+        create_index(index_dir)
+        save_segment(os.path.join(index_dir, "seg-000001"), build_segment(["a.txt", "b.txt"], TOKENIZED[:2]),
+                     k1=1.2, b=0.75, epsilon=0.25)
+        save_segment(os.path.join(index_dir, "seg-000002"), build_segment(["c.txt"], TOKENIZED[2:]),
+                     k1=1.2, b=0.75, epsilon=0.25)
+        append_log(index_dir, [{'op': 'add', 'segment': "seg-000001"}])
+        append_log(index_dir, [{'op': 'add', 'segment': "seg-000002"}, {'op': 'delete', 'documents': ["a.txt"]}])
+
+        index = load_index(index_dir)
+        assert len(index.segments) == 2
+        assert index.corpus_size == 2
+        assert [name for _, _, name in index.live_documents()] == ["b.txt", "c.txt"]
+        assert len(read_log(index_dir)) == 3
+
+    def test_missing_index_returns_none(self, tmp_path):
+        assert load_index(str(tmp_path / "no-existe")) is None
+
+    def test_unknown_format_version_is_rejected(self, tmp_path):
+        index_dir = str(tmp_path / "index")
+        create_index(index_dir)
+        with open(os.path.join(index_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'format_version': 999}, f)
+        with pytest.raises(ValueError):
+            load_index(index_dir)
+
+
+class TestDocumentServicePersistence:
+
+    def setup_method(self):
+        self.service = DocumentService()
+        self.service.clear_index()
+        self.service.add_document("python.txt", "Python es un lenguaje de programación muy usado para ciencia de datos.")
+        self.service.add_document("java.txt", "Java es un lenguaje compilado que corre sobre la máquina virtual.")
+        self.service.add_document("cocina.txt", "La receta lleva harina, huevos y azúcar batidos durante diez minutos.")
+        self.service.build_index()
+
+    def teardown_method(self):
+        self.service.clear_index()
+
+    def test_reload_serves_same_results(self):
+        expected = self.service.search("lenguaje de programación Python")
+
+        reloaded = DocumentService()
+        assert reloaded.get_document_names() == ["python.txt", "java.txt", "cocina.txt"]
+        assert reloaded.search("lenguaje de programación Python") == expected
+
+    def test_insert_document_adds_a_segment(self):
+        self.service.insert_document("sql.txt", "SQL es un lenguaje de consultas para bases de datos relacionales.")
+        assert self.service.get_document_count() == 4
+        assert len(self.service.bm25.segments) == 2
+        assert self.service.search("consultas bases de datos relacionales")[0]['document_name'] == "sql.txt"
+
+        with pytest.raises(ValueError):
+            self.service.insert_document("sql.txt", "otro contenido")
+
+        reloaded = DocumentService()
+        assert reloaded.get_document_count() == 4
+        assert reloaded.search("consultas bases de datos relacionales")[0]['document_name'] == "sql.txt"
+
+    def test_concurrent_insert_of_same_name_keeps_one_copy(self, monkeypatch):
+        # Otro worker ya comprobó que el documento no existía cuando este lo agrega.
+        other = DocumentService()
+        monkeypatch.setattr(other, "has_document", lambda filename: False)
+        self.service.insert_document("sql.txt", "SQL es un lenguaje de consultas para bases de datos relacionales.")
+        with pytest.raises(ValueError):
+            other.insert_document("sql.txt", "Otro texto sobre consultas SQL y bases de datos relacionales.")
+
+        reloaded = DocumentService()
+        assert reloaded.get_document_count() == 4
+        assert len(reloaded.bm25.segments) == 2
+        assert [name for _, _, name in reloaded.bm25.live_documents()].count("sql.txt") == 1
+
+    def test_failed_save_keeps_serving_the_saved_index(self, monkeypatch):
+        def disk_full(*args, **kwargs):
+            raise OSError("disco lleno")
+        documents = {"sql.txt": self.service._prepare("SQL consulta bases de datos relacionales.")}
+        with monkeypatch.context() as patch:
+            patch.setattr("app.services.document_service.rewrite_log", disk_full)
+            patch.setattr("app.services.document_service.append_log", disk_full)
+            with pytest.raises(OSError):
+                self.service.reset_index(documents)
+            with pytest.raises(OSError):
+                self.service.insert_document("sql.txt", "SQL consulta bases de datos relacionales.")
+
+        # Ni este worker ni uno nuevo ven un índice que no quedó en disco.
+        expected = ["python.txt", "java.txt", "cocina.txt"]
+        assert self.service.get_document_names() == expected
+        assert DocumentService().get_document_names() == expected
+        self.service.reset_index(documents)
+        assert DocumentService().get_document_names() == ["sql.txt"]
+
+    def test_newer_format_is_not_deleted_on_startup(self):
+        # Otro worker, ya con una versión posterior, reescribió el índice.
+        manifest = read_manifest(self.service.index_dir)
+        write_manifest(self.service.index_dir, {**manifest, 'format_version': FORMAT_VERSION + 1})
+        assert DocumentService().get_document_count() == 0
+        assert os.path.exists(os.path.join(self.service.index_dir, LOG_FILE))
+
+        write_manifest(self.service.index_dir, manifest)
+        assert DocumentService().get_document_count() == 3
+
+    def test_read_errors_do_not_delete_the_index(self, monkeypatch):
+        def unreadable(*args, **kwargs):
+            raise OSError("disco no disponible")
+        with monkeypatch.context() as patch:
+            patch.setattr("app.services.document_service.load_index", unreadable)
+            assert DocumentService().get_document_count() == 0
+        assert DocumentService().get_document_count() == 3
+
+    def test_corrupt_log_is_discarded(self):
+        with open(os.path.join(self.service.index_dir, LOG_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'op': 'add'}) + "\n")
+        assert DocumentService().get_document_count() == 0
+        assert not os.path.exists(os.path.join(self.service.index_dir, LOG_FILE))
+
+    def test_replace_and_delete_document(self):
+        assert self.service.replace_document("cocina.txt", "Rust es un lenguaje de sistemas con gestión de memoria segura.")
+        assert self.service.get_document_count() == 3
+        assert all(r['document_name'] != "cocina.txt" for r in self.service.search("receta harina huevos azúcar"))
+
+        self.service.delete_document("java.txt")
+        assert not self.service.has_document("java.txt")
+        assert all(r['document_name'] != "java.txt" for r in self.service.search("Java compilado máquina virtual"))
+        with pytest.raises(KeyError):
+            self.service.delete_document("java.txt")
+
+        reloaded = DocumentService()
+        assert sorted(reloaded.get_document_names()) == ["cocina.txt", "python.txt"]
+
+    def test_compaction_matches_incremental_index(self):
+        self.service.insert_document("sql.txt", "SQL es un lenguaje de consultas para bases de datos relacionales.")
+        self.service.delete_document("java.txt")
+        expected = self.service.search("lenguaje de consultas", min_score=0.0)
+
+        assert self.service.compact_index()
+        assert len(self.service.bm25.segments) == 1
+        assert self.service.search("lenguaje de consultas", min_score=0.0) == expected
+        assert len(read_log(self.service.index_dir)) == 1
+
+        reloaded = DocumentService()
+        assert reloaded.search("lenguaje de consultas", min_score=0.0) == expected
+
+    def test_index_from_previous_format_is_rebuilt(self):
+        manifest_path = os.path.join(self.service.index_dir, MANIFEST_FILE)
+        manifest = read_manifest(self.service.index_dir)
+        manifest['format_version'] = 4
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+        reloaded = DocumentService()
+        assert read_manifest(reloaded.index_dir)['format_version'] == FORMAT_VERSION
+        assert reloaded.get_document_names() == ["python.txt", "java.txt", "cocina.txt"]
+
+    def test_index_is_retokenized_when_tokenizer_changes(self, monkeypatch):
+        assert read_manifest(self.service.index_dir)['tokenizer'] == self.service.tokenizer.config()
+
+        stemming = Tokenizer(stem=True)
+        monkeypatch.setattr(DocumentService, "tokenizer", stemming)
+        reloaded = DocumentService()
+
+        assert read_manifest(reloaded.index_dir)['tokenizer'] == stemming.config()
+        assert reloaded.get_document_names() == ["python.txt", "java.txt", "cocina.txt"]
+        assert reloaded.bm25.doc_freq("lenguaje") == 2
+        assert reloaded.bm25.doc_freq("huevo") == 1
+
+
+def insert_from_other_process(filename, text):
+    service = DocumentService()
+    service.insert_document(filename, text)
+
+
+class TestSharedIndexAcrossWorkers:
+
+    def setup_method(self):
+        # Dos instancias sobre el mismo directorio se comportan como dos workers.
+        self.first = DocumentService()
+        self.first.clear_index()
+        self.second = DocumentService()
+
+    def teardown_method(self):
+        self.first.clear_index()
+
+    def test_changes_are_visible_without_restart(self):
+        self.first.add_document("python.txt", "Python es un lenguaje de programación muy usado para ciencia de datos.")
+        self.first.add_document("java.txt", "Java es un lenguaje compilado que corre sobre la máquina virtual.")
+        self.first.add_document("cocina.txt", "La receta lleva harina, huevos y azúcar batidos durante diez minutos.")
+        self.first.build_index()
+        assert self.second.get_document_names() == ["python.txt", "java.txt", "cocina.txt"]
+        assert self.second.search("lenguaje compilado java") == self.first.search("lenguaje compilado java")
+
+        self.second.insert_document("sql.txt", "SQL es un lenguaje de consultas para bases de datos relacionales.")
+        self.first.delete_document("java.txt")
+        assert sorted(self.first.get_document_names()) == ["cocina.txt", "python.txt", "sql.txt"]
+        assert sorted(self.second.get_document_names()) == ["cocina.txt", "python.txt", "sql.txt"]
+        assert self.second.search("consultas bases de datos relacionales", min_score=0.0)[0]['document_name'] == "sql.txt"
+        assert read_manifest(self.first.index_dir)['generation'] == 3
+
+        self.second.clear_index()
+        assert self.first.get_document_count() == 0
+
+    def test_segment_names_do_not_collide(self):
+        self.first.insert_document("a.txt", "Primer documento con suficiente texto para indexar.")
+        self.second.insert_document("b.txt", "Segundo documento con suficiente texto para indexar.")
+        self.first.insert_document("c.txt", "Tercer documento con suficiente texto para indexar.")
+        assert [record['segment'] for record in read_log(self.first.index_dir)] == ["seg-000001", "seg-000002", "seg-000003"]
+        assert sorted(DocumentService().get_document_names()) == ["a.txt", "b.txt", "c.txt"]
+
+    def test_reset_from_other_worker_is_atomic(self):
+        self.first.insert_document("a.txt", "Primer documento con suficiente texto para indexar.")
+        self.second.reset_index({"b.txt": self.second._prepare("Segundo documento con suficiente texto para indexar.")})
+        assert self.first.get_document_names() == ["b.txt"]
+        assert [record['segment'] for record in read_log(self.first.index_dir)] == ["seg-000002"]
+        assert not os.path.exists(os.path.join(self.first.index_dir, "seg-000001"))
+
+    def test_change_from_another_process(self):
+        import multiprocessing
+
+        self.first.insert_document("a.txt", "Primer documento con suficiente texto para indexar.")
+        process = multiprocessing.get_context("spawn").Process(
+            target=insert_from_other_process, args=("b.txt", "Segundo documento escrito por otro proceso.")
+        )
+        process.start()
+        process.join(60)
+        assert process.exitcode == 0
+        assert self.first.get_document_names() == ["a.txt", "b.txt"]
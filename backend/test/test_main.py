@@ -1,6 +1,14 @@
+import asyncio
+import threading
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
+from app import main
 from app.main import app
+from app.services.document_service import DocumentService
+from app.utils import process_pool, query_executor
+from app.utils.text_utils import prepare_document
 
 client = TestClient(app)
 
@@ -48,3 +56,77 @@ class TestIntegration:
             response = client.get("/health")
             assert response.status_code == 200
             assert response.json() == {"status": "healthy"}
+
+
+class TestReadiness:
+
+    @pytest.fixture
+    def loading_service(self, tmp_path, monkeypatch):
+        # Un servicio cuya carga queda detenida hasta que el test la libere.
+        service = DocumentService(str(tmp_path / "index"), load=False)
+        release = threading.Event()
+        load_index = service._load_index
+
+        def slow_load_index():
+            release.wait(5)
+            load_index()
+
+        service._load_index = slow_load_index
+        monkeypatch.setattr(main, "document_service", service)
+        yield service, release
+        release.set()
+
+    def test_health_answers_while_index_loads(self, loading_service):
+        service, release = loading_service
+        service.load_in_background()
+
+        assert client.get("/health").status_code == 200
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json() == {"status": "loading"}
+
+        release.set()
+        assert service.ready.wait(5)
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+
+    def test_requests_get_503_if_loading_takes_too_long(self, loading_service, monkeypatch):
+        monkeypatch.setattr(main, "INDEX_READY_TIMEOUT", 0.05)
+        response = client.get("/api/search", params={"q": "python"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_load(self, loading_service, monkeypatch):
+        service, release = loading_service
+        calls = []
+        load = service.load
+        monkeypatch.setattr(service, "load", lambda: calls.append(1) or load())
+
+        # Sin lifespan, como si el primer request llegara antes de la carga.
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            requests = [asyncio.create_task(http.get("/api/search", params={"q": "python"})) for _ in range(8)]
+            await asyncio.sleep(0.2)
+            release.set()
+            responses = await asyncio.gather(*requests)
+
+        assert len(calls) == 1
+        assert [response.status_code for response in responses] == [404] * 8
+
+    def test_lifespan_loads_index_in_background(self, tmp_path, monkeypatch):
+        index_dir = str(tmp_path / "index")
+        DocumentService(index_dir).reset_index({"python.txt": prepare_document("Python es un lenguaje.")})
+        service = DocumentService(index_dir, load=False)
+        monkeypatch.setattr(main, "document_service", service)
+
+        with TestClient(app) as started:
+            assert service.ready.wait(5)
+            assert started.get("/ready").status_code == 200
+            process_pool.get_process_pool()
+            query_executor.get_query_executor()
+            query_executor.get_shard_executor()
+        assert service.get_document_names() == ["python.txt"]
+        # Al apagar se liberan los procesos de la ingesta y los hilos de las consultas.
+        assert process_pool._executor is None
+        assert query_executor._executor is None and query_executor._shard_executor is None
@@ -0,0 +1,92 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils.metrics import Counter, Gauge, Histogram, Registry, collect_spans, record_spans, span
+from app.utils.text_utils import prepare_document
+
+client = TestClient(app)
+
+
+def stage_count(text: str, stage: str) -> int:
+    prefix = f'qa_stage_duration_seconds_count{{stage="{stage}"}} '
+    lines = [line for line in text.splitlines() if line.startswith(prefix)]
+    return int(lines[0][len(prefix):]) if lines else 0
+
+
+class TestRegistry:
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        histogram = registry.register(Histogram("latencia", "Latencia.", ("ruta",), buckets=(0.1, 1.0)))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, "/api/ask")
+        lines = registry.render().splitlines()
+
+        assert "# TYPE latencia histogram" in lines
+        assert 'latencia_bucket{ruta="/api/ask",le="0.1"} 2' in lines
+        assert 'latencia_bucket{ruta="/api/ask",le="1"} 3' in lines
+        assert 'latencia_bucket{ruta="/api/ask",le="+Inf"} 4' in lines
+        assert 'latencia_sum{ruta="/api/ask"} 3.65' in lines
+        assert 'latencia_count{ruta="/api/ask"} 4' in lines
+
+    def test_counters_gauges_and_callbacks(self):
+        registry = Registry()
+        registry.register(Counter("pedidos_total", "Pedidos.", ("estado",))).inc("200", amount=2)
+        registry.register(Gauge("chunks", "Chunks.", callback=lambda: [((), 42)]))
+        lines = registry.render().splitlines()
+        assert 'pedidos_total{estado="200"} 2' in lines
+        assert "chunks 42" in lines
+
+    def test_label_values_are_escaped(self):
+        registry = Registry()
+        registry.register(Counter("archivos_total", "Archivos.", ("nombre",))).inc('a"b\\c')
+        assert 'archivos_total{nombre="a\\"b\\\\c"} 1' in registry.render()
+
+    def test_duplicate_names_are_rejected(self):
+        registry = Registry()
+        registry.register(Gauge("chunks", "Chunks."))
+        with pytest.raises(ValueError):
+            registry.register(Gauge("chunks", "Otra."))
+
+
+class TestSpans:
+
+    def test_spans_from_pool_are_returned_and_recorded(self):
+        before = stage_count(client.get("/metrics").text, "tokenize")
+        prepared, spans = collect_spans(prepare_document, "Python es un lenguaje. Se usa en ciencia de datos.")
+        assert prepared.chunk_spans
+        assert {labels for _, labels, _ in spans} == {("clean",), ("chunk",), ("tokenize",)}
+        # Mientras se juntan no se observan en el registro local.
+        assert stage_count(client.get("/metrics").text, "tokenize") == before
+
+        record_spans(spans)
+        assert stage_count(client.get("/metrics").text, "tokenize") == before + 1
+
+    def test_span_observes_outside_collector(self):
+        before = stage_count(client.get("/metrics").text, "prueba")
+        with span("prueba"):
+            pass
+        assert stage_count(client.get("/metrics").text, "prueba") == before + 1
+
+
+class TestMetricsEndpoint:
+
+    def test_exposes_request_latency_and_index_gauges(self):
+        client.get("/health")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        text = response.text
+        assert 'qa_http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in text
+        assert "# TYPE qa_index_chunks gauge" in text
+        assert "qa_index_disk_bytes " in text
+        assert 'qa_query_cache_requests_total{result="hit"}' in text
+        assert "qa_query_cache_hit_ratio " in text
+
+    def test_unmatched_routes_share_one_label(self):
+        client.get("/no-existe-1")
+        client.get("/no-existe-2")
+        text = client.get("/metrics").text
+        assert 'route="unmatched",status="404"' in text
+        assert "no-existe" not in text
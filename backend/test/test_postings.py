@@ -0,0 +1,46 @@
+import numpy as np
+
+from app.services.postings import CompressedPostings, PostingLists
+
+
+def random_postings(counts, chunk_count, seed=0):
+    rng = np.random.default_rng(seed)
+    docs = [np.sort(rng.choice(chunk_count, size=count, replace=False)) for count in counts]
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    docs = np.concatenate(docs).astype(np.int32) if docs else np.empty(0, dtype=np.int32)
+    frequencies = rng.integers(1, 5, size=len(docs)).astype(np.int32)
+    return offsets, docs, frequencies
+
+
+class TestCompressedPostings:
+
+    def test_terms_decode_to_the_original_postings(self):
+        # Términos vacíos, densos (diferencias de un byte) y dispersos (de dos y cuatro bytes).
+        offsets, docs, frequencies = random_postings([0, 3, 200, 0, 40, 1], chunk_count=3_000_000)
+        compressed = CompressedPostings.encode(offsets, docs, frequencies)
+        raw = PostingLists(offsets, docs, frequencies)
+
+        for term_id in range(len(offsets) - 1):
+            expected_docs, expected_tf = raw.term(term_id)
+            actual_docs, actual_tf = compressed.term(term_id)
+            assert actual_docs.dtype == np.int32
+            assert actual_docs.tolist() == expected_docs.tolist()
+            assert actual_tf.tolist() == expected_tf.tolist()
+
+        all_docs, all_tf = compressed.arrays()
+        assert all_docs.tolist() == docs.tolist() and all_tf.tolist() == frequencies.tolist()
+
+    def test_widths_follow_the_largest_gap_of_each_term(self):
+        offsets = np.array([0, 3, 5, 7], dtype=np.int64)
+        docs = np.array([0, 1, 255, 10, 300, 5, 70000], dtype=np.int32)
+        compressed = CompressedPostings.encode(offsets, docs, np.ones(7, dtype=np.int32))
+        assert np.diff(compressed.doc_starts).tolist() == [3 * 1, 2 * 2, 2 * 4]
+        assert compressed.frequencies.dtype == np.uint8
+        assert compressed.term(2)[0].tolist() == [5, 70000]
+
+    def test_dense_postings_take_about_two_bytes(self):
+        offsets, docs, frequencies = random_postings([5000] * 20, chunk_count=20000)
+        compressed = CompressedPostings.encode(offsets, docs, frequencies)
+        raw = PostingLists(offsets, docs, frequencies)
+        assert compressed.nbytes < raw.nbytes / 3
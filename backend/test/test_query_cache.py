@@ -0,0 +1,68 @@
+from app.services.document_service import DocumentService
+from app.services.query_cache import QueryCache
+
+
+class TestQueryCache:
+
+    def test_hit_requires_same_generation(self):
+        cache = QueryCache(max_size=4)
+        cache.put("consulta", ["resultado"], generation=1)
+        assert cache.get("consulta", generation=1) == ["resultado"]
+        assert cache.get("consulta", generation=2) is None
+        assert cache.get("consulta", generation=1) is None
+        assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = QueryCache(max_size=2)
+        cache.put("a", 1, generation=0)
+        cache.put("b", 2, generation=0)
+        cache.get("a", generation=0)
+        cache.put("c", 3, generation=0)
+        assert cache.get("b", generation=0) is None
+        assert cache.get("a", generation=0) == 1 and cache.get("c", generation=0) == 3
+
+    def test_entries_expire(self):
+        cache = QueryCache(ttl=0.0)
+        cache.put("a", 1, generation=0)
+        assert cache.get("a", generation=0) is None
+
+
+class TestDocumentServiceQueryCache:
+
+    def setup_method(self):
+        self.service = DocumentService()
+        self.service.clear_index()
+        self.service.add_document("python.txt", "Python es un lenguaje de programación muy usado para ciencia de datos.")
+        self.service.add_document("java.txt", "Java es un lenguaje compilado que corre sobre la máquina virtual.")
+        self.service.add_document("cocina.txt", "La receta lleva harina, huevos y azúcar batidos durante diez minutos.")
+        self.service.build_index()
+
+    def teardown_method(self):
+        self.service.clear_index()
+
+    def test_repeated_query_is_served_from_cache(self):
+        first = self.service.search("Lenguaje de programación Python", min_score=0.0)
+        second = self.service.search("  lenguaje de   programación python ", min_score=0.0)
+        assert first and first == second
+        assert self.service.get_index_info()['query_cache']['hits'] == 1
+
+        second[0]['text'] = "modificado"
+        assert self.service.search("lenguaje de programación python", min_score=0.0) == first
+
+    def test_ingest_invalidates_cached_results(self):
+        query = "consultas bases de datos relacionales"
+        assert self.service.search(query, min_score=0.0) == []
+        generation = self.service.get_index_info()['index_generation']
+
+        self.service.insert_document("sql.txt", "SQL es un lenguaje de consultas para bases de datos relacionales.")
+        assert self.service.get_index_info()['index_generation'] > generation
+        assert self.service.search(query, min_score=0.0)[0]['document_name'] == "sql.txt"
+
+    def test_answer_question_is_cached(self):
+        expected = self.service.answer_question("¿Para qué se usa Python?")
+        hits = self.service.get_index_info()['query_cache']['hits']
+        assert self.service.answer_question("¿para qué se usa python?") == expected
+        assert self.service.get_index_info()['query_cache']['hits'] == hits + 1
+
+        self.service.clear_index()
+        assert self.service.answer_question("¿Para qué se usa Python?")[1] == []
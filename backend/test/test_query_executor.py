@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.utils import query_executor
+
+
+class TestQueryExecutor:
+
+    def setup_method(self):
+        query_executor.shutdown_query_executor()
+
+    def teardown_method(self):
+        query_executor.shutdown_query_executor()
+
+    @pytest.mark.asyncio
+    async def test_runs_off_the_event_loop(self):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        thread = await query_executor.run_in_query_executor(lambda: (time.sleep(0.2), threading.current_thread())[1])
+        task.cancel()
+        assert thread is not threading.main_thread()
+        assert ticks >= 5
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit(self, monkeypatch):
+        monkeypatch.setenv("QUERY_WORKERS", "2")
+        running = 0
+        max_running = 0
+        lock = threading.Lock()
+
+        def work():
+            nonlocal running, max_running
+            with lock:
+                running += 1
+                max_running = max(max_running, running)
+            time.sleep(0.05)
+            with lock:
+                running -= 1
+
+        await asyncio.gather(*(query_executor.run_in_query_executor(work) for _ in range(6)))
+        assert max_running == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_while_waiting_never_runs(self, monkeypatch):
+        monkeypatch.setenv("QUERY_WORKERS", "1")
+        started = []
+        slow = asyncio.ensure_future(query_executor.run_in_query_executor(time.sleep, 0.2))
+        await asyncio.sleep(0.01)
+        with pytest.raises(TimeoutError):
+            await asyncio.wait_for(query_executor.run_in_query_executor(started.append, 1), 0.05)
+        await slow
+        assert started == []
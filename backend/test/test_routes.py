@@ -1,10 +1,20 @@
+import asyncio
+import time
+
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
-from app.services.document_service import DocumentService
+from app.services.document_service import document_service
 
 client = TestClient(app)
 
+def index_sample_documents():
+    document_service.add_document("python.txt", "Python es un lenguaje de programación interpretado. Python es muy popular para ciencia de datos.")
+    document_service.add_document("sql.txt", "SQL es un lenguaje de consultas para bases de datos relacionales. Las bases de datos guardan información.")
+    document_service.add_document("cocina.txt", "La paella valenciana lleva arroz, azafrán y pollo. Se cocina en una paellera ancha.")
+    document_service.add_document("futbol.txt", "El fútbol se juega con once jugadores por equipo. El arquero puede usar las manos.")
+    document_service.build_index()
+
 class TestRootAndHealth:
     def test_root(self):
         response = client.get("/")
@@ -26,7 +36,7 @@ class TestRootAndHealth:
 class TestSearchEndpoints:
     @pytest.fixture(autouse=True)
     def setup_service(self):
-        self.service = DocumentService()
+        self.service = document_service
         self.service.clear_index()
         yield
         self.service.clear_index()
@@ -40,11 +50,97 @@ class TestSearchEndpoints:
         response = client.get("/api/search?q=")
         assert response.status_code == 422
 
+    def test_search_top_k_parameter(self):
+        index_sample_documents()
+        response = client.get("/api/search?q=lenguaje bases datos&top_k=1&min_score=0")
+        assert response.status_code == 200
+        assert response.json()["total_results"] == 1
+
+        response = client.get("/api/search?q=Python&top_k=0")
+        assert response.status_code == 422
+
+    def test_search_batch_keeps_input_order(self):
+        index_sample_documents()
+        queries = ["bases de datos", "Python interpretado", "inexistente", "lenguaje de consultas"]
+        response = client.post("/api/search/batch", json={"queries": queries, "top_k": 3, "min_score": 0})
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [result["query"] for result in results] == queries
+        for query, result in zip(queries, results):
+            single = client.get("/api/search", params={"q": query, "top_k": 3, "min_score": 0}).json()
+            assert result == single
+
+    def test_search_fuzzy_toggle(self):
+        index_sample_documents()
+        response = client.get("/api/search", params={"q": "futbol jugadores", "min_score": 0})
+        assert response.json()["results"][0]["document_name"] == "futbol.txt"
+        response = client.get("/api/search", params={"q": "futbol pyton", "min_score": 0, "fuzzy": "false"})
+        assert response.json()["total_results"] == 0
+
+        payload = {"queries": ["paela valenciana"], "min_score": 0}
+        assert client.post("/api/search/batch", json=payload).json()["results"][0]["total_results"] == 1
+        payload["fuzzy"] = False
+        assert client.post("/api/search/batch", json=payload).json()["results"][0]["total_results"] == 0
+
+        answer = client.post("/api/ask", json={"question": "¿Qué lleva la paela?", "fuzzy": True}).json()
+        assert answer["citations"][0]["document_name"] == "cocina.txt"
+
+    def test_reload_runs_off_the_event_loop(self, monkeypatch):
+        # Otro worker publicó una generación nueva: la recarga no puede
+        # correr dentro del event loop.
+        index_sample_documents()
+        reload = document_service._reload
+        on_loop = []
+
+        def record_reload():
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            reload()
+
+        monkeypatch.setattr(document_service, "_reload", record_reload)
+        for request in (lambda: client.get("/api/search", params={"q": "Python"}),
+                        lambda: client.post("/api/ask", json={"question": "Python"}),
+                        lambda: client.get("/api/index/info"),
+                        lambda: client.get("/metrics")):
+            document_service._stamp = None
+            assert request().status_code == 200
+        assert on_loop and not any(on_loop)
+
+    def test_search_batch_validation(self):
+        index_sample_documents()
+        assert client.post("/api/search/batch", json={"queries": []}).status_code == 422
+        assert client.post("/api/search/batch", json={"queries": [""]}).status_code == 422
+        assert client.post("/api/search/batch", json={"queries": ["python"] * 501}).status_code == 422
+
+    def test_search_timeout_marks_pending_queries(self, monkeypatch):
+        index_sample_documents()
+        search_batch = document_service.search_batch
+
+        def slow_search_batch(queries, *args, **kwargs):
+            time.sleep(0.2)
+            return search_batch(queries, *args, **kwargs)
+
+        monkeypatch.setattr(document_service, "search_batch", slow_search_batch)
+        response = client.get("/api/search?q=Python&timeout=0.05")
+        assert response.status_code == 200
+        assert response.json()["timed_out"] is True and response.json()["results"] == []
+
+        response = client.post("/api/search/batch", json={"queries": ["Python"], "timeout": 0.05})
+        assert response.json()["results"][0]["timed_out"] is True
+        assert client.get("/api/search?q=Python&timeout=120").status_code == 422
+
+    def test_search_batch_no_documents(self):
+        response = client.post("/api/search/batch", json={"queries": ["Python"]})
+        assert response.status_code == 404
+
 
 class TestAskEndpoints:
     @pytest.fixture(autouse=True)
     def setup_service(self):
-        self.service = DocumentService()
+        self.service = document_service
         self.service.clear_index()
         yield
         self.service.clear_index()
@@ -62,5 +158,77 @@ class TestAskEndpoints:
         response = client.post("/api/ask", json=payload)
         assert response.status_code == 422
 
+    def test_ask_batch_keeps_input_order(self):
+        document_service.add_document("python.txt", "Python es un lenguaje de programación interpretado. Python es muy popular para ciencia de datos.")
+        document_service.add_document("sql.txt", "SQL es un lenguaje de consultas para bases de datos relacionales. Las bases de datos guardan información.")
+        document_service.add_document("cocina.txt", "La paella valenciana lleva arroz, azafrán y pollo. Se cocina en una paellera ancha.")
+        document_service.add_document("futbol.txt", "El fútbol se juega con once jugadores por equipo. El arquero puede usar las manos.")
+        document_service.build_index()
+        questions = ["¿Qué es SQL?", "¿Qué es Python?", "¿Quién ganó el mundial?"]
+        response = client.post("/api/ask/batch", json={"questions": questions, "min_score": 0})
+        assert response.status_code == 200
+        answers = response.json()["answers"]
+        assert [answer["question"] for answer in answers] == questions
+        for question, answer in zip(questions, answers):
+            single = client.post("/api/ask", json={"question": question, "min_score": 0}).json()
+            assert answer == single
+
+    def test_ask_batch_validation(self):
+        self.service.add_document("doc.txt", "Python es un lenguaje")
+        self.service.build_index()
+        assert client.post("/api/ask/batch", json={"questions": []}).status_code == 422
+        assert client.post("/api/ask/batch", json={"questions": ["¿Qué?"], "top_k": 0}).status_code == 422
+
+
+class TestIngestEndpoint:
+    @pytest.fixture(autouse=True)
+    def setup_service(self):
+        document_service.clear_index()
+        yield
+        document_service.clear_index()
+
+    def test_ingest_keeps_upload_order(self):
+        files = [
+            ("files", ("c.txt", "Contenido del tercer archivo con suficiente texto.".encode("utf-8"), "text/plain")),
+            ("files", ("a.txt", "Contenido del primer archivo con suficiente texto.".encode("utf-8"), "text/plain")),
+            ("files", ("vacio.txt", b"corto", "text/plain")),
+            ("files", ("b.txt", "Contenido del segundo archivo con suficiente texto.".encode("utf-8"), "text/plain")),
+        ]
+        response = client.post("/api/ingest", files=files)
+        assert response.status_code == 200
+        assert response.json()["files_list"] == ["c.txt", "a.txt", "b.txt"]
+        assert document_service.get_document_names() == ["c.txt", "a.txt", "b.txt"]
+
 
+class TestDocumentEndpoints:
+    @pytest.fixture(autouse=True)
+    def setup_service(self):
+        document_service.clear_index()
+        yield
+        document_service.clear_index()
+
+    def upload(self, filename, content):
+        return {"file": (filename, content.encode("utf-8"), "text/plain")}
+
+    def test_add_replace_and_delete_document(self):
+        response = client.post("/api/documents", files=self.upload("python.txt", "Python es un lenguaje de programación interpretado."))
+        assert response.status_code == 201
+        assert response.json()["documents_count"] == 1
+
+        response = client.post("/api/documents", files=self.upload("python.txt", "Otro contenido para el mismo archivo."))
+        assert response.status_code == 409
+
+        response = client.put("/api/documents", files=self.upload("python.txt", "Python también sirve para automatizar tareas."))
+        assert response.status_code == 200
+        assert "reemplazado" in response.json()["message"]
+
+        response = client.delete("/api/documents/python.txt")
+        assert response.status_code == 200
+        assert response.json()["documents_count"] == 0
+
+        response = client.delete("/api/documents/python.txt")
+        assert response.status_code == 404
 
+    def test_add_document_invalid_format(self):
+        response = client.post("/api/documents", files={"file": ("notas.docx", b"contenido", "application/octet-stream")})
+        assert response.status_code == 400
@@ -0,0 +1,116 @@
+import os
+import pstats
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.document_service import DocumentService, document_service
+from app.services.slow_query_log import SlowQueryLog, SlowQuerySettings
+
+client = TestClient(app)
+
+CORPUS = {
+    "python.txt": "Python es un lenguaje de programación interpretado y muy usado en ciencia de datos.",
+    "sql.txt": "SQL es un lenguaje de consultas para bases de datos relacionales.",
+    "cocina.txt": "La paella valenciana lleva arroz, azafrán, pollo y conejo cocidos a fuego lento.",
+}
+
+
+class TestSlowQueryLog:
+
+    @pytest.fixture(autouse=True)
+    def service(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("SLOW_QUERY_SECONDS", "0")
+        self.service = DocumentService(str(tmp_path / "index"))
+        self.service.reset_index({name: self.service._prepare(text) for name, text in CORPUS.items()})
+        self.log = self.service.slow_query_log
+
+    def test_slow_queries_are_logged_with_stage_breakdown(self):
+        self.service.search("lenguaje de datos", min_score=0.0)
+        self.service.answer_question("¿Qué lleva la paella?")
+
+        search, ask = self.log.recent
+        assert search['kind'] == "search" and ask['kind'] == "ask"
+        assert search['queries'] == [{'text': "lenguaje de datos", 'tokens': 2, 'candidates': 2}]
+        assert {'query_tokenize', 'query_score', 'query_hits', 'other'} <= set(search['stages_ms'])
+        assert 'answer_select' in ask['stages_ms']
+        assert search['profile'] is None
+
+    def test_fast_queries_are_not_logged(self):
+        self.log.update(threshold=60.0)
+        self.service.search("lenguaje de datos", min_score=0.0)
+        self.log.update(threshold=None)
+        self.service.search("lenguaje python", min_score=0.0)
+        assert len(self.log.recent) == 0
+
+    def test_cprofile_dumps_are_rotated(self):
+        self.log.update(profile='cprofile', max_profiles=2)
+        for query in ("lenguaje", "datos", "paella"):
+            self.service.search(query, min_score=0.0)
+
+        profiles = self.log.profiles()
+        assert len(profiles) == 2 and all(name.endswith(".prof") for name in profiles)
+        assert self.log.recent[-1]['profile'].endswith(profiles[-1])
+        stats = pstats.Stats(os.path.join(self.log.directory, profiles[-1]))
+        assert any(name == "top_k_batch" for _, _, name in stats.stats)
+
+    def test_sampling_profile_writes_collapsed_stacks(self):
+        self.log.update(profile='sampling')
+        self.log.sampler.interval = 0.0001
+        self.service.search_batch(["lenguaje de datos"] * 200, min_score=0.0)
+
+        path = self.log.recent[-1]['profile']
+        assert path.endswith(".folded")
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+    def test_settings_reach_other_workers(self):
+        other = SlowQueryLog(self.log.directory, SlowQuerySettings(None))
+        assert other.current_settings().threshold is None
+
+        self.log.update(threshold=2.5, profile='sampling')
+        other._checked_at = float('-inf')
+        assert other.current_settings() == SlowQuerySettings(2.5, 'sampling', 20)
+
+        self.log.reset()
+        other._checked_at = float('-inf')
+        assert other.current_settings() == SlowQuerySettings(None)
+
+    def test_invalid_settings_are_rejected(self):
+        with pytest.raises(ValueError):
+            self.log.update(profile='gprof')
+        with pytest.raises(ValueError):
+            self.log.update(threshold=-1)
+        assert self.log.settings.profile == 'off'
+
+
+class TestAdminEndpoint:
+
+    @pytest.fixture(autouse=True)
+    def admin_token(self, monkeypatch):
+        monkeypatch.setenv("ADMIN_TOKEN", "secreto")
+        yield
+        document_service.slow_query_log.reset()
+
+    def test_requires_configured_token(self, monkeypatch):
+        assert client.get("/api/admin/slow-queries").status_code == 401
+        assert client.get("/api/admin/slow-queries", headers={"X-Admin-Token": "otro"}).status_code == 401
+        monkeypatch.delenv("ADMIN_TOKEN")
+        assert client.get("/api/admin/slow-queries", headers={"X-Admin-Token": "secreto"}).status_code == 403
+
+    def test_toggle_at_runtime(self):
+        headers = {"X-Admin-Token": "secreto"}
+        response = client.put("/api/admin/slow-queries", json={"threshold_seconds": 0.5, "profile": "cprofile"},
+                              headers=headers)
+        assert response.status_code == 200
+        assert response.json()['threshold_seconds'] == 0.5 and response.json()['profile'] == "cprofile"
+
+        response = client.put("/api/admin/slow-queries", json={"threshold_seconds": None}, headers=headers)
+        assert response.json()['threshold_seconds'] is None and response.json()['profile'] == "cprofile"
+
+        assert client.put("/api/admin/slow-queries", json={"profile": "gprof"}, headers=headers).status_code == 422
+
+        response = client.delete("/api/admin/slow-queries", headers=headers)
+        assert response.json()['profile'] == document_service.slow_query_log.defaults.profile
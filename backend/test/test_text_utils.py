@@ -37,3 +37,95 @@ class TestTextUtils:
         text = "a" * 500 + ". Segunda oración."
         result = text_utils.extract_sentences(text)
         assert len(result) <= 300
+
+    def test_prepare_document_returns_chunks_and_tokens(self):
+        text = "Python es un lenguaje de programación.\nSe usa mucho en ciencia de datos y automatización."
+        prepared = text_utils.prepare_document(text, chunk_size=60, overlap=0)
+        cleaned, spans, tokenized = prepared.text, prepared.chunk_spans, prepared.tokenized_chunks
+        assert "\n" not in cleaned
+        assert len(spans) == len(tokenized) > 0
+        chunks = [cleaned.encode('utf-8')[start:end].decode('utf-8') for start, end in spans]
+        assert chunks == text_utils.split_into_chunks(cleaned, chunk_size=60, overlap=0)
+        assert tokenized[0] == text_utils.tokenize(chunks[0])
+
+    def test_prepare_document_returns_sentences_and_terms(self):
+        text = "Hola. Python es un lenguaje de programación. Se usa en ciencia de datos y datos abiertos."
+        prepared = text_utils.prepare_document(text)
+        encoded = prepared.text.encode('utf-8')
+        sentences = [encoded[start:end].decode('utf-8') for start, end in prepared.sentence_spans]
+        assert sentences == ["Hola.", "Python es un lenguaje de programación.", "Se usa en ciencia de datos y datos abiertos."]
+        assert prepared.sentence_terms == [[], ["lenguaje", "programación", "python"], ["abiertos", "ciencia", "datos", "usa"]]
+
+    def test_utf8_spans_convert_character_offsets(self):
+        text = "Año nuevo, canción vieja"
+        spans = [(0, 9), (11, 24)]
+        encoded = text.encode('utf-8')
+        assert [encoded[s:e].decode('utf-8') for s, e in text_utils.utf8_spans(text, spans)] == [text[s:e] for s, e in spans]
+
+    def test_find_chunk_spans_locates_overlapping_chunks(self):
+        text = "Uno dos. Tres cuatro. Cinco."
+        assert text_utils.find_chunk_spans(text, ["Uno dos. Tres cuatro.", "Tres cuatro. Cinco."]) == [(0, 21), (9, 28)]
+        assert text_utils.find_chunk_spans(text, ["no existe"]) is None
+
+
+def legacy_split_into_chunks(text, chunk_size=500, overlap=150):
+    # Implementación anterior, basada en concatenar cadenas y volver a dividir
+    # el chunk previo; se conserva solo como referencia de salida esperada.
+    import re
+    if not text:
+        return []
+    sentence_pattern = re.compile(r'(?<=[.!?])\s+')
+    sentences = sentence_pattern.split(text)
+    chunks = []
+    current_chunk = ""
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(current_chunk) + len(sentence) + 1 > chunk_size:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+            if overlap > 0 and chunks:
+                overlap_sentences = []
+                total = 0
+                for s in reversed(sentence_pattern.split(chunks[-1])):
+                    total += len(s) + 1
+                    overlap_sentences.insert(0, s)
+                    if total >= overlap:
+                        break
+                current_chunk = " ".join(overlap_sentences)
+            else:
+                current_chunk = ""
+        current_chunk = current_chunk + " " + sentence if current_chunk else sentence
+    if current_chunk and len(current_chunk) > 30:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+class TestChunkSpans:
+
+    def random_text(self, rng):
+        words = ["python", "datos", "índice", "búsqueda", "a", "lenguaje", "x" * 120, "oración", "año", "Dr."]
+        parts = []
+        for _ in range(rng.randint(0, 120)):
+            parts.append(rng.choice(words))
+            if rng.random() < 0.2:
+                parts[-1] += rng.choice([".", "!", "?", ".\n", "...", ","])
+        return text_utils.clean_text(" ".join(parts))
+
+    def test_matches_legacy_chunker(self):
+        import random
+        rng = random.Random(1234)
+        for _ in range(300):
+            text = self.random_text(rng)
+            for chunk_size, overlap in ((300, 100), (60, 20), (80, 0), (40, 200)):
+                expected = legacy_split_into_chunks(text, chunk_size=chunk_size, overlap=overlap)
+                assert text_utils.split_into_chunks(text, chunk_size=chunk_size, overlap=overlap) == expected
+
+    def test_spans_slice_the_source_text(self):
+        text = text_utils.clean_text("Primera oración. Segunda oración más larga! ¿Tercera? Cuarta oración final.")
+        spans = list(text_utils.iter_chunk_spans(text, chunk_size=40, overlap=10))
+        assert spans
+        for start, end in spans:
+            assert text[start:end] == text[start:end].strip()
+            assert 0 <= start < end <= len(text)
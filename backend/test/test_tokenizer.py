@@ -0,0 +1,45 @@
+import pickle
+
+from app.utils.tokenizer import STEMMER_VERSION, Tokenizer, default_tokenizer, light_stem
+
+
+class TestTokenizer:
+
+    def test_punctuation_does_not_stick_to_tokens(self):
+        tokens = default_tokenizer.tokenize("Python (lenguaje): interpretado; dinámico, ¿verdad? Auto-completado.")
+        assert tokens == ["python", "lenguaje", "interpretado", "dinámico", "verdad", "auto-completado"]
+
+    def test_spanish_and_english_stopwords_are_removed(self):
+        assert default_tokenizer.tokenize("¿Qué es una base de datos?") == ["base", "datos"]
+        assert default_tokenizer.tokenize("What is the index about") == ["index"]
+
+    def test_short_tokens_are_dropped(self):
+        assert Tokenizer(languages=()).tokenize("el sol y la luna") == ["sol", "luna"]
+
+    def test_light_stem_folds_regular_plurals(self):
+        assert light_stem("canciones") == light_stem("canción") == "cancion"
+        assert light_stem("países") == light_stem("país") == "pais"
+        assert light_stem("pingüinos") == light_stem("pingüino")
+        assert light_stem("ciudades") == "ciudad"
+        assert light_stem("datos") == "dato"
+        assert light_stem("lenguajes") == "lenguaje"
+        assert light_stem("análisis") == "analisis"
+
+    def test_stemming_is_optional(self):
+        stemming = Tokenizer(stem=True)
+        assert stemming.tokenize("Bases de datos relacionales") == ["base", "dato", "relacional"]
+        assert default_tokenizer.tokenize("Bases de datos relacionales") == ["bases", "datos", "relacionales"]
+        assert stemming.config() != default_tokenizer.config()
+        assert stemming.config()['stemmer'] == STEMMER_VERSION
+
+    def test_config_changes_with_stopwords_of_same_size(self):
+        edited = default_tokenizer.stopwords - {"para"} | {"paraguas"}
+        assert len(edited) == len(default_tokenizer.stopwords)
+        assert Tokenizer(stopwords=edited).config() != default_tokenizer.config()
+        assert Tokenizer(stopwords=frozenset(default_tokenizer.stopwords)).config() == default_tokenizer.config()
+
+    def test_tokenizer_survives_pickle(self):
+        stemming = Tokenizer(stem=True)
+        restored = pickle.loads(pickle.dumps(stemming))
+        assert restored.config() == stemming.config()
+        assert restored.tokenize("Ciudades grandes") == ["ciudad", "grande"]